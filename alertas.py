@@ -0,0 +1,196 @@
+"""
+Almacén de alertas en memoria (buffer circular con índices secundarios)
+y difusión de alertas nuevas a clientes conectados
+"""
+
+import asyncio
+from collections import deque
+from typing import Dict, List, Optional, Set, Tuple
+
+from ciudades import normalizar_nombre
+
+# La empresa no se indexa: se filtra por contenido (ver cumple_filtros)
+CAMPOS_INDICE = ("nivel", "tipo", "origen", "destino", "fecha")
+
+
+def valor_indice(campo: str, valor) -> str:
+    if campo in ("origen", "destino", "empresa"):
+        return normalizar_nombre(str(valor))
+    return str(valor).upper() if campo in ("nivel", "tipo") else str(valor)
+
+
+def normalizar_filtros(filtros: Dict[str, Optional[str]]) -> Dict[str, str]:
+    return {campo: valor_indice(campo, valor) for campo, valor in filtros.items() if valor is not None}
+
+
+def cumple_filtros(filtros: Dict[str, str], alerta: Dict) -> bool:
+    """`filtros` ya normalizados con normalizar_filtros"""
+    for campo, valor in filtros.items():
+        actual = valor_indice(campo, alerta.get(campo))
+        # La empresa se filtra por contenido, igual que en /buscar ("ochoa" -> "Rápido Ochoa")
+        if (valor not in actual) if campo == "empresa" else (actual != valor):
+            return False
+    return True
+
+
+class AlmacenAlertas:
+    """Guarda las últimas `capacidad` alertas; las más viejas se sobrescriben.
+
+    Cada alerta recibe un id creciente que sirve de cursor. Los índices guardan
+    ids por valor de campo y se depuran al usarse, así una consulta filtrada
+    solo recorre las alertas que cumplen el filtro más selectivo.
+    """
+
+    def __init__(self, capacidad: int):
+        self.capacidad = capacidad
+        self.buffer: List[Optional[Dict]] = [None] * capacidad
+        self.siguiente_id = 1
+        self.primer_id = 1
+        self.indices: Dict[str, Dict[str, deque]] = {campo: {} for campo in CAMPOS_INDICE}
+        self.insertadas_desde_depuracion = 0
+
+    def __len__(self):
+        return self.siguiente_id - self.primer_id
+
+    def agregar(self, alerta: Dict) -> Dict:
+        alerta_id = self.siguiente_id
+        self.siguiente_id += 1
+        alerta["id"] = alerta_id
+        self.buffer[alerta_id % self.capacidad] = alerta
+        self.primer_id = max(self.primer_id, alerta_id - self.capacidad + 1)
+
+        for campo in CAMPOS_INDICE:
+            if alerta.get(campo) is None:
+                continue
+            ids = self.indices[campo].setdefault(valor_indice(campo, alerta[campo]), deque())
+            ids.append(alerta_id)
+            while ids[0] < self.primer_id:
+                ids.popleft()
+
+        self.insertadas_desde_depuracion += 1
+        if self.insertadas_desde_depuracion >= self.capacidad:
+            self.depurar_indices()
+        return alerta
+
+    def depurar_indices(self):
+        """Quita ids sobrescritos de todos los índices y borra los valores vacíos"""
+        for valores in self.indices.values():
+            for valor in list(valores):
+                ids = valores[valor]
+                while ids and ids[0] < self.primer_id:
+                    ids.popleft()
+                if not ids:
+                    del valores[valor]
+        self.insertadas_desde_depuracion = 0
+
+    def _ids_candidatos(self, filtros: Dict[str, str]):
+        """Ids (del más nuevo al más viejo) del índice más pequeño entre los filtros indexados"""
+        listas = []
+        for campo, valor in filtros.items():
+            if campo not in self.indices:
+                continue
+            ids = self.indices[campo].get(valor)
+            if not ids:
+                return []
+            listas.append(ids)
+        if not listas:
+            return range(self.siguiente_id - 1, self.primer_id - 1, -1)
+        return reversed(min(listas, key=len))
+
+    def consultar(self, filtros: Optional[Dict[str, str]] = None, limite: int = 50,
+                  antes_de: Optional[int] = None) -> Tuple[List[Dict], Optional[int]]:
+        """Página de alertas más recientes que cumplen los filtros, en orden cronológico.
+
+        Devuelve también el cursor para la página anterior (None si no hay más).
+        """
+        normalizados = normalizar_filtros(filtros or {})
+        tope = self.siguiente_id if antes_de is None else min(antes_de, self.siguiente_id)
+
+        pagina = []
+        hay_mas = False
+        for alerta_id in self._ids_candidatos(normalizados):
+            if alerta_id >= tope:
+                continue
+            if alerta_id < self.primer_id:
+                break
+            alerta = self.buffer[alerta_id % self.capacidad]
+            if not cumple_filtros(normalizados, alerta):
+                continue
+            if len(pagina) == limite:
+                hay_mas = True
+                break
+            pagina.append(alerta)
+
+        pagina.reverse()
+        cursor = pagina[0]["id"] if hay_mas and pagina else None
+        return pagina, cursor
+
+    def desde(self, ultimo_id: int) -> List[Dict]:
+        """Alertas con id mayor a `ultimo_id` que siguen en el buffer"""
+        inicio = max(ultimo_id + 1, self.primer_id)
+        return [self.buffer[alerta_id % self.capacidad] for alerta_id in range(inicio, self.siguiente_id)]
+
+    def restaurar(self, alertas: List[Dict]):
+        """Carga alertas guardadas conservando sus ids (deben venir en orden)"""
+        alertas = alertas[-self.capacidad:]
+        if not alertas:
+            return
+        self.limpiar()
+        self.siguiente_id = self.primer_id = alertas[0]["id"]
+        for alerta in alertas:
+            self.siguiente_id = alerta["id"]
+            self.agregar(alerta)
+
+    def limpiar(self):
+        # Los ids siguen creciendo para que los cursores viejos no apunten a alertas nuevas
+        self.buffer = [None] * self.capacidad
+        self.primer_id = self.siguiente_id
+        self.indices = {campo: {} for campo in CAMPOS_INDICE}
+        self.insertadas_desde_depuracion = 0
+
+
+class SuscriptorAlertas:
+    """Cliente conectado al stream de alertas, con su propia cola acotada"""
+
+    def __init__(self, filtros: Dict[str, str], tamano_cola: int):
+        self.filtros = normalizar_filtros(filtros)
+        self.cola: asyncio.Queue = asyncio.Queue(maxsize=tamano_cola)
+        self.descartado = False
+
+    def acepta(self, alerta: Dict) -> bool:
+        return cumple_filtros(self.filtros, alerta)
+
+
+class DifusorAlertas:
+    """Reparte cada alerta nueva a los suscriptores sin bloquear a quien la publica.
+
+    Si la cola de un suscriptor se llena (cliente lento), se le desconecta en
+    lugar de frenar el ciclo de monitoreo.
+    """
+
+    def __init__(self, tamano_cola: int):
+        self.tamano_cola = tamano_cola
+        self.suscriptores: Set[SuscriptorAlertas] = set()
+        self.descartados = 0
+
+    def __len__(self):
+        return len(self.suscriptores)
+
+    def suscribir(self, filtros: Dict[str, str]) -> SuscriptorAlertas:
+        suscriptor = SuscriptorAlertas(filtros, self.tamano_cola)
+        self.suscriptores.add(suscriptor)
+        return suscriptor
+
+    def desuscribir(self, suscriptor: SuscriptorAlertas):
+        self.suscriptores.discard(suscriptor)
+
+    def publicar(self, alerta: Dict):
+        for suscriptor in list(self.suscriptores):
+            if not suscriptor.acepta(alerta):
+                continue
+            try:
+                suscriptor.cola.put_nowait(alerta)
+            except asyncio.QueueFull:
+                suscriptor.descartado = True
+                self.suscriptores.discard(suscriptor)
+                self.descartados += 1
@@ -0,0 +1,251 @@
+"""
+Prueba de carga de la API contra el RedBus falso (sin red)
+
+Levanta main.app y fake_redbus en el mismo proceso con httpx.ASGITransport
+y reporta throughput y latencias p50/p95/p99 por escenario y concurrencia.
+
+Ejemplos:
+    python benchmark.py
+    python benchmark.py --concurrencias 1 10 50 --peticiones 200 --sin-cache
+    python benchmark.py --redbus-url http://localhost:9000   # fake_redbus.py aparte
+    python benchmark.py --serializacion --buses 500          # JSON y compresión de una respuesta
+    python benchmark.py --filtros --buses 500                # filtros de /buscar-avanzado sobre el snapshot
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, List
+
+import httpx
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+import main
+import respuestas
+from ciudades import CIUDADES_REDBUS
+from config import CONFIG_LOGS, CONFIG_UPSTREAM
+from fake_redbus import ConfigFalsa, crear_app_falsa, generar_inventario
+from snapshot import SnapshotResultados, hora_a_segundos, parsear_campos
+from upstream import ClienteRedBus
+
+
+def percentil(valores: List[float], p: float) -> float:
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, max(0, int(round(p / 100 * len(ordenados) + 0.5)) - 1))
+    return ordenados[indice]
+
+
+async def medir(nombre: str, concurrencia: int, peticiones: int, accion: Callable[[int], Awaitable[bool]]) -> str:
+    latencias = []
+    errores = 0
+    siguiente = iter(range(peticiones))
+
+    async def trabajador():
+        nonlocal errores
+        for numero in siguiente:
+            inicio = time.perf_counter()
+            try:
+                ok = await accion(numero)
+            except Exception:
+                ok = False
+            latencias.append(time.perf_counter() - inicio)
+            errores += not ok
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*[trabajador() for _ in range(concurrencia)])
+    total = time.perf_counter() - inicio
+
+    return (f"{nombre:<22} {concurrencia:>6} {peticiones:>6} {peticiones / total:>9.1f} "
+            f"{percentil(latencias, 50) * 1000:>9.1f} {percentil(latencias, 95) * 1000:>9.1f} "
+            f"{percentil(latencias, 99) * 1000:>9.1f} {errores:>7}")
+
+
+def tiempo_promedio(funcion: Callable[[], object], repeticiones: int) -> float:
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        funcion()
+    return (time.perf_counter() - inicio) / repeticiones
+
+
+def comparar_serializacion(args):
+    """Costo de serializar y comprimir una respuesta de /buscar con `--buses` buses"""
+    inventario = generar_inventario("195160", "195176", "23-Nov-2030", args.buses)
+    crudo = json.dumps({"inventories": inventario}).encode()
+    buses = main.normalizar_resultados_redbus({"inventories": inventario})
+    respuesta = {"exito": True, "fecha": "2030-11-23", "total_buses": len(buses), "horarios": buses}
+    repeticiones = args.repeticiones
+
+    def fastapi_por_defecto():
+        return JSONResponse(jsonable_encoder(respuesta)).body
+
+    cuerpo = fastapi_por_defecto()
+    filas = [
+        ("jsonable_encoder + json", tiempo_promedio(fastapi_por_defecto, repeticiones), len(cuerpo)),
+        (f"RespuestaJSON ({'orjson' if respuestas.orjson else 'json'})",
+         tiempo_promedio(lambda: respuestas.RespuestaJSON(respuesta).body, repeticiones), len(respuestas.RespuestaJSON(respuesta).body)),
+        ("parseo json.loads", tiempo_promedio(lambda: json.loads(crudo), repeticiones), len(crudo)),
+        (f"parseo cargar_json ({'orjson' if respuestas.orjson else 'json'})",
+         tiempo_promedio(lambda: respuestas.cargar_json(crudo), repeticiones), len(crudo)),
+    ]
+    snapshot = SnapshotResultados(buses)
+    campos = parsear_campos(args.campos)
+
+    def con_campos():
+        filas = snapshot.filas(snapshot.seleccionar("hora"), campos)
+        return respuestas.RespuestaJSON({**respuesta, "horarios": filas}).body
+
+    filas.append((f"campos={len(campos)} + RespuestaJSON", tiempo_promedio(con_campos, repeticiones), len(con_campos())))
+    compresor = respuestas.MiddlewareCompresion(None)
+    for codificacion in ("gzip", "br") if respuestas.brotli else ("gzip",):
+        comprimido = compresor.comprimir(cuerpo, codificacion)
+        filas.append((f"compresión {codificacion}",
+                      tiempo_promedio(lambda: compresor.comprimir(cuerpo, codificacion), repeticiones), len(comprimido)))
+
+    print(f"Respuesta de /buscar con {len(buses)} buses, promedio de {repeticiones} repeticiones")
+    print(f"{'paso':<32} {'ms':>8} {'bytes':>10}")
+    for nombre, segundos, tamano in filas:
+        print(f"{nombre:<32} {segundos * 1000:>8.2f} {tamano:>10}")
+
+
+def filtrar_por_fila(snapshot: SnapshotResultados, empresa: str, precio_max: float, hora_min: str,
+                     asientos_min: int, rating_min: float) -> List[int]:
+    """Referencia: una condición por filtro evaluada bus por bus (como antes de las máscaras)"""
+    desde = hora_a_segundos(hora_min)
+    condiciones = [
+        lambda i: empresa in snapshot.empresa[i],
+        lambda i: snapshot.precio_total[i] <= precio_max,
+        lambda i: snapshot.salida[i] >= desde,
+        lambda i: snapshot.asientos[i] >= asientos_min,
+        snapshot.es_ac.__getitem__,
+        lambda i: snapshot.rating[i] >= rating_min,
+    ]
+    return [i for i in snapshot.orden("precio") if all(condicion(i) for condicion in condiciones)]
+
+
+def comparar_filtros(args):
+    """Costo de SnapshotResultados.seleccionar con seis filtros frente a evaluarlos bus por bus"""
+    buses = main.normalizar_resultados_redbus({"inventories": generar_inventario("195160", "195176", "23-Nov-2030", args.buses)})
+    snapshot = SnapshotResultados(buses)
+    filtros = {"empresa": "o", "precio_max": 200000, "hora_min": "06:00", "asientos_min": 1, "rating_min": 1.0}
+    por_fila = filtrar_por_fila(snapshot, **filtros)
+    con_mascaras = snapshot.seleccionar("precio", solo_ac=True, **filtros)
+    assert por_fila == con_mascaras
+    filas = [
+        ("condición por bus", tiempo_promedio(lambda: filtrar_por_fila(snapshot, **filtros), args.repeticiones)),
+        ("máscaras por columna", tiempo_promedio(lambda: snapshot.seleccionar("precio", solo_ac=True, **filtros),
+                                                 args.repeticiones)),
+    ]
+    print(f"Seis filtros sobre {len(buses)} buses ({len(con_mascaras)} pasan), promedio de {args.repeticiones} repeticiones")
+    print(f"{'método':<24} {'µs':>10}")
+    for nombre, segundos in filas:
+        print(f"{nombre:<24} {segundos * 1e6:>10.1f}")
+
+
+async def ejecutar(args):
+    if args.redbus_url:
+        main.CONFIG_REDBUS["url_base"] = args.redbus_url
+        falsa = None
+    else:
+        falsa = ConfigFalsa(args.buses, args.latencia_ms, args.jitter_ms, args.tasa_error)
+        await main.upstream.cerrar()
+        main.upstream = ClienteRedBus(CONFIG_UPSTREAM, transport=httpx.ASGITransport(app=crear_app_falsa(falsa)))
+    main.persistencia.habilitada = False
+    if not args.con_limite:
+        main.upstream.limitador.tasa = 0
+    if not args.mostrar_logs:
+        for nombre in ["buscador", *CONFIG_LOGS["niveles"]]:
+            logging.getLogger(nombre).setLevel(logging.WARNING)
+    if args.sin_cache:
+        main.cache_busquedas.ttl = 0
+        main.CONFIG_CACHE["gracia_segundos"] = 0
+
+    api = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://buscador", timeout=60.0)
+    azar = random.Random(7)
+    ciudades = list(CIUDADES_REDBUS)
+    hoy = datetime.now()
+    rutas = [(azar.choice(ciudades), azar.choice(ciudades), (hoy + timedelta(days=azar.randint(1, 30))).strftime("%Y-%m-%d"))
+             for _ in range(args.rutas)]
+
+    async def buscar(numero: int) -> bool:
+        origen, destino, fecha = rutas[numero % len(rutas)]
+        respuesta = await api.get("/buscar", params={"origen": origen, "destino": destino, "fecha": fecha})
+        return respuesta.status_code == 200
+
+    async def buscar_avanzado(numero: int) -> bool:
+        origen, destino, fecha = rutas[numero % len(rutas)]
+        respuesta = await api.get("/buscar-avanzado", params={
+            "origen": origen, "destino": destino, "fecha": fecha,
+            "precio_max": 180000, "hora_min": "06:00", "solo_ac": "true", "ordenar_por": "precio"
+        })
+        return respuesta.status_code == 200
+
+    async def ciclo_monitores(numero: int) -> bool:
+        main.rutas_monitoreadas.clear()
+        for i in range(args.monitores):
+            origen, destino, fecha = rutas[(numero + i) % len(rutas)]
+            monitor = main.MonitorRuta(origen, destino, fecha, None, "ochoa" if i % 2 else None)
+            main.rutas_monitoreadas[monitor.id] = monitor
+        await main.ejecutar_ciclo_monitores()
+        return True
+
+    print(f"RedBus: {args.redbus_url or f'falso en proceso ({args.buses} buses, {args.latencia_ms} ms)'}, "
+          f"cache: {'no' if args.sin_cache else 'sí'}, rutas distintas: {args.rutas}")
+    print(f"{'escenario':<22} {'conc':>6} {'pets':>6} {'pets/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errores':>7}")
+
+    salida = io.StringIO() if not args.mostrar_logs else None
+    for concurrencia in args.concurrencias:
+        for nombre, accion, peticiones in (
+            ("/buscar", buscar, args.peticiones),
+            ("/buscar-avanzado", buscar_avanzado, args.peticiones),
+            (f"monitores x{args.monitores}", ciclo_monitores, max(1, args.peticiones // 20)),
+        ):
+            main.cache_busquedas.limpiar()
+            with contextlib.redirect_stdout(salida) if salida else contextlib.nullcontext():
+                # Los ciclos de monitoreo no se solapan: siempre de a uno
+                fila = await medir(nombre, concurrencia if accion is not ciclo_monitores else 1, peticiones, accion)
+            print(fila)
+            if salida:
+                salida.seek(0)
+                salida.truncate()
+
+    if falsa:
+        print(f"Peticiones al RedBus falso: {falsa.peticiones}")
+    await api.aclose()
+    await main.upstream.cerrar()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prueba de carga contra RedBus falso")
+    parser.add_argument("--concurrencias", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--peticiones", type=int, default=200, help="Peticiones por escenario y concurrencia")
+    parser.add_argument("--rutas", type=int, default=40, help="Rutas/fechas distintas entre las que se reparten las peticiones")
+    parser.add_argument("--monitores", type=int, default=200)
+    parser.add_argument("--buses", type=int, default=250)
+    parser.add_argument("--latencia-ms", type=float, default=50)
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--tasa-error", type=float, default=0.0)
+    parser.add_argument("--sin-cache", action="store_true", help="TTL 0: cada petición consulta RedBus")
+    parser.add_argument("--con-limite", action="store_true", help="Aplicar el límite de peticiones/s a RedBus de config.py")
+    parser.add_argument("--redbus-url", help="Usar un fake_redbus.py externo en vez del de proceso")
+    parser.add_argument("--mostrar-logs", action="store_true")
+    parser.add_argument("--serializacion", action="store_true", help="Solo medir serialización y compresión de una respuesta")
+    parser.add_argument("--filtros", action="store_true", help="Solo medir los filtros de /buscar-avanzado sobre un snapshot")
+    parser.add_argument("--repeticiones", type=int, default=50, help="Repeticiones por paso con --serializacion o --filtros")
+    parser.add_argument("--campos", default="empresa,tipo_bus,hora_salida,hora_llegada,precio_total,asientos_disponibles",
+                        help="Campos pedidos con `campos=` al comparar con --serializacion")
+    args = parser.parse_args()
+    if args.serializacion:
+        comparar_serializacion(args)
+    elif args.filtros:
+        comparar_filtros(args)
+    else:
+        asyncio.run(ejecutar(args))
@@ -0,0 +1,132 @@
+"""
+Cache en memoria para resultados de búsqueda (TTL + LRU + single-flight + stale-while-revalidate)
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+
+class CacheBusquedas:
+    """Guarda resultados por clave durante `ttl` segundos y descarta los menos usados.
+
+    Si varias peticiones piden la misma clave mientras se está cargando,
+    solo se ejecuta una carga y el resto espera su resultado. Con `gracia`,
+    una entrada vencida hace menos de `gracia` segundos se devuelve al
+    instante mientras una sola carga en segundo plano la reemplaza.
+    """
+
+    def __init__(self, ttl: float, max_entradas: int):
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self.entradas: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.en_vuelo: Dict[Hashable, asyncio.Task] = {}
+        self.aciertos = 0
+        self.fallos = 0
+        self.coalescidas = 0
+        self.desactualizadas = 0
+
+    def __len__(self):
+        return len(self.entradas)
+
+    def obtener_fresco(self, clave: Hashable):
+        entrada = self.entradas.get(clave)
+        if entrada is None:
+            return None
+        guardado_en, valor = entrada
+        if time.monotonic() - guardado_en >= self.ttl:
+            # Vencida se conserva (hasta que el LRU la descarte) por si RedBus no responde
+            return None
+        self.entradas.move_to_end(clave)
+        return valor
+
+    def edad(self, clave: Hashable):
+        """Segundos desde que se guardó la clave; None si no está"""
+        entrada = self.entradas.get(clave)
+        return time.monotonic() - entrada[0] if entrada else None
+
+    def obtener_vencido(self, clave: Hashable):
+        """Último valor guardado sin importar el TTL; para cuando RedBus no está disponible"""
+        entrada = self.entradas.get(clave)
+        return entrada[1] if entrada else None
+
+    def guardar(self, clave: Hashable, valor: Any):
+        self.entradas[clave] = (time.monotonic(), valor)
+        self.entradas.move_to_end(clave)
+        while len(self.entradas) > self.max_entradas:
+            self.entradas.popitem(last=False)
+
+    def limpiar(self):
+        self.entradas.clear()
+
+    async def obtener(self, clave: Hashable, cargar: Callable[[], Awaitable[Any]],
+                      guardar_si: Callable[[Any], bool] = lambda valor: True,
+                      gracia: float = 0, max_edad: Optional[float] = None):
+        """Valor de la cache o el resultado de `cargar`.
+
+        `max_edad` no acepta entradas guardadas hace más de esos segundos,
+        ni siquiera en gracia.
+        """
+        entrada = self.entradas.get(clave)
+        if entrada is not None:
+            guardado_en, valor = entrada
+            edad = time.monotonic() - guardado_en
+            if max_edad is None or edad <= max_edad:
+                if edad < self.ttl:
+                    self.entradas.move_to_end(clave)
+                    self.aciertos += 1
+                    return valor
+                if edad < self.ttl + gracia:
+                    self.entradas.move_to_end(clave)
+                    self.desactualizadas += 1
+                    if clave not in self.en_vuelo:
+                        self._iniciar_carga(clave, cargar, guardar_si)
+                    return valor
+
+        tarea = self.en_vuelo.get(clave)
+        if tarea is None:
+            self.fallos += 1
+            tarea = self._iniciar_carga(clave, cargar, guardar_si)
+        else:
+            self.coalescidas += 1
+        # shield: si un cliente cancela, la carga compartida sigue para los demás
+        return await asyncio.shield(tarea)
+
+    async def refrescar(self, clave: Hashable, cargar: Callable[[], Awaitable[Any]],
+                        guardar_si: Callable[[Any], bool] = lambda valor: True):
+        """Vuelve a cargar `clave` ignorando lo guardado (o se suma a la carga en curso).
+
+        Es para precargas: no cuenta como acierto ni fallo, así las estadísticas
+        solo reflejan las búsquedas de los usuarios.
+        """
+        tarea = self.en_vuelo.get(clave) or self._iniciar_carga(clave, cargar, guardar_si)
+        return await asyncio.shield(tarea)
+
+    def _iniciar_carga(self, clave, cargar, guardar_si) -> asyncio.Task:
+        tarea = asyncio.ensure_future(self._cargar(clave, cargar, guardar_si))
+        # Un refresco en segundo plano puede fallar sin que nadie espere su resultado
+        tarea.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self.en_vuelo[clave] = tarea
+        return tarea
+
+    async def _cargar(self, clave, cargar, guardar_si):
+        try:
+            valor = await cargar()
+            if guardar_si(valor):
+                self.guardar(clave, valor)
+            return valor
+        finally:
+            self.en_vuelo.pop(clave, None)
+
+    def estadisticas(self) -> Dict:
+        return {
+            "entradas": len(self.entradas),
+            "max_entradas": self.max_entradas,
+            "ttl_segundos": self.ttl,
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "coalescidas": self.coalescidas,
+            "desactualizadas": self.desactualizadas,
+            "en_vuelo": len(self.en_vuelo),
+        }
@@ -0,0 +1,300 @@
+"""
+Catálogo de ciudades, índice de búsqueda (prefijos + tolerancia a errores)
+y cache persistente de resultados de SolarSearch
+"""
+
+import json
+import logging
+import os
+import re
+import time
+import unicodedata
+from typing import Dict, List, Optional
+
+log = logging.getLogger("buscador.ciudades")
+
+CIUDADES_REDBUS = {
+    "medellin": {"id": "195160", "name": "Medellin (Ant) (Todos)"},
+    "caucasia": {"id": "195150", "name": "Caucasia (Ant) (Todos)"},
+    "jardin": {"id": "195158", "name": "Jardin (Ant) (Todos)"},
+    "arboletes": {"id": "195102", "name": "Arboletes (Ant) (Todos)"},
+    "urrao": {"id": "195175", "name": "Urrao (Ant) (Todos)"},
+    "ciudad bolivar": {"id": "195153", "name": "Ciudad Bolivar (Ant) (Todos)"},
+    "puerto berrio": {"id": "196351", "name": "Puerto Berrio (Ant) (Todos)"},
+    "rionegro": {"id": "202962", "name": "Rionegro (Ant) (Todos)"},
+    "marinilla": {"id": "202962", "name": "Rionegro (Ant) (Todos)"},
+    "betulia": {"id": "195489", "name": "Betulia (Ant) (Todos)"},
+    "andes": {"id": "195488", "name": "Andes (Ant) (Todos)"},
+    "giraldo": {"id": "195157", "name": "Giraldo (Ant) (Todos)"},
+    "yarumal": {"id": "195545", "name": "Yarumal (Ant) (Todos)"},
+    "bolombolo": {"id": "195490", "name": "Bolombolo (Ant) (Todos)"},
+    "concordia": {"id": "195500", "name": "Concordia (Ant) (Todos)"},
+    "taraza": {"id": "195540", "name": "Taraza (Ant) (Todos)"},
+    "caicedo": {"id": "195491", "name": "Caicedo (Ant) (Todos)"},
+    "santa rosa de osos": {"id": "195816", "name": "Santa Rosa De Osos (Ant) (Todos)"},
+    "monteria": {"id": "195200", "name": "Monteria (Cor) (Todos)"},
+    "planeta rica": {"id": "195548", "name": "Planeta Rica (Cor) (Todos)"},
+    "lorica": {"id": "194924", "name": "Lorica (Cor) (Todos)"},
+    "cerete": {"id": "196158", "name": "Cerete (Cor) (Todos)"},
+    "la apartada": {"id": "195547", "name": "La Apartada (Cor) (Todos)"},
+    "chinu": {"id": "195541", "name": "Chinu (Cor) (Todos)"},
+    "san antero": {"id": "196364", "name": "San Antero (Cor) (Todos)"},
+    "sahagun": {"id": "195550", "name": "Sahagun (Cor) (Todos)"},
+    "sincelejo": {"id": "195243", "name": "Sincelejo (Suc) (Todos)"},
+    "covenas": {"id": "196179", "name": "Covenas (Suc) (Todos)"},
+    "san marcos": {"id": "195565", "name": "San Marcos (Suc) (Todos)"},
+    "tolu": {"id": "196394", "name": "Tolu (Suc) (Todos)"},
+    "barranquilla": {"id": "195179", "name": "Barranquilla (Atl) (Todos)"},
+    "quibdo": {"id": "195175", "name": "Quibdo (Cho) (Todos)"},
+    "istmina": {"id": "196805", "name": "Istmina (Cho) (Todos)"},
+    "condoto": {"id": "195199", "name": "Condoto (Cho) (Todos)"},
+    "tutunendo": {"id": "195531", "name": "Tutunendo (Cho) (Todos)"},
+    "santa marta": {"id": "195215", "name": "Santa Marta (Mag) (Todos)"},
+    "santamarta": {"id": "195215", "name": "Santa Marta (Mag) (Todos)"},
+    "cienaga": {"id": "195553", "name": "Cienaga (Mag) (Todos)"},
+    "palomino": {"id": "196333", "name": "Palomino (Guaj) (Todos)"},
+    "maicao": {"id": "195205", "name": "Maicao (Guaj) (Todos)"},
+    "riohacha": {"id": "195204", "name": "Riohacha (Guaj) (Todos)"},
+    "la dorada": {"id": "195187", "name": "La Dorada (Cal) (Todos)"},
+    "cartagena": {"id": "195181", "name": "Cartagena (Bol) (Todos)"},
+    "magangue": {"id": "196300", "name": "Magangue (Bol) (Todos)"},
+    "san onofre": {"id": "195566", "name": "San Onofre (Suc) (Todos)"},
+    "carmen de bolivar": {"id": "195800", "name": "Carmen De Bolivar (Bol) (Todos)"},
+    "mompox": {"id": "195833", "name": "Mompox (Bol) (Todos)"},
+    "bogota": {"id": "195201", "name": "Bogota (D.C) (Todos)"},
+}
+
+CATALOGO_CIUDADES = [
+    {"nombre": "Medellín", "departamento": "Antioquia", "slug": "medellin"},
+    {"nombre": "Caucasia", "departamento": "Antioquia", "slug": "caucasia"},
+    {"nombre": "Jardín", "departamento": "Antioquia", "slug": "jardin"},
+    {"nombre": "Arboletes", "departamento": "Antioquia", "slug": "arboletes"},
+    {"nombre": "Urrao", "departamento": "Antioquia", "slug": "urrao"},
+    {"nombre": "Ciudad Bolívar", "departamento": "Antioquia", "slug": "ciudad bolivar"},
+    {"nombre": "Puerto Berrío", "departamento": "Antioquia", "slug": "puerto berrio"},
+    {"nombre": "Rionegro - Marinilla", "departamento": "Antioquia", "slug": "rionegro"},
+    {"nombre": "Betulia", "departamento": "Antioquia", "slug": "betulia"},
+    {"nombre": "Andes", "departamento": "Antioquia", "slug": "andes"},
+    {"nombre": "Giraldo", "departamento": "Antioquia", "slug": "giraldo"},
+    {"nombre": "Yarumal", "departamento": "Antioquia", "slug": "yarumal"},
+    {"nombre": "Bolombolo", "departamento": "Antioquia", "slug": "bolombolo"},
+    {"nombre": "Concordia", "departamento": "Antioquia", "slug": "concordia"},
+    {"nombre": "Tarazá", "departamento": "Antioquia", "slug": "taraza"},
+    {"nombre": "Caicedo", "departamento": "Antioquia", "slug": "caicedo"},
+    {"nombre": "Barranquilla", "departamento": "Atlántico", "slug": "barranquilla"},
+    {"nombre": "Cartagena", "departamento": "Bolívar", "slug": "cartagena"},
+    {"nombre": "Magangué", "departamento": "Bolívar", "slug": "magangue"},
+    {"nombre": "San Onofre", "departamento": "Bolívar", "slug": "san onofre"},
+    {"nombre": "Carmen de Bolívar", "departamento": "Bolívar", "slug": "carmen de bolivar"},
+    {"nombre": "Mompox", "departamento": "Bolívar", "slug": "mompox"},
+    {"nombre": "La Dorada", "departamento": "Caldas", "slug": "la dorada"},
+    {"nombre": "Quibdó", "departamento": "Chocó", "slug": "quibdo"},
+    {"nombre": "Istmina", "departamento": "Chocó", "slug": "istmina"},
+    {"nombre": "Condoto", "departamento": "Chocó", "slug": "condoto"},
+    {"nombre": "Tutunendo", "departamento": "Chocó", "slug": "tutunendo"},
+    {"nombre": "Montería", "departamento": "Córdoba", "slug": "monteria"},
+    {"nombre": "Planeta Rica", "departamento": "Córdoba", "slug": "planeta rica"},
+    {"nombre": "Lorica", "departamento": "Córdoba", "slug": "lorica"},
+    {"nombre": "Cereté", "departamento": "Córdoba", "slug": "cerete"},
+    {"nombre": "La Apartada", "departamento": "Córdoba", "slug": "la apartada"},
+    {"nombre": "Chinú", "departamento": "Córdoba", "slug": "chinu"},
+    {"nombre": "San Antero", "departamento": "Córdoba", "slug": "san antero"},
+    {"nombre": "Bogotá", "departamento": "Cundinamarca", "slug": "bogota"},
+    {"nombre": "Maicao", "departamento": "La Guajira", "slug": "maicao"},
+    {"nombre": "Riohacha", "departamento": "La Guajira", "slug": "riohacha"},
+    {"nombre": "Santa Marta", "departamento": "Magdalena", "slug": "santa marta"},
+    {"nombre": "Ciénaga", "departamento": "Magdalena", "slug": "cienaga"},
+    {"nombre": "Sincelejo", "departamento": "Sucre", "slug": "sincelejo"},
+    {"nombre": "Coveñas", "departamento": "Sucre", "slug": "covenas"},
+    {"nombre": "San Marcos", "departamento": "Sucre", "slug": "san marcos"},
+    {"nombre": "Tolú", "departamento": "Sucre", "slug": "tolu"},
+    {"nombre": "Sahagún", "departamento": "Sucre", "slug": "sahagun"},
+]
+
+ABREVIATURAS = {
+    "sta": "santa",
+    "sto": "santo",
+    "sn": "san",
+    "pto": "puerto",
+    "cdad": "ciudad",
+    "cd": "ciudad",
+}
+
+
+def normalizar_nombre(texto: str) -> str:
+    """'  Sta. Marta ' -> 'santa marta'; quita tildes, signos y espacios repetidos"""
+    texto = unicodedata.normalize("NFKD", texto or "")
+    texto = "".join(c for c in texto if not unicodedata.combining(c)).lower()
+    palabras = re.sub(r"[^a-z0-9]+", " ", texto).split()
+    return " ".join(ABREVIATURAS.get(p, p) for p in palabras)
+
+
+def distancia_edicion(a: str, b: str, maximo: int) -> int:
+    """Levenshtein que abandona apenas supera `maximo` (devuelve maximo + 1)"""
+    if abs(len(a) - len(b)) > maximo:
+        return maximo + 1
+    anterior = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        actual = [i]
+        for j, cb in enumerate(b, 1):
+            actual.append(min(anterior[j] + 1, actual[j - 1] + 1, anterior[j - 1] + (ca != cb)))
+        if min(actual) > maximo:
+            return maximo + 1
+        anterior = actual
+    return anterior[-1]
+
+
+class IndiceCiudades:
+    """Índice en memoria de las ciudades conocidas, construido una sola vez.
+
+    Cada nombre se indexa en un trie desde el inicio y desde cada palabra,
+    así 'barranq' y 'marta' encuentran su ciudad sin recorrer la lista.
+    """
+
+    def __init__(self, ciudades: Dict[str, Dict], catalogo: List[Dict]):
+        self.ciudades = ciudades
+        self.exactos: Dict[str, str] = {}
+        self.nombres: Dict[str, str] = {}
+        self.trie: Dict = {}
+
+        for slug in ciudades:
+            self._agregar(slug, slug)
+        for ciudad in catalogo:
+            self.nombres.setdefault(ciudad["slug"], ciudad["nombre"])
+            self._agregar(ciudad["nombre"], ciudad["slug"])
+
+    def _agregar(self, nombre: str, slug: str):
+        clave = normalizar_nombre(nombre)
+        for variante in (clave, clave.replace(" ", "")):
+            self.exactos.setdefault(variante, slug)
+        palabras = clave.split()
+        for inicio in range(len(palabras)):
+            # Rango 0 = coincide desde el inicio del nombre, 1 = desde otra palabra
+            rango = 1 if inicio else 0
+            nodo = self.trie
+            for caracter in " ".join(palabras[inicio:]):
+                nodo = nodo.setdefault(caracter, {})
+                rangos = nodo.setdefault("$", {})
+                rangos[slug] = min(rangos.get(slug, rango), rango)
+
+    def buscar_exacto(self, nombre: str) -> Optional[str]:
+        clave = normalizar_nombre(nombre)
+        return self.exactos.get(clave) or self.exactos.get(clave.replace(" ", ""))
+
+    def buscar_prefijo(self, prefijo: str) -> List[str]:
+        nodo = self.trie
+        for caracter in normalizar_nombre(prefijo):
+            nodo = nodo.get(caracter)
+            if nodo is None:
+                return []
+        rangos = nodo.get("$", {})
+        return sorted(rangos, key=lambda slug: (rangos[slug], slug))
+
+    def buscar_aproximado(self, nombre: str) -> List[str]:
+        clave = normalizar_nombre(nombre)
+        maximo = 1 if len(clave) <= 5 else 2
+        distancias = {}
+        for variante, slug in self.exactos.items():
+            distancia = distancia_edicion(clave, variante, maximo)
+            if distancia <= maximo and distancia < distancias.get(slug, maximo + 1):
+                distancias[slug] = distancia
+        return sorted(distancias, key=lambda slug: (distancias[slug], slug))
+
+    def resolver(self, nombre: str) -> Optional[Dict]:
+        """Ciudad RedBus para un nombre conocido (sin tildes, mayúsculas ni espacios), o None.
+
+        Solo coincidencias exactas: un prefijo o un nombre parecido puede ser
+        otra ciudad real, que debe buscarse en RedBus. Esos se usan en /autocompletar.
+        """
+        slug = self.buscar_exacto(nombre)
+        return self.ciudades[slug] if slug else None
+
+    def autocompletar(self, texto: str, limite: int = 10) -> List[Dict]:
+        slugs = self.buscar_prefijo(texto)
+        if len(slugs) < limite:
+            slugs += [slug for slug in self.buscar_aproximado(texto) if slug not in slugs]
+        vistos = set()
+        sugerencias = []
+        for slug in slugs:
+            ciudad = self.ciudades[slug]
+            if ciudad["id"] in vistos:
+                continue
+            vistos.add(ciudad["id"])
+            sugerencias.append({
+                "slug": slug,
+                "nombre": self.nombres.get(slug, ciudad["name"]),
+                "id": ciudad["id"],
+                "nombre_completo": ciudad["name"]
+            })
+            if len(sugerencias) >= limite:
+                break
+        return sugerencias
+
+
+class CacheCiudadesPersistente:
+    """Resultados de SolarSearch guardados en un archivo JSON con vencimiento.
+
+    También guarda las búsquedas sin resultado (con un TTL más corto) para no
+    repetir la consulta por nombres que RedBus no conoce.
+    """
+
+    def __init__(self, archivo: str, ttl_segundos: float, ttl_negativo_segundos: float, max_entradas: int):
+        self.archivo = archivo
+        self.ttl = ttl_segundos
+        self.ttl_negativo = ttl_negativo_segundos
+        self.max_entradas = max_entradas
+        self.entradas: Dict[str, Dict] = {}
+        self.cambios = False
+        self.cargar()
+
+    def cargar(self):
+        try:
+            with open(self.archivo, encoding="utf-8") as f:
+                self.entradas = json.load(f)
+        except FileNotFoundError:
+            self.entradas = {}
+        except (OSError, ValueError) as e:
+            log.warning("Cache de ciudades ilegible, se empieza vacía: %s", e)
+            self.entradas = {}
+
+    def obtener(self, nombre: str):
+        """Devuelve (encontrado, ciudad); ciudad puede ser None si se guardó una búsqueda sin resultado"""
+        entrada = self.entradas.get(normalizar_nombre(nombre))
+        if entrada is None or entrada["vence"] < time.time():
+            return False, None
+        return True, entrada["ciudad"]
+
+    def guardar(self, nombre: str, ciudad: Optional[Dict]):
+        ttl = self.ttl if ciudad else self.ttl_negativo
+        self.entradas[normalizar_nombre(nombre)] = {"ciudad": ciudad, "vence": time.time() + ttl}
+        if len(self.entradas) > self.max_entradas:
+            ahora = time.time()
+            vigentes = sorted(
+                ((clave, entrada) for clave, entrada in self.entradas.items() if entrada["vence"] >= ahora),
+                key=lambda item: item[1]["vence"]
+            )
+            self.entradas = dict(vigentes[-self.max_entradas:])
+        self.cambios = True
+
+    def tomar_contenido(self) -> Optional[str]:
+        """JSON de las entradas si cambiaron desde la última toma.
+
+        Se llama en el hilo del event loop: guardar() puede modificar el dict
+        mientras escribir() corre en otro hilo, así que solo sale el texto.
+        """
+        if not self.cambios:
+            return None
+        self.cambios = False
+        return json.dumps(self.entradas, ensure_ascii=False)
+
+    def escribir(self, contenido: str):
+        temporal = f"{self.archivo}.tmp"
+        try:
+            with open(temporal, "w", encoding="utf-8") as f:
+                f.write(contenido)
+            os.replace(temporal, self.archivo)
+        except OSError as e:
+            log.warning("No se pudo guardar la cache de ciudades: %s", e)
+
+
+indice_ciudades = IndiceCiudades(CIUDADES_REDBUS, CATALOGO_CIUDADES)
@@ -2,8 +2,149 @@
 Configuración del sistema de alertas
 """
 
+import os
+
 CONFIG_ALERTAS = {
     "umbral_critico": 5,       # Alerta crítica cuando quedan menos de X asientos
     "umbral_advertencia": 10,   # Advertencia cuando quedan menos de X asientos
-    "intervalo_revision": 300   # Revisar cada X segundos (300 = 5 minutos)
-}
\ No newline at end of file
+    "intervalo_revision": 300,  # Revisar cada X segundos (300 = 5 minutos)
+    "busquedas_concurrentes": 8, # Rutas/fechas revisadas al mismo tiempo en cada ciclo
+    "intervalo_minimo": 30,     # Revisión más frecuente posible (salida cercana, pocos asientos)
+    "intervalo_maximo": 1800,   # Revisión menos frecuente posible (viajes lejanos con cupo)
+    "max_alertas": 5000,        # Alertas guardadas en memoria; las más viejas se descartan
+    "retencion_estado_horas": 48, # Se olvida el último conteo de asientos de buses no vistos en X horas
+    "intervalo_purga_minutos": 30,
+    "cola_suscriptor": 100,     # Alertas pendientes por cliente del stream antes de desconectarlo
+    "heartbeat_segundos": 15    # Comentario SSE periódico para mantener viva la conexión
+}
+
+CONFIG_WEBHOOKS = {
+    # Webhooks fijos que reciben todas las alertas, además de los registrados en POST /webhooks
+    "urls": [url.strip() for url in os.getenv("WEBHOOKS_URLS", "").split(",") if url.strip()],
+    "tamano_cola": 5000,        # Alertas esperando agruparse; con la cola llena no se envían a webhooks
+    "ventana_segundos": 2,      # Tiempo que se juntan alertas antes de enviar el lote
+    "max_lote": 50,             # Con este número de alertas el lote sale sin esperar la ventana
+    "trabajadores": 4,          # Envíos simultáneos sumando todos los webhooks
+    "timeout_segundos": 5,
+    "reintentos": 5,            # Reintentos por lote ante errores de red, 408, 429 y 5xx
+    "backoff_base": 1,
+    "backoff_maximo": 60,
+    "max_fallidos": 500,        # Lotes sin entregar guardados para revisar o reenviar
+    "espera_al_detener": 5,     # Segundos para terminar de enviar al apagar el servidor
+    # POST /webhooks rechaza URLs a localhost y redes privadas; "1" solo para desarrollo local
+    "permitir_redes_privadas": os.getenv("WEBHOOKS_PERMITIR_PRIVADAS", "0") == "1"
+}
+
+CONFIG_SERIES = {
+    "max_puntos_por_viaje": 1000,   # Al llegar aquí se reducen los puntos viejos y se descartan los más antiguos
+    "detalle_horas": 6,         # Puntos más nuevos que esto se guardan todos
+    "resolucion_minutos": 30,   # Los más viejos quedan en uno por cada intervalo
+    "ventana_velocidad_horas": 3 # Historial usado para calcular la velocidad de venta
+}
+
+CONFIG_CACHE = {
+    "ttl_segundos": 60,         # Tiempo que se reutiliza un resultado de búsqueda
+    "gracia_segundos": 240,     # Vencido hace menos que esto: se responde igual y se refresca en segundo plano
+    "max_entradas": 500         # Rutas/fechas guardadas antes de descartar las menos usadas
+}
+
+CONFIG_REDBUS = {
+    "url_base": os.getenv("REDBUS_URL", "https://www.redbus.co"),  # Otro valor para usar fake_redbus.py
+    "limite_pagina": 100,       # Buses pedidos por página a SearchV4Results
+    "max_paginas": 5,           # Máximo de páginas por búsqueda
+    "paginas_concurrentes": 4,  # Páginas pedidas al mismo tiempo después de la primera
+    "fechas_concurrentes": 6,   # Fechas consultadas al mismo tiempo en /buscar-rango
+    "max_dias_rango": 60,
+    "max_consultas_lote": 200,  # Consultas por petición en /buscar-lote
+    "lote_concurrencia_global": 8, # Búsquedas simultáneas sumando todos los lotes en curso
+    # Segundos que espera cada búsqueda por las páginas de RedBus antes de responder con las
+    # que llegaron (parcial); se cambia por petición con el parámetro `plazo`
+    "plazos": {
+        "buscar": 5,
+        "buscar-rapido-ochoa": 5,
+        "buscar-avanzado": 5,
+        "verificar-disponibilidad": 8,
+        "buscar-rango": 10,     # Por fecha del rango
+        "buscar-lote": 10,      # Por consulta del lote
+    },
+    "plazo_maximo": 30
+}
+
+CONFIG_UPSTREAM = {
+    "max_conexiones": 50,       # Conexiones simultáneas a RedBus (todas las búsquedas juntas)
+    "max_keepalive": 20,        # Conexiones ociosas que se mantienen abiertas para reutilizar
+    "keepalive_segundos": 30,
+    "http2": True,              # httpx[http2] en requirements.txt; sin h2 se usa HTTP/1.1
+    "timeout_conexion": 3,      # Segundos para abrir la conexión
+    "timeout_lectura": 10,      # Segundos esperando la respuesta
+    "timeout_pool": 5,          # Segundos esperando una conexión libre del pool
+    "reintentos": 2,            # Reintentos ante errores de red, 429 y 5xx
+    "backoff_base": 0.2,        # Espera antes del reintento n: al azar entre 0 y base * 2^n
+    "backoff_maximo": 2,
+    "umbral_fallos": 5,         # Fallos seguidos (ya con reintentos) que abren el circuito
+    "segundos_abierto": 30,     # Tiempo sin llamar a RedBus antes de probar de nuevo
+    "peticiones_por_segundo": 20, # Límite sostenido de llamadas a RedBus (0 = sin límite)
+    "rafaga": 40,               # Llamadas que pueden salir seguidas antes de aplicar el límite
+    "max_en_cola": {            # Peticiones esperando turno por prioridad; con la cola llena se responde 503
+        "interactivo": 200,
+        "monitor": 500,
+        "prefetch": 50
+    }
+}
+
+CONFIG_RESPUESTAS = {
+    "json_rapido": True,        # /buscar* serializa con orjson (si está instalado) y sin jsonable_encoder
+    "compresion": True,         # brotli (si está instalado) o gzip según Accept-Encoding
+    "compresion_minimo_bytes": 1024, # Respuestas más chicas se envían sin comprimir
+    "nivel_gzip": 5,
+    "nivel_brotli": 4,
+    "max_edad_ciudades": 86400, # Cache-Control de /ciudades (el catálogo solo cambia al desplegar)
+    "max_limite": 500           # Máximo de buses por página con `limite` en /buscar*
+}
+
+CONFIG_PREFETCH = {
+    "habilitado": True,         # Refrescar en segundo plano las rutas más buscadas
+    "intervalo_segundos": 20,   # Cada cuánto se revisa qué precargar
+    "dias_adelante": 3,         # Para los corredores populares se precargan hoy y los próximos días
+    "top_rutas": 30,            # Rutas/fechas más buscadas que se mantienen frescas
+    "top_corredores": 10,       # Origen/destino más buscados (sin importar la fecha)
+    "refrescar_desde": 0.8,     # Se refresca cuando la entrada pasó esta fracción del TTL de la cache
+    "max_por_ronda": 4,         # Búsquedas de precarga por ronda
+    "presupuesto_por_hora": 600, # Máximo de búsquedas de precarga por hora
+    "tokens_minimos": 0.5,      # Solo se precarga si el limitador tiene al menos esta fracción de la ráfaga libre
+    "decaimiento_minutos": 60,  # Cada cuánto se reducen a la mitad los conteos de popularidad
+    "ancho_sketch": 4096,
+    "profundidad_sketch": 4,
+    "corredores_calentamiento": [  # Se precargan al arrancar, antes de tener estadísticas
+        ["medellin", "cartagena"],
+        ["medellin", "barranquilla"],
+        ["medellin", "santa marta"],
+        ["medellin", "monteria"],
+        ["medellin", "bogota"]
+    ],
+    "dias_calentamiento": 2
+}
+
+CONFIG_CIUDADES = {
+    "archivo_cache": "cache_ciudades.json",  # Resultados de SolarSearch guardados entre reinicios
+    "ttl_cache_horas": 168,     # Vigencia de una ciudad encontrada en RedBus (7 días)
+    "ttl_negativo_horas": 6,    # Vigencia de una búsqueda sin resultado
+    "max_entradas": 2000,
+    "espera_escritura_segundos": 5  # Junta las búsquedas nuevas de ese lapso en una sola escritura del archivo
+}
+
+CONFIG_PERSISTENCIA = {
+    "habilitada": True,         # Guardar monitores, asientos y alertas para sobrevivir reinicios
+    "archivo_db": os.getenv("BUSCADOR_DB", "buscador.db"),
+    "intervalo_volcado_segundos": 5  # Cada cuánto se escriben juntos los cambios acumulados
+}
+
+CONFIG_LOGS = {
+    "nivel": os.getenv("LOG_LEVEL", "INFO"),  # Nivel general del logger "buscador"
+    "niveles": {                # Nivel por módulo, p. ej. "buscador.redbus": "DEBUG"
+        "buscador.redbus": os.getenv("LOG_LEVEL_REDBUS", "INFO"),
+    },
+    "formato": os.getenv("LOG_FORMATO", "json"),  # "json" o "texto"
+    "muestreo_debug": 10,       # Se escribe 1 de cada N registros DEBUG repetidos
+    "tamano_cola": 10000        # Registros en espera de escribirse; si se llena se descartan
+}
@@ -0,0 +1,166 @@
+"""
+Servidor falso de RedBus para pruebas de carga sin red
+
+Implementa SearchV4Results y SolarSearch con inventarios sintéticos
+(deterministas por ruta y fecha), latencia configurable y errores inyectados.
+También recibe webhooks de alertas en POST /webhook/{nombre} (con la misma
+latencia y errores) y muestra lo recibido en GET /webhook/{nombre}.
+
+Uso como servidor:
+    python fake_redbus.py --puerto 9000 --buses 300 --latencia-ms 80
+    REDBUS_URL=http://localhost:9000 uvicorn main:app
+    WEBHOOKS_URLS=http://localhost:9000/webhook/ops uvicorn main:app
+
+O dentro del mismo proceso con httpx.ASGITransport(app=crear_app_falsa(...)),
+como hace benchmark.py.
+"""
+
+import argparse
+import asyncio
+import random
+import zlib
+from collections import deque
+from datetime import datetime
+from typing import Dict, List
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from ciudades import CIUDADES_REDBUS
+
+EMPRESAS = ["Rápido Ochoa", "Brasilia", "Copetran", "Berlinas", "Unitransco", "Coolitoral"]
+TIPOS_BUS = ["Rey Dorado - Lo máximo", "Preferencial", "Ejecutivo", "Dos pisos"]
+
+
+class ConfigFalsa:
+    def __init__(self, buses: int = 250, latencia_ms: float = 50, jitter_ms: float = 20,
+                 tasa_error: float = 0.0, incluir_total: bool = True):
+        self.buses = buses
+        self.latencia_ms = latencia_ms
+        self.jitter_ms = jitter_ms
+        self.tasa_error = tasa_error
+        self.incluir_total = incluir_total
+        self.peticiones = {"search": 0, "solar": 0, "webhooks": 0, "errores": 0}
+        self.webhooks: Dict[str, Dict] = {}
+
+
+def generar_inventario(origen: str, destino: str, fecha: str, cantidad: int) -> List[Dict]:
+    """Mismos buses para la misma ruta/fecha en cada llamada"""
+    semilla = zlib.crc32(f"{origen}|{destino}|{fecha}".encode())
+    azar = random.Random(semilla)
+    try:
+        fecha_iso = datetime.strptime(fecha, "%d-%b-%Y").strftime("%Y-%m-%d")
+    except ValueError:
+        fecha_iso = fecha
+    buses = []
+    for i in range(cantidad):
+        minutos = azar.randrange(0, 24 * 60, 5)
+        duracion = azar.randrange(240, 900, 10)
+        llegada = minutos + duracion
+        totales = azar.choice([38, 40, 42, 44])
+        buses.append({
+            "travelsName": azar.choice(EMPRESAS),
+            "busType": azar.choice(TIPOS_BUS),
+            "serviceName": f"SRV-{semilla % 1000}-{i}",
+            "departureTime": f"{fecha_iso} {minutos // 60:02d}:{minutos % 60:02d}:00",
+            "arrivalTime": f"{fecha_iso} {(llegada // 60) % 24:02d}:{llegada % 60:02d}:00",
+            "journeyDurationMin": duracion,
+            "fareList": [azar.randrange(60000, 250000, 500)],
+            "convenienceFee": azar.choice([0, 5000, 9250]),
+            "vendorCurrency": "COP",
+            "availableSeats": azar.randint(0, totales),
+            "totalSeats": totales,
+            "availableWindowSeats": azar.randint(0, totales // 2),
+            "bpData": [{"Name": f"Terminal {origen}"}],
+            "dpData": [{"Name": f"Terminal {destino}"}],
+            "totalRatings": round(azar.uniform(2.5, 5.0), 1),
+            "numberOfReviews": str(azar.randint(0, 2000)),
+            "isAc": azar.random() < 0.8,
+            "isSleeper": azar.random() < 0.3,
+            "isLiveTrackingAvailable": azar.random() < 0.5,
+            "isSoldOut": False,
+        })
+    return buses
+
+
+def crear_app_falsa(config: ConfigFalsa) -> FastAPI:
+    app = FastAPI(title="RedBus falso")
+    inventarios: Dict[tuple, List[Dict]] = {}
+
+    async def simular_red():
+        espera = config.latencia_ms + random.uniform(-config.jitter_ms, config.jitter_ms)
+        await asyncio.sleep(max(0.0, espera) / 1000)
+        if config.tasa_error and random.random() < config.tasa_error:
+            config.peticiones["errores"] += 1
+            return JSONResponse({"error": "falla simulada"}, status_code=503)
+        return None
+
+    @app.post("/search/SearchV4Results")
+    async def search_v4_results(request: Request):
+        config.peticiones["search"] += 1
+        error = await simular_red()
+        if error:
+            return error
+        params = request.query_params
+        clave = (params.get("fromCity"), params.get("toCity"), params.get("DOJ"))
+        if clave not in inventarios:
+            inventarios[clave] = generar_inventario(*clave, config.buses)
+        inventario = inventarios[clave]
+        offset = int(params.get("offset", 0))
+        limit = int(params.get("limit", 100))
+        pagina = inventario[offset:offset + limit]
+        respuesta = {"inventories": pagina, "hasMoreResults": offset + limit < len(inventario)}
+        if config.incluir_total:
+            respuesta["totalCount"] = len(inventario)
+        return respuesta
+
+    @app.get("/Home/SolarSearch")
+    async def solar_search(search: str = ""):
+        config.peticiones["solar"] += 1
+        error = await simular_red()
+        if error:
+            return error
+        ciudad = CIUDADES_REDBUS.get(search.lower().strip())
+        if ciudad is None:
+            ciudad = {"id": str(900000 + zlib.crc32(search.encode()) % 100000), "name": f"{search.title()} (Todos)"}
+        return {"response": {"docs": [{"ID": int(ciudad["id"]), "Name": ciudad["name"], "locationType": "CITY"}]}}
+
+    @app.post("/webhook/{nombre}")
+    async def recibir_webhook(nombre: str, request: Request):
+        config.peticiones["webhooks"] += 1
+        error = await simular_red()
+        if error:
+            return error
+        lote = await request.json()
+        recibido = config.webhooks.setdefault(nombre, {"lotes": 0, "alertas": 0, "ultimas": deque(maxlen=100)})
+        recibido["lotes"] += 1
+        recibido["alertas"] += len(lote.get("alertas", []))
+        recibido["ultimas"].extend(lote.get("alertas", []))
+        return {"recibidas": len(lote.get("alertas", []))}
+
+    @app.get("/webhook/{nombre}")
+    async def ver_webhook(nombre: str):
+        recibido = config.webhooks.get(nombre, {"lotes": 0, "alertas": 0, "ultimas": []})
+        return {"lotes": recibido["lotes"], "alertas": recibido["alertas"], "ultimas": list(recibido["ultimas"])}
+
+    @app.get("/estadisticas")
+    async def estadisticas():
+        return config.peticiones
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Servidor falso de RedBus")
+    parser.add_argument("--puerto", type=int, default=9000)
+    parser.add_argument("--buses", type=int, default=250, help="Buses por ruta y fecha")
+    parser.add_argument("--latencia-ms", type=float, default=50)
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--tasa-error", type=float, default=0.0, help="Probabilidad de responder 503 (0-1)")
+    parser.add_argument("--sin-total", action="store_true", help="No enviar totalCount (solo hasMoreResults)")
+    args = parser.parse_args()
+
+    config = ConfigFalsa(args.buses, args.latencia_ms, args.jitter_ms, args.tasa_error, not args.sin_total)
+    uvicorn.run(crear_app_falsa(config), host="127.0.0.1", port=args.puerto)
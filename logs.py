@@ -0,0 +1,138 @@
+"""
+Logging estructurado y sin bloquear el event loop
+
+Los módulos usan loggers bajo "buscador" (buscador.redbus, buscador.monitor, ...).
+Los registros pasan por una cola (QueueHandler) y un hilo aparte
+(QueueListener) hace la escritura, así el event loop nunca espera por stdout.
+Cada registro lleva el request id y la ruta de la petición en curso.
+"""
+
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+from datetime import datetime
+from typing import Dict, Optional
+
+request_id_actual: contextvars.ContextVar = contextvars.ContextVar("request_id", default=None)
+ruta_actual: contextvars.ContextVar = contextvars.ContextVar("ruta", default=None)
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class FiltroContexto(logging.Filter):
+    """Agrega request_id y ruta al registro; corre en el hilo que loguea, donde están los contextvars"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_actual.get()
+        record.ruta = ruta_actual.get()
+        return True
+
+
+class FiltroMuestreo(logging.Filter):
+    """Deja pasar 1 de cada `cada` registros DEBUG por mensaje; los demás niveles pasan siempre"""
+
+    def __init__(self, cada: int):
+        super().__init__()
+        self.cada = max(1, cada)
+        self.contadores: Dict[tuple, int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.cada == 1:
+            return True
+        clave = (record.name, record.msg)
+        visto = self.contadores.get(clave, 0)
+        self.contadores[clave] = visto + 1
+        if len(self.contadores) > 10000:
+            self.contadores.clear()
+        return visto % self.cada == 0
+
+
+class FormatoJSON(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        datos = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "nivel": record.levelname,
+            "logger": record.name,
+            "mensaje": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            datos["request_id"] = record.request_id
+        if getattr(record, "ruta", None):
+            datos["ruta"] = record.ruta
+        if isinstance(getattr(record, "datos", None), dict):
+            datos.update(record.datos)
+        if record.exc_info:
+            datos["error"] = self.formatException(record.exc_info)
+        return json.dumps(datos, ensure_ascii=False, default=str)
+
+
+class FormatoTexto(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        texto = super().format(record)
+        contexto = " ".join(f"{campo}={valor}" for campo, valor in (
+            ("request_id", getattr(record, "request_id", None)), ("ruta", getattr(record, "ruta", None))
+        ) if valor)
+        if isinstance(getattr(record, "datos", None), dict):
+            contexto = " ".join([contexto] + [f"{campo}={valor}" for campo, valor in record.datos.items()]).strip()
+        return f"{texto} [{contexto}]" if contexto else texto
+
+
+class ColaSinBloqueo(logging.handlers.QueueHandler):
+    """Si la cola está llena se descarta el registro en vez de frenar a quien loguea"""
+
+    descartados = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Fija el mensaje con sus argumentos pero conserva exc_info: el traceback lo
+        formatea el handler de salida (en FormatoJSON va en "error", no en "mensaje")"""
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            ColaSinBloqueo.descartados += 1
+
+
+def configurar_logs(config: Dict):
+    """Configura el logger "buscador" una sola vez (llamadas repetidas no duplican handlers)"""
+    global _listener
+    raiz = logging.getLogger("buscador")
+    if _listener is not None:
+        return raiz
+
+    salida = logging.StreamHandler(sys.stdout)
+    salida.setFormatter(FormatoJSON() if config["formato"] == "json" else FormatoTexto())
+
+    cola: queue.Queue = queue.Queue(config["tamano_cola"])
+    manejador = ColaSinBloqueo(cola)
+    manejador.addFilter(FiltroContexto())
+    manejador.addFilter(FiltroMuestreo(config["muestreo_debug"]))
+
+    raiz.setLevel(config["nivel"])
+    raiz.addHandler(manejador)
+    raiz.propagate = False
+    for nombre, nivel in config["niveles"].items():
+        logging.getLogger(nombre).setLevel(nivel)
+
+    _listener = logging.handlers.QueueListener(cola, salida, respect_handler_level=True)
+    _listener.start()
+    return raiz
+
+
+def detener_logs():
+    """Vacía la cola y detiene el hilo de escritura (al apagar el servidor)"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,10 +1,36 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Header, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
-import httpx
 from typing import List, Dict, Optional
-from datetime import datetime
+from datetime import datetime, timedelta
 import asyncio
-from config import CONFIG_ALERTAS
+import json
+import time
+import uuid
+import logging
+from config import (CONFIG_ALERTAS, CONFIG_SERIES, CONFIG_CACHE, CONFIG_REDBUS, CONFIG_UPSTREAM, CONFIG_CIUDADES, CONFIG_PERSISTENCIA,
+                    CONFIG_LOGS, CONFIG_RESPUESTAS, CONFIG_PREFETCH, CONFIG_WEBHOOKS)
+from cache import CacheBusquedas
+from snapshot import SnapshotResultados, parsear_campos
+from alertas import AlmacenAlertas, DifusorAlertas
+from persistencia import PersistenciaSQLite
+from metricas import registro as registro_metricas, medir_retraso_event_loop
+from ciudades import CATALOGO_CIUDADES, CacheCiudadesPersistente, indice_ciudades, normalizar_nombre
+from planificador import PlanificadorMonitores, calcular_intervalo_revision
+from series import AlmacenSeries
+from popularidad import PresupuestoVentana, RankingPopularidad
+from respuestas import CuerpoPrecalculado, MiddlewareCompresion, RespuestaJSON, cargar_json
+from upstream import ClienteRedBus, RedBusNoDisponible, PRIORIDADES, prioridad_redbus
+from logs import configurar_logs, detener_logs, request_id_actual, ruta_actual
+from webhooks import EntregaWebhooks, Webhook, validar_url_webhook
+
+configurar_logs(CONFIG_LOGS)
+log_api = logging.getLogger("buscador.api")
+log_redbus = logging.getLogger("buscador.redbus")
+log_monitor = logging.getLogger("buscador.monitor")
+log_alertas = logging.getLogger("buscador.alertas")
+log_persistencia = logging.getLogger("buscador.persistencia")
 
 app = FastAPI(
     title="Buscador de Buses Colombia - Rápido Ochoa",
@@ -20,11 +46,108 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-client = httpx.AsyncClient(timeout=30.0)
+if CONFIG_RESPUESTAS["compresion"]:
+    app.add_middleware(
+        MiddlewareCompresion,
+        minimo_bytes=CONFIG_RESPUESTAS["compresion_minimo_bytes"],
+        nivel_gzip=CONFIG_RESPUESTAS["nivel_gzip"],
+        nivel_brotli=CONFIG_RESPUESTAS["nivel_brotli"]
+    )
+
+@app.middleware("http")
+async def asignar_request_id(request: Request, call_next):
+    """Usa el X-Request-ID del cliente o genera uno; queda en los logs de toda la petición"""
+    request_id = request.headers.get("x-request-id") or uuid.uuid4().hex[:16]
+    request_id_actual.set(request_id)
+    response = await call_next(request)
+    response.headers["X-Request-ID"] = request_id
+    return response
+
+@app.exception_handler(RedBusNoDisponible)
+async def redbus_no_disponible(request: Request, e: RedBusNoDisponible):
+    return JSONResponse(
+        {"detail": str(e)},
+        status_code=503,
+        headers={"Retry-After": str(max(1, int(e.reintentar_en + 0.999)))}
+    )
+
+upstream = ClienteRedBus(CONFIG_UPSTREAM)
 
 rutas_monitoreadas = {}
-alertas_generadas = []
+alertas_generadas = AlmacenAlertas(CONFIG_ALERTAS["max_alertas"])
+difusor_alertas = DifusorAlertas(CONFIG_ALERTAS["cola_suscriptor"])
+entrega_webhooks = EntregaWebhooks(CONFIG_WEBHOOKS)
 estado_anterior = {}
+cache_busquedas = CacheBusquedas(CONFIG_CACHE["ttl_segundos"], CONFIG_CACHE["max_entradas"])
+planificador = PlanificadorMonitores()
+series_viajes = AlmacenSeries(
+    CONFIG_SERIES["max_puntos_por_viaje"],
+    CONFIG_SERIES["detalle_horas"] * 3600,
+    CONFIG_SERIES["resolucion_minutos"] * 60
+)
+rutas_populares = RankingPopularidad(CONFIG_PREFETCH["top_rutas"], CONFIG_PREFETCH["ancho_sketch"], CONFIG_PREFETCH["profundidad_sketch"])
+corredores_populares = RankingPopularidad(CONFIG_PREFETCH["top_corredores"], CONFIG_PREFETCH["ancho_sketch"], CONFIG_PREFETCH["profundidad_sketch"])
+presupuesto_prefetch = PresupuestoVentana(CONFIG_PREFETCH["presupuesto_por_hora"], 3600)
+persistencia = PersistenciaSQLite(
+    CONFIG_PERSISTENCIA["archivo_db"] if CONFIG_PERSISTENCIA["habilitada"] else None,
+    CONFIG_ALERTAS["max_alertas"]
+)
+
+metrica_redbus_latencia = registro_metricas.histograma(
+    "redbus_peticion_segundos", "Latencia de peticiones a RedBus", ("endpoint", "pagina"))
+metrica_redbus_respuestas = registro_metricas.contador(
+    "redbus_respuestas_total", "Respuestas de RedBus por código HTTP", ("endpoint", "codigo"))
+metrica_redbus_errores = registro_metricas.contador(
+    "redbus_errores_total", "Peticiones a RedBus sin respuesta válida (red, timeout, JSON)", ("endpoint", "tipo"))
+metrica_buses_busqueda = registro_metricas.histograma(
+    "busqueda_buses_normalizados", "Buses normalizados por búsqueda a RedBus", buckets=(0, 10, 25, 50, 100, 200, 300, 500))
+metrica_busquedas_parciales = registro_metricas.contador(
+    "busquedas_parciales_total", "Búsquedas a RedBus respondidas sin todas sus páginas", ("motivo",))
+metrica_normalizacion_fallida = registro_metricas.contador(
+    "normalizacion_buses_fallidos_total", "Buses de RedBus descartados por no poder normalizarse")
+metrica_monitor_ciclo = registro_metricas.histograma(
+    "monitor_ciclo_segundos", "Duración de cada ronda de revisiones del monitor loop")
+metrica_monitor_retraso = registro_metricas.histograma(
+    "monitor_retraso_segundos", "Retraso de cada revisión respecto a la hora que le asignó el planificador")
+metrica_loop_retraso = registro_metricas.medidor(
+    "event_loop_retraso_segundos", "Último retraso medido del event loop")
+metrica_loop_retraso_hist = registro_metricas.histograma(
+    "event_loop_retraso_hist_segundos", "Retrasos del event loop", buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5))
+registro_metricas.medidor("monitores_activos", "Monitores registrados", lambda: len(rutas_monitoreadas))
+registro_metricas.medidor("monitores_programados", "Monitores en la cola del planificador", lambda: len(planificador))
+registro_metricas.medidor("alertas_almacenadas", "Alertas en el buffer circular", lambda: len(alertas_generadas))
+registro_metricas.medidor("alertas_suscriptores", "Clientes conectados a /alertas/stream", lambda: len(difusor_alertas))
+registro_metricas.contador("alertas_suscriptores_descartados_total", "Clientes desconectados por lentos",
+                           funcion=lambda: difusor_alertas.descartados)
+registro_metricas.medidor("webhook_alertas_en_cola", "Alertas esperando agruparse para los webhooks",
+                          lambda: entrega_webhooks.cola.qsize())
+registro_metricas.medidor("webhook_lotes_por_enviar", "Lotes listos esperando un trabajador libre", lambda: entrega_webhooks.envios.qsize())
+registro_metricas.medidor("webhook_lotes_fallidos", "Lotes que agotaron los reintentos", lambda: len(entrega_webhooks.fallidos))
+registro_metricas.medidor("estado_asientos_entradas", "Entradas en estado_anterior", lambda: len(estado_anterior))
+registro_metricas.medidor("series_viajes", "Viajes con historial de asientos en memoria", lambda: len(series_viajes))
+metrica_prefetch = registro_metricas.contador(
+    "prefetch_busquedas_total", "Búsquedas hechas en segundo plano para tener la cache caliente", ("motivo", "resultado"))
+registro_metricas.medidor("prefetch_presupuesto_restante", "Búsquedas de precarga que quedan en la última hora",
+                          lambda: presupuesto_prefetch.restante())
+registro_metricas.medidor("cache_busquedas_entradas", "Rutas/fechas en la cache de búsquedas", lambda: len(cache_busquedas))
+registro_metricas.contador("cache_busquedas_aciertos_total", "Búsquedas servidas desde la cache", funcion=lambda: cache_busquedas.aciertos)
+registro_metricas.contador("cache_busquedas_fallos_total", "Búsquedas que consultaron RedBus", funcion=lambda: cache_busquedas.fallos)
+registro_metricas.medidor("redbus_circuito_estado", "Circuito hacia RedBus: 0 cerrado, 1 semiabierto, 2 abierto",
+                          lambda: {"cerrado": 0, "semiabierto": 1, "abierto": 2}[upstream.circuito.estado])
+registro_metricas.medidor("redbus_limitador_en_cola", "Peticiones esperando un token para llamar a RedBus",
+                          lambda: {(prioridad,): upstream.limitador.en_cola(prioridad) for prioridad in PRIORIDADES}, ("prioridad",))
+registro_metricas.medidor("redbus_limitador_tokens", "Tokens disponibles en el limitador de RedBus", lambda: upstream.limitador.tokens)
+registro_metricas.contador("cache_busquedas_desactualizadas_total", "Búsquedas servidas vencidas (en gracia) mientras se refrescaban",
+                           funcion=lambda: cache_busquedas.desactualizadas)
+registro_metricas.contador("cache_busquedas_coalescidas_total", "Búsquedas que esperaron una consulta en curso",
+                           funcion=lambda: cache_busquedas.coalescidas)
+cache_ciudades = CacheCiudadesPersistente(
+    CONFIG_CIUDADES["archivo_cache"],
+    CONFIG_CIUDADES["ttl_cache_horas"] * 3600,
+    CONFIG_CIUDADES["ttl_negativo_horas"] * 3600,
+    CONFIG_CIUDADES["max_entradas"]
+)
+escritura_ciudades: Optional[asyncio.Task] = None
 
 class MonitorRuta:
     def __init__(self, origen: str, destino: str, fecha: str, horario_especifico: Optional[str] = None, empresa_especifica: Optional[str] = None):
@@ -35,35 +158,108 @@ class MonitorRuta:
         self.empresa_especifica = empresa_especifica
         self.activo = True
         self.ultima_revision = None
+        self.proxima_revision = None
+        self.ultimos_asientos = None
+        self.velocidad_venta = 0.0
+        self.proxima_salida = None
+        self.salidas_pendientes = None
+        self.intervalo = None
         self.id = f"{origen}_{destino}_{fecha}_{horario_especifico or 'todos'}"
 
-async def revisar_disponibilidad(monitor: MonitorRuta):
+async def revisar_grupo_monitores(fecha_redbus: str, monitores: List[MonitorRuta]):
+    """Hace una sola búsqueda para todos los monitores de la misma ruta y fecha"""
+    primero = monitores[0]
+    # Con la mitad del intervalo más corto del grupo nunca se reusa el resultado de la revisión anterior
+    max_edad = min(monitor.intervalo or CONFIG_ALERTAS["intervalo_minimo"] for monitor in monitores) / 2
     try:
-        fecha_redbus = convertir_fecha_a_redbus(monitor.fecha)
-        resultado = await buscar_redbus_dinamico(monitor.origen, monitor.destino, fecha_redbus)
-        horarios = resultado["resultados"]
-        
-        if monitor.empresa_especifica:
-            horarios = [h for h in horarios if monitor.empresa_especifica.lower() in h["empresa"].lower()]
-        
-        if monitor.horario_especifico:
-            horarios = [h for h in horarios if h["hora_salida"].startswith(monitor.horario_especifico)]
+        resultado = await buscar_redbus_dinamico(primero.origen, primero.destino, fecha_redbus, max_edad=max_edad)
+    except Exception as e:
+        for monitor in monitores:
+            log_monitor.warning("Error revisando ruta %s: %s", monitor.id, e)
+        return
+    
+    snapshot = resultado["snapshot"]
+    series_viajes.registrar(clave_ruta_series(primero.origen, primero.destino, fecha_redbus), resultado["resultados"],
+                            salida_timestamp, snapshot.creado_en)
+    observado_en = datetime.fromtimestamp(snapshot.creado_en)
+    for monitor in monitores:
+        try:
+            aplicar_resultados_monitor(monitor, resultado["resultados"], not snapshot.parcial, observado_en)
+        except Exception as e:
+            log_monitor.warning("Error revisando ruta %s: %s", monitor.id, e)
+
+def clave_ruta_series(origen: str, destino: str, fecha_redbus: str) -> tuple:
+    return (normalizar_nombre(origen), normalizar_nombre(destino), fecha_redbus)
+
+def salida_timestamp(bus: Dict) -> Optional[float]:
+    salida = parsear_fecha_salida(bus["fecha_salida"])
+    return salida.timestamp() if salida else None
+
+def aplicar_resultados_monitor(monitor: MonitorRuta, horarios: List[Dict], completo: bool = True,
+                               observado_en: Optional[datetime] = None):
+    """Con un resultado parcial (páginas de RedBus que fallaron) no se sabe qué salidas
+    quedan: se conservan `salidas_pendientes` y `proxima_salida` de la última revisión completa.
+
+    `observado_en` es cuándo se consultó RedBus (puede venir de la cache); con eso se mide la velocidad de venta.
+    """
+    if monitor.empresa_especifica:
+        horarios = [h for h in horarios if monitor.empresa_especifica.lower() in h["empresa"].lower()]
+    
+    if monitor.horario_especifico:
+        horarios = [h for h in horarios if h["hora_salida"].startswith(monitor.horario_especifico)]
+    
+    ahora = datetime.now()
+    observado_en = observado_en or ahora
+    velocidad = 0.0
+    proxima_salida = None
+    asientos_min = None
+    salidas_pendientes = 0
+    for horario in horarios:
+        salida = parsear_fecha_salida(horario["fecha_salida"])
+        if salida is not None and salida < ahora:
+            continue
+        salidas_pendientes += 1
+        if salida is not None and (proxima_salida is None or salida < proxima_salida):
+            proxima_salida = salida
         
-        for horario in horarios:
-            generar_alerta_si_necesario(monitor, horario)
+        asientos = horario["asientos_disponibles"]
+        if asientos_min is None or asientos < asientos_min:
+            asientos_min = asientos
         
-        monitor.ultima_revision = datetime.now()
-    except Exception as e:
-        print(f"Error revisando ruta {monitor.id}: {e}")
+        estado_prev = estado_anterior.get(clave_estado(monitor, horario))
+        if estado_prev:
+            horas = (observado_en - estado_prev["timestamp"]).total_seconds() / 3600
+            if horas > 0 and estado_prev["asientos"] > asientos:
+                velocidad = max(velocidad, (estado_prev["asientos"] - asientos) / horas)
+    
+    for horario in horarios:
+        generar_alerta_si_necesario(monitor, horario, observado_en)
+    
+    # Promedio móvil para que una sola venta grande no dispare la frecuencia
+    monitor.velocidad_venta = 0.5 * monitor.velocidad_venta + 0.5 * velocidad
+    monitor.ultimos_asientos = asientos_min
+    if completo:
+        monitor.proxima_salida = proxima_salida
+        monitor.salidas_pendientes = salidas_pendientes
+    monitor.ultima_revision = ahora
+    persistencia.guardar_monitor(monitor)
+
+def clave_estado(monitor: MonitorRuta, horario: Dict) -> str:
+    return f"{monitor.id}_{horario['hora_salida']}_{horario['empresa']}"
 
-def generar_alerta_si_necesario(monitor: MonitorRuta, horario: Dict):
+def generar_alerta_si_necesario(monitor: MonitorRuta, horario: Dict, observado_en: datetime):
     asientos_disponibles = horario["asientos_disponibles"]
-    key = f"{monitor.id}_{horario['hora_salida']}_{horario['empresa']}"
+    key = clave_estado(monitor, horario)
     
     estado_prev = estado_anterior.get(key, {})
     asientos_prev = estado_prev.get("asientos", None)
     
-    estado_anterior[key] = {"asientos": asientos_disponibles, "timestamp": datetime.now()}
+    estado_anterior[key] = {
+        "asientos": asientos_disponibles,
+        "timestamp": observado_en,
+        "salida": parsear_fecha_salida(horario["fecha_salida"])
+    }
+    persistencia.guardar_estado(key, estado_anterior[key])
     
     alerta = None
     
@@ -116,82 +312,314 @@ def generar_alerta_si_necesario(monitor: MonitorRuta, horario: Dict):
             }
     
     if alerta:
-        alertas_generadas.append(alerta)
-        print(f"🔔 ALERTA: {alerta['mensaje']}")
+        alertas_generadas.agregar(alerta)
+        persistencia.guardar_alerta(alerta)
+        difusor_alertas.publicar(alerta)
+        entrega_webhooks.publicar(alerta)
+        log_alertas.info("ALERTA: %s", alerta["mensaje"], extra={"datos": {"tipo": alerta["tipo"], "monitor": monitor.id}})
+
+def agrupar_monitores(monitores: List[MonitorRuta]) -> Dict[tuple, List[MonitorRuta]]:
+    """Agrupa los monitores activos por ruta y fecha (sin importar horario, empresa, tildes ni mayúsculas)"""
+    grupos = {}
+    for monitor in monitores:
+        if not monitor.activo:
+            continue
+        try:
+            fecha_redbus = convertir_fecha_a_redbus(monitor.fecha)
+        except HTTPException:
+            log_monitor.warning("Error revisando ruta %s: fecha inválida %s", monitor.id, monitor.fecha)
+            continue
+        clave = (normalizar_nombre(monitor.origen), normalizar_nombre(monitor.destino), fecha_redbus)
+        grupos.setdefault(clave, []).append(monitor)
+    return grupos
+
+async def ejecutar_ciclo_monitores(monitores: Optional[List[MonitorRuta]] = None) -> int:
+    if monitores is None:
+        monitores = list(rutas_monitoreadas.values())
+    grupos = agrupar_monitores(monitores)
+    semaforo = asyncio.Semaphore(CONFIG_ALERTAS["busquedas_concurrentes"])
+    
+    async def revisar(fecha_redbus: str, monitores: List[MonitorRuta]):
+        async with semaforo:
+            await revisar_grupo_monitores(fecha_redbus, monitores)
+    
+    await asyncio.gather(*[revisar(clave[2], monitores) for clave, monitores in grupos.items()])
+    return len(grupos)
+
+def reprogramar_monitor(monitor: MonitorRuta):
+    ahora = datetime.now()
+    horas_para_salida = None
+    if monitor.proxima_salida is not None:
+        horas_para_salida = (monitor.proxima_salida - ahora).total_seconds() / 3600
+    else:
+        try:
+            horas_para_salida = (parsear_fecha(monitor.fecha) - ahora).total_seconds() / 3600
+        except ValueError:
+            pass
+    
+    monitor.intervalo = calcular_intervalo_revision(horas_para_salida, monitor.ultimos_asientos, monitor.velocidad_venta, CONFIG_ALERTAS)
+    monitor.proxima_revision = ahora.timestamp() + monitor.intervalo
+    planificador.programar(monitor.id, monitor.proxima_revision)
+
+def monitor_vencido(monitor: MonitorRuta, ahora: datetime) -> bool:
+    try:
+        fecha = parsear_fecha(monitor.fecha).date()
+    except ValueError:
+        return True
+    if fecha < ahora.date():
+        return True
+    # Ya se revisó hoy y no quedan salidas futuras que cumplan el filtro
+    return fecha == ahora.date() and monitor.salidas_pendientes == 0
+
+def retirar_monitor(monitor_id: str):
+    monitor = rutas_monitoreadas.pop(monitor_id, None)
+    if monitor:
+        monitor.activo = False
+    planificador.quitar(monitor_id)
+    persistencia.quitar_monitor(monitor_id)
+    prefijo = f"{monitor_id}_"
+    for key in [key for key in estado_anterior if key.startswith(prefijo)]:
+        del estado_anterior[key]
+        persistencia.quitar_estado(key)
+
+def purgar_estado_anterior(ahora: datetime) -> int:
+    """Borra estados de buses que ya salieron o que no se ven hace más de la retención"""
+    limite = ahora - timedelta(hours=CONFIG_ALERTAS["retencion_estado_horas"])
+    vencidos = [
+        key for key, estado in estado_anterior.items()
+        if estado["timestamp"] < limite or (estado.get("salida") is not None and estado["salida"] < ahora)
+    ]
+    for key in vencidos:
+        del estado_anterior[key]
+        persistencia.quitar_estado(key)
+    return len(vencidos)
+
+bloqueo_volcado: Optional[asyncio.Lock] = None
+
+async def volcar_persistencia():
+    """Escribe en SQLite, en un hilo aparte, todo lo acumulado desde el último volcado.
+
+    Los volcados van de a uno para que un lote viejo no pise a uno más nuevo;
+    si la escritura falla, el lote vuelve a los pendientes para el próximo.
+    """
+    global bloqueo_volcado
+    if bloqueo_volcado is None:
+        bloqueo_volcado = asyncio.Lock()
+    async with bloqueo_volcado:
+        if not persistencia.hay_pendientes():
+            return
+        pendientes = persistencia.tomar_pendientes()
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, persistencia.escribir, pendientes)
+        except Exception as e:
+            persistencia.devolver_pendientes(pendientes)
+            log_persistencia.error("Error guardando estado en SQLite, se reintenta en el próximo volcado: %s", e)
+
+async def persistencia_loop():
+    """Vuelca los cambios con su propio intervalo, sin esperar al ciclo de monitoreo"""
+    while True:
+        await asyncio.sleep(CONFIG_PERSISTENCIA["intervalo_volcado_segundos"])
+        await volcar_persistencia()
+
+async def escribir_cache_ciudades(espera: float = 0):
+    """Escribe la cache de ciudades en un hilo aparte con los cambios acumulados durante `espera`"""
+    await asyncio.sleep(espera)
+    contenido = cache_ciudades.tomar_contenido()
+    if contenido is None:
+        return
+    await asyncio.get_running_loop().run_in_executor(None, cache_ciudades.escribir, contenido)
+
+def programar_escritura_ciudades():
+    global escritura_ciudades
+    if escritura_ciudades is None or escritura_ciudades.done():
+        escritura_ciudades = asyncio.create_task(escribir_cache_ciudades(CONFIG_CIUDADES["espera_escritura_segundos"]))
+
+def restaurar_estado():
+    guardado = persistencia.cargar()
+    ahora = datetime.now().timestamp()
+    for datos in guardado["monitores"]:
+        monitor = MonitorRuta(datos["origen"], datos["destino"], datos["fecha"], datos["horario_especifico"], datos["empresa_especifica"])
+        monitor.id = datos["id"]
+        monitor.ultima_revision = datos["ultima_revision"]
+        monitor.ultimos_asientos = datos["ultimos_asientos"]
+        monitor.velocidad_venta = datos["velocidad_venta"] or 0.0
+        rutas_monitoreadas[monitor.id] = monitor
+        planificador.programar(monitor.id, ahora)
+    for estado in guardado["estados"]:
+        estado_anterior[estado.pop("clave")] = estado
+    alertas_generadas.restaurar(guardado["alertas"])
+    for datos in guardado["webhooks"]:
+        entrega_webhooks.registrar(Webhook(datos["url"], datos["filtros"], datos["secreto"], datos["id"]))
+    for numero, url in enumerate(CONFIG_WEBHOOKS["urls"], 1):
+        entrega_webhooks.registrar(Webhook(url, webhook_id=f"config-{numero}"))
+    if guardado["monitores"] or guardado["alertas"]:
+        log_persistencia.info("Restaurados %d monitores, %d estados y %d alertas",
+                              len(guardado["monitores"]), len(guardado["estados"]), len(guardado["alertas"]))
 
 async def monitor_loop():
+    # Las revisiones ceden el turno a las búsquedas de usuarios en el limitador
+    prioridad_redbus.set("monitor")
+    ultima_purga = datetime.now()
     while True:
         try:
-            for monitor_id, monitor in list(rutas_monitoreadas.items()):
-                if monitor.activo:
-                    await revisar_disponibilidad(monitor)
-            await asyncio.sleep(CONFIG_ALERTAS["intervalo_revision"])
+            ahora = datetime.now()
+            if ahora - ultima_purga >= timedelta(minutes=CONFIG_ALERTAS["intervalo_purga_minutos"]):
+                purgar_estado_anterior(ahora)
+                series_viajes.purgar(ahora.timestamp(), CONFIG_ALERTAS["retencion_estado_horas"] * 3600)
+                ultima_purga = ahora
+            pendientes = []
+            for monitor_id in planificador.extraer_vencidos(ahora.timestamp()):
+                monitor = rutas_monitoreadas.get(monitor_id)
+                if not monitor or not monitor.activo:
+                    continue
+                if monitor_vencido(monitor, ahora):
+                    log_monitor.info("Monitor %s retirado: la fecha ya pasó", monitor_id)
+                    retirar_monitor(monitor_id)
+                    continue
+                pendientes.append(monitor)
+            
+            if pendientes:
+                for monitor in pendientes:
+                    if monitor.proxima_revision:
+                        metrica_monitor_retraso.observar(max(0.0, ahora.timestamp() - monitor.proxima_revision))
+                inicio = time.perf_counter()
+                await ejecutar_ciclo_monitores(pendientes)
+                metrica_monitor_ciclo.observar(time.perf_counter() - inicio)
+                for monitor in pendientes:
+                    if monitor.activo and monitor_vencido(monitor, datetime.now()):
+                        log_monitor.info("Monitor %s retirado: ya salieron todos sus buses", monitor.id)
+                        retirar_monitor(monitor.id)
+                    elif monitor.activo:
+                        reprogramar_monitor(monitor)
+            
+            await planificador.esperar(planificador.segundos_hasta_proxima(datetime.now().timestamp(), CONFIG_ALERTAS["intervalo_maximo"]))
         except Exception as e:
-            print(f"Error en monitor loop: {e}")
+            log_monitor.exception("Error en monitor loop: %s", e)
             await asyncio.sleep(60)
 
+def upstream_tranquilo() -> bool:
+    """RedBus sano, nadie esperando turno y tokens de sobra: se puede precargar sin quitarle capacidad a nadie"""
+    limitador = upstream.limitador
+    if upstream.circuito.estado != "cerrado" or limitador.en_cola():
+        return False
+    return limitador.tasa <= 0 or limitador.disponibles() >= limitador.rafaga * CONFIG_PREFETCH["tokens_minimos"]
+
+def plan_prefetch(ahora: datetime) -> List[tuple]:
+    """(motivo, origen, destino, fecha RedBus): primero las rutas/fechas más buscadas, luego los próximos días de los corredores más buscados"""
+    hoy = ahora.date()
+    plan = []
+    vistos = set()
+    
+    def agregar(motivo, origen_data, destino_data, fecha_redbus):
+        clave = (origen_data["id"], destino_data["id"], fecha_redbus)
+        if clave not in vistos:
+            vistos.add(clave)
+            plan.append((motivo, origen_data, destino_data, fecha_redbus))
+    
+    for (_, _, fecha_redbus), _, (origen_data, destino_data) in rutas_populares.mas_populares(CONFIG_PREFETCH["top_rutas"]):
+        try:
+            if parsear_fecha(fecha_redbus).date() < hoy:
+                continue
+        except ValueError:
+            continue
+        agregar("ruta", origen_data, destino_data, fecha_redbus)
+    
+    fechas = [convertir_fecha_a_redbus((hoy + timedelta(days=dias)).isoformat()) for dias in range(CONFIG_PREFETCH["dias_adelante"])]
+    for _, _, (origen_data, destino_data) in corredores_populares.mas_populares(CONFIG_PREFETCH["top_corredores"]):
+        for fecha_redbus in fechas:
+            agregar("corredor", origen_data, destino_data, fecha_redbus)
+    return plan
+
+async def precargar(motivo: str, origen_data: Dict, destino_data: Dict, fecha_redbus: str):
+    try:
+        snapshot = await buscar_ruta_resuelta(origen_data, destino_data, fecha_redbus, forzar=True)
+        metrica_prefetch.inc(motivo, "ok" if len(snapshot) else "vacio")
+    except Exception as e:
+        metrica_prefetch.inc(motivo, "error")
+        log_redbus.info("Precarga fallida de %s -> %s %s: %s", origen_data["name"], destino_data["name"], fecha_redbus, e)
+
+async def ronda_prefetch() -> int:
+    """Refresca lo que esté por vencer en la cache, de a una búsqueda y solo mientras RedBus esté tranquilo"""
+    umbral = cache_busquedas.ttl * CONFIG_PREFETCH["refrescar_desde"]
+    hechas = 0
+    for motivo, origen_data, destino_data, fecha_redbus in plan_prefetch(datetime.now()):
+        if hechas >= CONFIG_PREFETCH["max_por_ronda"] or not upstream_tranquilo():
+            break
+        clave = (origen_data["id"], destino_data["id"], fecha_redbus)
+        edad = cache_busquedas.edad(clave)
+        if (edad is not None and edad < umbral) or clave in cache_busquedas.en_vuelo:
+            continue
+        if not presupuesto_prefetch.gastar():
+            break
+        await precargar(motivo, origen_data, destino_data, fecha_redbus)
+        hechas += 1
+    return hechas
+
+async def calentar_cache():
+    """Precarga los corredores configurados para los próximos días, antes de tener estadísticas de uso"""
+    hoy = datetime.now().date()
+    for origen, destino in CONFIG_PREFETCH["corredores_calentamiento"]:
+        try:
+            origen_data, destino_data = await resolver_ruta(origen, destino)
+        except Exception as e:
+            log_redbus.info("Calentamiento: no se pudo resolver %s -> %s: %s", origen, destino, e)
+            continue
+        for dias in range(CONFIG_PREFETCH["dias_calentamiento"]):
+            if not presupuesto_prefetch.gastar():
+                return
+            await precargar("calentamiento", origen_data, destino_data, convertir_fecha_a_redbus((hoy + timedelta(days=dias)).isoformat()))
+
+async def prefetch_loop():
+    # Las precargas van detrás de usuarios y monitoreo en el limitador
+    prioridad_redbus.set("prefetch")
+    await calentar_cache()
+    ultimo_decaimiento = time.monotonic()
+    while True:
+        await asyncio.sleep(CONFIG_PREFETCH["intervalo_segundos"])
+        try:
+            if time.monotonic() - ultimo_decaimiento >= CONFIG_PREFETCH["decaimiento_minutos"] * 60:
+                rutas_populares.decaer()
+                corredores_populares.decaer()
+                ultimo_decaimiento = time.monotonic()
+            await ronda_prefetch()
+        except Exception as e:
+            log_redbus.exception("Error en precarga: %s", e)
+
 @app.on_event("startup")
 async def startup_event():
+    catalogo_serializado()
+    persistencia.abrir()
+    restaurar_estado()
+    entrega_webhooks.iniciar()
     asyncio.create_task(monitor_loop())
-    print("🚀 Sistema de monitoreo iniciado")
+    if persistencia.habilitada:
+        asyncio.create_task(persistencia_loop())
+    asyncio.create_task(medir_retraso_event_loop(metrica_loop_retraso, metrica_loop_retraso_hist))
+    if CONFIG_PREFETCH["habilitado"]:
+        asyncio.create_task(prefetch_loop())
+    log_api.info("Sistema de monitoreo iniciado")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await entrega_webhooks.detener()
+    await volcar_persistencia()
+    if escritura_ciudades is not None:
+        escritura_ciudades.cancel()
+    await escribir_cache_ciudades()
+    persistencia.cerrar()
+    await upstream.cerrar()
+    detener_logs()
 
 async def buscar_ciudad_redbus(nombre_ciudad: str) -> Optional[Dict]:
-    ciudades_principales = {
-        "medellin": {"id": "195160", "name": "Medellin (Ant) (Todos)"},
-        "caucasia": {"id": "195150", "name": "Caucasia (Ant) (Todos)"},
-        "jardin": {"id": "195158", "name": "Jardin (Ant) (Todos)"},
-        "arboletes": {"id": "195102", "name": "Arboletes (Ant) (Todos)"},
-        "urrao": {"id": "195175", "name": "Urrao (Ant) (Todos)"},
-        "ciudad bolivar": {"id": "195153", "name": "Ciudad Bolivar (Ant) (Todos)"},
-        "puerto berrio": {"id": "196351", "name": "Puerto Berrio (Ant) (Todos)"},
-        "rionegro": {"id": "202962", "name": "Rionegro (Ant) (Todos)"},
-        "marinilla": {"id": "202962", "name": "Rionegro (Ant) (Todos)"},
-        "betulia": {"id": "195489", "name": "Betulia (Ant) (Todos)"},
-        "andes": {"id": "195488", "name": "Andes (Ant) (Todos)"},
-        "giraldo": {"id": "195157", "name": "Giraldo (Ant) (Todos)"},
-        "yarumal": {"id": "195545", "name": "Yarumal (Ant) (Todos)"},
-        "bolombolo": {"id": "195490", "name": "Bolombolo (Ant) (Todos)"},
-        "concordia": {"id": "195500", "name": "Concordia (Ant) (Todos)"},
-        "taraza": {"id": "195540", "name": "Taraza (Ant) (Todos)"},
-        "caicedo": {"id": "195491", "name": "Caicedo (Ant) (Todos)"},
-        "santa rosa de osos": {"id": "195816", "name": "Santa Rosa De Osos (Ant) (Todos)"},
-        "monteria": {"id": "195200", "name": "Monteria (Cor) (Todos)"},
-        "planeta rica": {"id": "195548", "name": "Planeta Rica (Cor) (Todos)"},
-        "lorica": {"id": "194924", "name": "Lorica (Cor) (Todos)"},
-        "cerete": {"id": "196158", "name": "Cerete (Cor) (Todos)"},
-        "la apartada": {"id": "195547", "name": "La Apartada (Cor) (Todos)"},
-        "chinu": {"id": "195541", "name": "Chinu (Cor) (Todos)"},
-        "san antero": {"id": "196364", "name": "San Antero (Cor) (Todos)"},
-        "sahagun": {"id": "195550", "name": "Sahagun (Cor) (Todos)"},
-        "sincelejo": {"id": "195243", "name": "Sincelejo (Suc) (Todos)"},
-        "covenas": {"id": "196179", "name": "Covenas (Suc) (Todos)"},
-        "san marcos": {"id": "195565", "name": "San Marcos (Suc) (Todos)"},
-        "tolu": {"id": "196394", "name": "Tolu (Suc) (Todos)"},
-        "barranquilla": {"id": "195179", "name": "Barranquilla (Atl) (Todos)"},
-        "quibdo": {"id": "195175", "name": "Quibdo (Cho) (Todos)"},
-        "istmina": {"id": "196805", "name": "Istmina (Cho) (Todos)"},
-        "condoto": {"id": "195199", "name": "Condoto (Cho) (Todos)"},
-        "tutunendo": {"id": "195531", "name": "Tutunendo (Cho) (Todos)"},
-        "santa marta": {"id": "195215", "name": "Santa Marta (Mag) (Todos)"},
-        "santamarta": {"id": "195215", "name": "Santa Marta (Mag) (Todos)"},
-        "cienaga": {"id": "195553", "name": "Cienaga (Mag) (Todos)"},
-        "palomino": {"id": "196333", "name": "Palomino (Guaj) (Todos)"},
-        "maicao": {"id": "195205", "name": "Maicao (Guaj) (Todos)"},
-        "riohacha": {"id": "195204", "name": "Riohacha (Guaj) (Todos)"},
-        "la dorada": {"id": "195187", "name": "La Dorada (Cal) (Todos)"},
-        "cartagena": {"id": "195181", "name": "Cartagena (Bol) (Todos)"},
-        "magangue": {"id": "196300", "name": "Magangue (Bol) (Todos)"},
-        "san onofre": {"id": "195566", "name": "San Onofre (Suc) (Todos)"},
-        "carmen de bolivar": {"id": "195800", "name": "Carmen De Bolivar (Bol) (Todos)"},
-        "mompox": {"id": "195833", "name": "Mompox (Bol) (Todos)"},
-        "bogota": {"id": "195201", "name": "Bogota (D.C) (Todos)"},
-    }
+    ciudad = indice_ciudades.resolver(nombre_ciudad)
+    if ciudad:
+        return ciudad
     
-    nombre_lower = nombre_ciudad.lower().strip()
-    if nombre_lower in ciudades_principales:
-        return ciudades_principales[nombre_lower]
+    encontrado, ciudad = cache_ciudades.obtener(nombre_ciudad)
+    if encontrado:
+        return ciudad
     
-    url = "https://www.redbus.co/Home/SolarSearch"
+    url = f"{CONFIG_REDBUS['url_base']}/Home/SolarSearch"
     params = {
         "search": nombre_ciudad,
         "parentLocationId": "195120",
@@ -206,108 +634,272 @@ async def buscar_ciudad_redbus(nombre_ciudad: str) -> Optional[Dict]:
     }
     
     try:
-        response = await client.get(url, params=params, headers=headers)
-        if response.status_code == 200:
-            data = response.json()
-            docs = data.get("response", {}).get("docs", [])
-            for doc in docs:
-                if doc.get("locationType") == "CITY":
-                    return {"id": str(doc.get("ID")), "name": doc.get("Name")}
-            if docs and len(docs) > 0:
-                return {"id": str(docs[0].get("ID")), "name": docs[0].get("Name")}
-        return None
+        inicio = time.perf_counter()
+        response = await upstream.get(url, "solar", params=params, headers=headers)
+        metrica_redbus_latencia.observar(time.perf_counter() - inicio, "solar", "")
+        metrica_redbus_respuestas.inc("solar", response.status_code)
+        if response.status_code != 200:
+            return None
+        data = cargar_json(response.content)
+        docs = data.get("response", {}).get("docs", [])
+        ciudad = None
+        for doc in docs:
+            if doc.get("locationType") == "CITY":
+                ciudad = {"id": str(doc.get("ID")), "name": doc.get("Name")}
+                break
+        if ciudad is None and docs:
+            ciudad = {"id": str(docs[0].get("ID")), "name": docs[0].get("Name")}
+        cache_ciudades.guardar(nombre_ciudad, ciudad)
+        programar_escritura_ciudades()
+        return ciudad
+    except RedBusNoDisponible:
+        raise
     except Exception as e:
-        print(f"Error buscando ciudad: {e}")
+        metrica_redbus_errores.inc("solar", type(e).__name__)
+        log_redbus.warning("Error buscando ciudad %s: %s", nombre_ciudad, e)
         return None
 
-async def buscar_redbus_dinamico(origen: str, destino: str, fecha: str):
-    """Busca en redBus con PAGINACIÓN para obtener TODOS los resultados"""
-    origen_data = await buscar_ciudad_redbus(origen)
-    destino_data = await buscar_ciudad_redbus(destino)
+async def buscar_redbus_dinamico(origen: str, destino: str, fecha: str, gracia: float = 0, max_edad: Optional[float] = None,
+                                 plazo: Optional[float] = None):
+    """Busca en redBus con PAGINACIÓN para obtener TODOS los resultados.
+
+    Los resultados se guardan en cache por (origen, destino, fecha) y las
+    búsquedas simultáneas de la misma ruta comparten una sola consulta.
+    `gracia` y `max_edad` se pasan a la cache (stale-while-revalidate).
+    Pasado `plazo` se responde con las páginas que llegaron (ver consultar_paginas_redbus).
+    """
+    origen_data, destino_data = await resolver_ruta(origen, destino)
+    snapshot = await buscar_ruta_resuelta(origen_data, destino_data, fecha, gracia=gracia, max_edad=max_edad, plazo=plazo)
+    
+    return {
+        "origen": origen_data,
+        "destino": destino_data,
+        "resultados": list(snapshot.buses),
+        "snapshot": snapshot
+    }
+
+async def resolver_ruta(origen: str, destino: str):
+    origen_data, destino_data = await asyncio.gather(buscar_ciudad_redbus(origen), buscar_ciudad_redbus(destino))
     
     if not origen_data:
         raise HTTPException(404, f"No se encontró la ciudad origen: {origen}")
     if not destino_data:
         raise HTTPException(404, f"No se encontró la ciudad destino: {destino}")
+    return origen_data, destino_data
+
+async def buscar_ruta_resuelta(origen_data: Dict, destino_data: Dict, fecha: str, forzar: bool = False,
+                               gracia: float = 0, max_edad: Optional[float] = None,
+                               plazo: Optional[float] = None, contar_popularidad: bool = True) -> SnapshotResultados:
+    """Snapshot de la ruta/fecha desde la cache o, si no está (o `forzar`), desde RedBus.
+
+    Los resultados parciales no se guardan en la cache. Quien se suma a una
+    consulta en curso recibe lo que obtenga esa consulta, con el plazo de
+    quien la inició. Las búsquedas de usuarios cuentan para el prefetch salvo
+    con `contar_popularidad=False`; `forzar` (precargas) no cuenta en las
+    estadísticas de la cache.
+    """
+    clave = (origen_data["id"], destino_data["id"], fecha)
+    ruta_actual.set(f"{origen_data['name']} -> {destino_data['name']} {fecha}")
+    if contar_popularidad and prioridad_redbus.get() == "interactivo":
+        rutas_populares.registrar(clave, (origen_data, destino_data))
+        corredores_populares.registrar(clave[:2], (origen_data, destino_data))
     
-    todos_los_buses = []
-    offset = 0
-    limit = 100
-    max_paginas = 5
+    async def cargar():
+        return await consultar_paginas_redbus(origen_data, destino_data, fecha, plazo)
     
-    for pagina in range(max_paginas):
-        url = "https://www.redbus.co/search/SearchV4Results"
-        
-        params = {
-            "fromCity": origen_data["id"],
-            "toCity": destino_data["id"],
-            "src": origen_data["name"],
-            "dst": destino_data["name"],
-            "DOJ": fecha,
-            "sectionId": "0",
-            "groupId": "0",
-            "limit": str(limit),
-            "offset": str(offset),
-            "sort": "0",
-            "sortOrder": "0",
-            "meta": "true",
-            "returnSearch": "0"
-        }
-        
-        headers = {
-            "accept": "application/json, text/plain, */*",
-            "content-type": "application/json",
-            "origin": "https://www.redbus.co",
-            "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-        }
-        
-        payload = {
-            "AcType": [], "CampaignFilter": [], "SeaterType": [],
-            "amtList": [], "at": [], "bcf": [], "bpIdentifier": [],
-            "bpList": [], "dpList": [], "dt": [], "onlyShow": [],
-            "opBusTypeFilterList": [], "persuasionList": [],
-            "rtcBusTypeList": [], "travelsList": []
-        }
-        
-        try:
-            response = await client.post(url, params=params, json=payload, headers=headers)
-            
-            if response.status_code == 200:
-                data = response.json()
-                
-                # DEBUG: Información detallada
-                inventories = data.get("inventories", [])
-                print(f"🔍 DEBUG Página {pagina + 1}:")
-                print(f"   - Status: {response.status_code}")
-                print(f"   - Total inventories en response: {len(inventories)}")
-                print(f"   - Tiene más resultados (hasMoreResults): {data.get('hasMoreResults', 'N/A')}")
-                print(f"   - Total count: {data.get('totalCount', 'N/A')}")
-                print(f"   - Offset actual: {offset}")
-                print(f"   - Limit: {limit}")
-                
-                buses_pagina = normalizar_resultados_redbus(data)
-                
-                if not buses_pagina:
-                    print(f"✅ Paginación completa. Total buses acumulados: {len(todos_los_buses)}")
-                    break
-                
-                todos_los_buses.extend(buses_pagina)
-                print(f"📄 Página {pagina + 1}: {len(buses_pagina)} buses normalizados. Total acumulado: {len(todos_los_buses)}")
-                
-                offset += limit
-            else:
-                print(f"⚠️ Error HTTP {response.status_code} en página {pagina + 1}")
+    guardar_si = lambda resultado: len(resultado) > 0 and not resultado.parcial
+    try:
+        if forzar:
+            return await cache_busquedas.refrescar(clave, cargar, guardar_si=guardar_si)
+        return await cache_busquedas.obtener(clave, cargar, guardar_si=guardar_si, gracia=gracia, max_edad=max_edad)
+    except RedBusNoDisponible as e:
+        # Con RedBus caído o saturado, mejor el último resultado conocido que un error
+        snapshot = cache_busquedas.obtener_vencido(clave)
+        if snapshot is None:
+            raise
+        log_redbus.warning("%s: se responde con resultado vencido de la cache", e)
+        return snapshot
+
+async def consultar_paginas_redbus(origen_data: Dict, destino_data: Dict, fecha: str,
+                                   plazo: Optional[float] = None) -> SnapshotResultados:
+    """Junta las páginas de iterar_paginas_redbus en orden de página.
+
+    Si se cumple `plazo` (segundos desde que empieza) se cancelan las páginas
+    en vuelo y el snapshot queda parcial; también si alguna página falla.
+    """
+    paginas = {}
+    progreso = {"paginas": None}
+    iterador = iterar_paginas_redbus(origen_data, destino_data, fecha, progreso)
+    loop = asyncio.get_running_loop()
+    limite = None if plazo is None else loop.time() + plazo
+    vencido = False
+    try:
+        while True:
+            restante = None if limite is None else limite - loop.time()
+            try:
+                pagina, buses_pagina = await asyncio.wait_for(iterador.__anext__(), restante)
+            except StopAsyncIteration:
                 break
-                
-        except Exception as e:
-            print(f"❌ Error en página {pagina + 1}: {e}")
-            break
+            except asyncio.TimeoutError:
+                vencido = True
+                break
+            paginas[pagina] = buses_pagina
+    finally:
+        await iterador.aclose()
     
-    return {
-        "origen": origen_data,
-        "destino": destino_data,
-        "resultados": todos_los_buses
+    faltantes = [pagina + 1 for pagina in range(progreso["paginas"] or 1) if pagina not in paginas]
+    todos_los_buses = combinar_paginas([paginas[pagina] for pagina in sorted(paginas)])
+    metrica_buses_busqueda.observar(len(todos_los_buses))
+    if faltantes:
+        motivo = "plazo" if vencido else "error"
+        metrica_busquedas_parciales.inc(motivo)
+        log_redbus.warning("Paginación parcial (%s): %d páginas, %d buses, faltan %s",
+                           motivo, len(paginas), len(todos_los_buses), faltantes)
+    else:
+        log_redbus.info("Paginación completa: %d páginas, %d buses", len(paginas), len(todos_los_buses))
+    return SnapshotResultados(todos_los_buses, faltantes)
+
+async def iterar_paginas_redbus(origen_data: Dict, destino_data: Dict, fecha: str, progreso: Optional[Dict] = None):
+    """Entrega (número de página, buses normalizados) a medida que llega cada página.
+
+    Pide la primera página sola y, con totalCount, el resto en paralelo; las
+    páginas restantes salen en orden de llegada, no de número. Las páginas
+    que fallan no se entregan; en `progreso["paginas"]` queda el total esperado.
+    """
+    limit = CONFIG_REDBUS["limite_pagina"]
+    max_paginas = CONFIG_REDBUS["max_paginas"]
+    
+    primera = await pedir_pagina_redbus(origen_data, destino_data, fecha, 0, limit)
+    if primera is None:
+        return
+    
+    buses_primera = normalizar_resultados_redbus(primera)
+    restantes = calcular_paginas_restantes(primera, limit, max_paginas)
+    if not buses_primera:
+        restantes = 0
+    if progreso is not None:
+        progreso["paginas"] = 1 + max(0, restantes)
+    yield 0, buses_primera
+    
+    if restantes <= 0:
+        return
+    
+    semaforo = asyncio.Semaphore(CONFIG_REDBUS["paginas_concurrentes"])
+    
+    async def pedir(pagina: int):
+        async with semaforo:
+            try:
+                return pagina, await pedir_pagina_redbus(origen_data, destino_data, fecha, pagina, limit)
+            except RedBusNoDisponible:
+                return pagina, None
+    
+    tareas = [asyncio.ensure_future(pedir(pagina)) for pagina in range(1, restantes + 1)]
+    try:
+        for siguiente in asyncio.as_completed(tareas):
+            pagina, data = await siguiente
+            if data is not None:
+                yield pagina, normalizar_resultados_redbus(data)
+    finally:
+        # Si el consumidor se va (cliente desconectado o plazo vencido), no seguir pidiendo páginas
+        for tarea in tareas:
+            tarea.cancel()
+
+async def pedir_pagina_redbus(origen_data: Dict, destino_data: Dict, fecha: str, pagina: int, limit: int) -> Optional[Dict]:
+    url = f"{CONFIG_REDBUS['url_base']}/search/SearchV4Results"
+    offset = pagina * limit
+    
+    params = {
+        "fromCity": origen_data["id"],
+        "toCity": destino_data["id"],
+        "src": origen_data["name"],
+        "dst": destino_data["name"],
+        "DOJ": fecha,
+        "sectionId": "0",
+        "groupId": "0",
+        "limit": str(limit),
+        "offset": str(offset),
+        "sort": "0",
+        "sortOrder": "0",
+        "meta": "true",
+        "returnSearch": "0"
+    }
+    
+    headers = {
+        "accept": "application/json, text/plain, */*",
+        "content-type": "application/json",
+        "origin": "https://www.redbus.co",
+        "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+    }
+    
+    payload = {
+        "AcType": [], "CampaignFilter": [], "SeaterType": [],
+        "amtList": [], "at": [], "bcf": [], "bpIdentifier": [],
+        "bpList": [], "dpList": [], "dt": [], "onlyShow": [],
+        "opBusTypeFilterList": [], "persuasionList": [],
+        "rtcBusTypeList": [], "travelsList": []
     }
+    
+    try:
+        inicio = time.perf_counter()
+        response = await upstream.post(url, "search", params=params, json=payload, headers=headers)
+        metrica_redbus_latencia.observar(time.perf_counter() - inicio, "search", pagina + 1)
+        metrica_redbus_respuestas.inc("search", response.status_code)
+        
+        if response.status_code == 200:
+            data = cargar_json(response.content)
+            if log_redbus.isEnabledFor(logging.DEBUG):
+                log_redbus.debug("Página %d recibida", pagina + 1, extra={"datos": {
+                    "pagina": pagina + 1,
+                    "status": response.status_code,
+                    "inventories": len(data.get("inventories", [])),
+                    "has_more_results": data.get("hasMoreResults"),
+                    "total_count": data.get("totalCount"),
+                    "offset": offset,
+                    "limit": limit,
+                }})
+            return data
+        
+        log_redbus.warning("Error HTTP %d en página %d", response.status_code, pagina + 1)
+        return None
+    except RedBusNoDisponible:
+        raise
+    except Exception as e:
+        metrica_redbus_errores.inc("search", type(e).__name__)
+        log_redbus.warning("Error en página %d: %s", pagina + 1, e)
+        return None
+
+def calcular_paginas_restantes(data: Dict, limit: int, max_paginas: int) -> int:
+    """Cuántas páginas faltan después de la primera según totalCount/hasMoreResults"""
+    try:
+        total = int(data.get("totalCount") or 0)
+    except (TypeError, ValueError):
+        total = 0
+    
+    if total > 0:
+        paginas = -(-total // limit)
+    elif data.get("hasMoreResults") or len(data.get("inventories", [])) >= limit:
+        # Sin totalCount no se sabe dónde termina: se piden todas y las vacías se ignoran
+        paginas = max_paginas
+    else:
+        paginas = 1
+    
+    return min(paginas, max_paginas) - 1
+
+def clave_bus(bus: Dict) -> tuple:
+    return (bus["empresa"], bus["servicio"], bus["tipo_bus"], bus["fecha_salida"], bus["fecha_llegada"], bus["punto_embarque"])
+
+def combinar_paginas(paginas: List[List[Dict]]) -> List[Dict]:
+    """Une las páginas en orden, quitando buses repetidos entre páginas"""
+    vistos = set()
+    buses = []
+    for buses_pagina in paginas:
+        for bus in buses_pagina:
+            clave = clave_bus(bus)
+            if clave in vistos:
+                continue
+            vistos.add(clave)
+            buses.append(bus)
+    return buses
 
 def normalizar_resultados_redbus(data: dict) -> List[Dict]:
     resultados = []
@@ -342,6 +934,7 @@ def normalizar_resultados_redbus(data: dict) -> List[Dict]:
             }
             resultados.append(resultado)
         except Exception as e:
+            metrica_normalizacion_fallida.inc()
             continue
     return resultados
 
@@ -361,6 +954,33 @@ def convertir_fecha_a_redbus(fecha_input: str) -> str:
     except:
         raise HTTPException(400, "Formato de fecha inválido")
 
+MESES_REDBUS = {"Jan": 1, "Feb": 2, "Mar": 3, "Apr": 4, "May": 5, "Jun": 6,
+                "Jul": 7, "Aug": 8, "Sep": 9, "Oct": 10, "Nov": 11, "Dec": 12}
+
+def parsear_fecha(fecha_input: str) -> datetime:
+    """Acepta los mismos formatos que convertir_fecha_a_redbus (incluido 23-Nov-2025)"""
+    for fmt in ["%Y-%m-%d", "%d-%m-%Y", "%d/%m/%Y"]:
+        try:
+            return datetime.strptime(fecha_input, fmt)
+        except ValueError:
+            continue
+    partes = fecha_input.split("-")
+    if len(partes) == 3 and partes[1] in MESES_REDBUS:
+        try:
+            return datetime(int(partes[2]), MESES_REDBUS[partes[1]], int(partes[0]))
+        except ValueError:
+            pass
+    raise ValueError(f"Formato de fecha no válido: {fecha_input}")
+
+def parsear_fecha_salida(fecha_salida: str) -> Optional[datetime]:
+    """fecha_salida de RedBus viene como '2025-11-23 19:00:00'"""
+    for fmt in ["%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%d-%m-%Y %H:%M:%S"]:
+        try:
+            return datetime.strptime(fecha_salida, fmt)
+        except (TypeError, ValueError):
+            continue
+    return None
+
 def agrupar_por_departamento(ciudades):
     departamentos = {}
     for ciudad in ciudades:
@@ -377,9 +997,21 @@ async def health_check():
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
         "service": "Buscador Buses Colombia",
-        "version": "1.0.1"
+        "version": "1.0.1",
+        "cache": cache_busquedas.estadisticas(),
+        "redbus": {
+            "circuito": upstream.circuito.estado,
+            "fallos_seguidos": upstream.circuito.fallos_seguidos,
+            "en_cola": {prioridad: upstream.limitador.en_cola(prioridad) for prioridad in PRIORIDADES}
+        },
+        "webhooks": entrega_webhooks.estadisticas()
     }
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metricas():
+    """Métricas en formato Prometheus (por proceso/worker)"""
+    return PlainTextResponse(registro_metricas.exponer(), media_type="text/plain; version=0.0.4")
+
 @app.get("/")
 async def root():
     return {
@@ -390,110 +1022,405 @@ async def root():
         "endpoints": {
             "GET /": "Info",
             "GET /health": "Health check (mantener activa)",
+            "GET /metrics": "Métricas Prometheus",
             "GET /ciudades": "Ciudades",
+            "GET /autocompletar": "Sugerencias de ciudades",
             "GET /buscar": "Todas empresas",
+            "GET /buscar-stream": "Todas empresas, bus por bus (NDJSON/SSE)",
             "GET /buscar-rapido-ochoa": "Solo Ochoa",
             "GET /buscar-avanzado": "Filtros",
+            "GET /buscar-rango": "Calendario de tarifas por día",
+            "POST /buscar-lote": "Muchas rutas en una petición (NDJSON)",
             "GET /verificar-disponibilidad": "Tiempo real",
             "POST /monitorear": "Monitorear",
-            "GET /alertas": "Alertas"
+            "GET /series": "Historial de asientos, velocidad de venta y agotamiento por viaje",
+            "GET /alertas": "Alertas",
+            "GET /alertas/stream": "Alertas en vivo (SSE)",
+            "POST /webhooks": "Enviar alertas a una URL",
+            "GET /webhooks": "Webhooks registrados y estado de entrega"
         },
         "docs": "/docs"
     }
 
+cuerpo_ciudades: Optional[CuerpoPrecalculado] = None
+
+def catalogo_serializado() -> CuerpoPrecalculado:
+    """El catálogo no cambia mientras corre el proceso: se arma y serializa una sola vez"""
+    global cuerpo_ciudades
+    if cuerpo_ciudades is None:
+        cuerpo_ciudades = CuerpoPrecalculado({
+            "total": len(CATALOGO_CIUDADES),
+            "ciudades": sorted(CATALOGO_CIUDADES, key=lambda x: x["nombre"]),
+            "por_departamento": agrupar_por_departamento(CATALOGO_CIUDADES)
+        })
+    return cuerpo_ciudades
+
 @app.get("/ciudades")
-async def obtener_ciudades():
-    ciudades = [
-        {"nombre": "Medellín", "departamento": "Antioquia", "slug": "medellin"},
-        {"nombre": "Caucasia", "departamento": "Antioquia", "slug": "caucasia"},
-        {"nombre": "Jardín", "departamento": "Antioquia", "slug": "jardin"},
-        {"nombre": "Arboletes", "departamento": "Antioquia", "slug": "arboletes"},
-        {"nombre": "Urrao", "departamento": "Antioquia", "slug": "urrao"},
-        {"nombre": "Ciudad Bolívar", "departamento": "Antioquia", "slug": "ciudad bolivar"},
-        {"nombre": "Puerto Berrío", "departamento": "Antioquia", "slug": "puerto berrio"},
-        {"nombre": "Rionegro - Marinilla", "departamento": "Antioquia", "slug": "rionegro"},
-        {"nombre": "Betulia", "departamento": "Antioquia", "slug": "betulia"},
-        {"nombre": "Andes", "departamento": "Antioquia", "slug": "andes"},
-        {"nombre": "Giraldo", "departamento": "Antioquia", "slug": "giraldo"},
-        {"nombre": "Yarumal", "departamento": "Antioquia", "slug": "yarumal"},
-        {"nombre": "Bolombolo", "departamento": "Antioquia", "slug": "bolombolo"},
-        {"nombre": "Concordia", "departamento": "Antioquia", "slug": "concordia"},
-        {"nombre": "Tarazá", "departamento": "Antioquia", "slug": "taraza"},
-        {"nombre": "Caicedo", "departamento": "Antioquia", "slug": "caicedo"},
-        {"nombre": "Barranquilla", "departamento": "Atlántico", "slug": "barranquilla"},
-        {"nombre": "Cartagena", "departamento": "Bolívar", "slug": "cartagena"},
-        {"nombre": "Magangué", "departamento": "Bolívar", "slug": "magangue"},
-        {"nombre": "San Onofre", "departamento": "Bolívar", "slug": "san onofre"},
-        {"nombre": "Carmen de Bolívar", "departamento": "Bolívar", "slug": "carmen de bolivar"},
-        {"nombre": "Mompox", "departamento": "Bolívar", "slug": "mompox"},
-        {"nombre": "La Dorada", "departamento": "Caldas", "slug": "la dorada"},
-        {"nombre": "Quibdó", "departamento": "Chocó", "slug": "quibdo"},
-        {"nombre": "Istmina", "departamento": "Chocó", "slug": "istmina"},
-        {"nombre": "Condoto", "departamento": "Chocó", "slug": "condoto"},
-        {"nombre": "Tutunendo", "departamento": "Chocó", "slug": "tutunendo"},
-        {"nombre": "Montería", "departamento": "Córdoba", "slug": "monteria"},
-        {"nombre": "Planeta Rica", "departamento": "Córdoba", "slug": "planeta rica"},
-        {"nombre": "Lorica", "departamento": "Córdoba", "slug": "lorica"},
-        {"nombre": "Cereté", "departamento": "Córdoba", "slug": "cerete"},
-        {"nombre": "La Apartada", "departamento": "Córdoba", "slug": "la apartada"},
-        {"nombre": "Chinú", "departamento": "Córdoba", "slug": "chinu"},
-        {"nombre": "San Antero", "departamento": "Córdoba", "slug": "san antero"},
-        {"nombre": "Bogotá", "departamento": "Cundinamarca", "slug": "bogota"},
-        {"nombre": "Maicao", "departamento": "La Guajira", "slug": "maicao"},
-        {"nombre": "Riohacha", "departamento": "La Guajira", "slug": "riohacha"},
-        {"nombre": "Santa Marta", "departamento": "Magdalena", "slug": "santa marta"},
-        {"nombre": "Ciénaga", "departamento": "Magdalena", "slug": "cienaga"},
-        {"nombre": "Sincelejo", "departamento": "Sucre", "slug": "sincelejo"},
-        {"nombre": "Coveñas", "departamento": "Sucre", "slug": "covenas"},
-        {"nombre": "San Marcos", "departamento": "Sucre", "slug": "san marcos"},
-        {"nombre": "Tolú", "departamento": "Sucre", "slug": "tolu"},
-        {"nombre": "Sahagún", "departamento": "Sucre", "slug": "sahagun"},
-    ]
+async def obtener_ciudades(if_none_match: Optional[str] = Header(None)):
+    return catalogo_serializado().responder(if_none_match, f"public, max-age={CONFIG_RESPUESTAS['max_edad_ciudades']}")
+
+@app.get("/autocompletar")
+async def autocompletar_ciudad(q: str, limite: int = 10):
+    """Sugerencias de ciudades mientras el usuario escribe (sin tildes, abreviaturas y errores leves)"""
+    sugerencias = indice_ciudades.autocompletar(q, max(1, min(limite, 50)))
+    return {"consulta": q, "total": len(sugerencias), "sugerencias": sugerencias}
+
+def responder(datos: Dict, headers: Optional[Dict] = None):
+    """Respuestas grandes de búsqueda: con json_rapido se serializan con orjson sin pasar por jsonable_encoder"""
+    if CONFIG_RESPUESTAS["json_rapido"]:
+        return RespuestaJSON(datos, headers=headers)
+    return JSONResponse(datos, headers=headers) if headers else datos
+
+def estado_resultado(snapshot: SnapshotResultados) -> Dict:
+    """Cuándo se consultó RedBus, si el resultado ya pasó el TTL (servido en gracia o con RedBus
+    caído) y si le faltan páginas"""
     return {
-        "total": len(ciudades),
-        "ciudades": sorted(ciudades, key=lambda x: x["nombre"]),
-        "por_departamento": agrupar_por_departamento(ciudades)
+        "actualizado_en": datetime.fromtimestamp(snapshot.creado_en).isoformat(timespec="seconds"),
+        "desactualizado": time.time() - snapshot.creado_en >= cache_busquedas.ttl,
+        "parcial": snapshot.parcial,
+        "paginas_faltantes": snapshot.paginas_faltantes
     }
 
+def leer_campos(campos: Optional[str], limite: Optional[int] = None):
+    """Valida `campos` y `limite` antes de buscar; devuelve los campos como tupla (None = todos)"""
+    if limite is not None and not 1 <= limite <= CONFIG_RESPUESTAS["max_limite"]:
+        raise HTTPException(400, f"limite debe estar entre 1 y {CONFIG_RESPUESTAS['max_limite']}")
+    try:
+        return parsear_campos(campos)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+def paginar_filas(snapshot: SnapshotResultados, indices: List[int], campos, limite: Optional[int],
+                  cursor: Optional[str]) -> Dict:
+    """Filas de la página pedida, armadas solo con `campos`, y el cursor de la siguiente"""
+    try:
+        tramo, siguiente, de_otro_resultado = snapshot.pagina(indices, limite, cursor)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    datos = {"horarios": snapshot.filas(tramo, campos), "siguiente_cursor": siguiente}
+    if de_otro_resultado:
+        datos["cursor_de_resultado_anterior"] = True
+    return datos
+
+def plazo_de(endpoint: str, plazo: Optional[float]) -> float:
+    """El plazo pedido o, si no vino, el configurado para el endpoint"""
+    if plazo is None:
+        return CONFIG_REDBUS["plazos"][endpoint]
+    if not 0 < plazo <= CONFIG_REDBUS["plazo_maximo"]:
+        raise HTTPException(400, f"plazo debe ser mayor que 0 y hasta {CONFIG_REDBUS['plazo_maximo']} segundos")
+    return plazo
+
+def header_age(snapshot: SnapshotResultados) -> Dict:
+    return {"Age": str(max(0, int(time.time() - snapshot.creado_en)))}
+
 @app.get("/buscar")
-async def endpoint_buscar(origen: str, destino: str, fecha: str, empresa: Optional[str] = None):
+async def endpoint_buscar(origen: str, destino: str, fecha: str, empresa: Optional[str] = None,
+                          max_edad: Optional[int] = None, plazo: Optional[float] = None,
+                          campos: Optional[str] = None, limite: Optional[int] = None, cursor: Optional[str] = None,
+                          if_none_match: Optional[str] = Header(None)):
+    """Con If-None-Match igual al ETag de la respuesta anterior devuelve 304 sin cuerpo.
+
+    Un resultado vencido hace poco se devuelve al instante (`desactualizado`,
+    header `Age`) mientras se refresca; `max_edad` (segundos) exige uno más nuevo.
+    Si RedBus no entrega todas las páginas en `plazo` segundos la respuesta
+    trae las que llegaron, con `parcial` y `paginas_faltantes`.
+    `campos` (separados por coma) elige los campos de cada bus y `limite`
+    pagina los horarios; `cursor` = `siguiente_cursor` de la página anterior.
+    """
+    lista_campos = leer_campos(campos, limite)
     fecha_redbus = convertir_fecha_a_redbus(fecha)
-    resultado = await buscar_redbus_dinamico(origen, destino, fecha_redbus)
-    resultados = resultado["resultados"]
-    if empresa:
-        resultados = [r for r in resultados if empresa.lower() in r["empresa"].lower()]
-    resultados.sort(key=lambda x: x["hora_salida"])
-    empresas_disponibles = list(set([r["empresa"] for r in resultados]))
-    return {
-        "exito": True,
-        "origen": {"ciudad": origen.title(), "id": resultado["origen"]["id"], "nombre_completo": resultado["origen"]["name"]},
-        "destino": {"ciudad": destino.title(), "id": resultado["destino"]["id"], "nombre_completo": resultado["destino"]["name"]},
-        "fecha": fecha,
-        "total_buses": len(resultados),
-        "empresas_disponibles": sorted(empresas_disponibles),
-        "horarios": resultados
-    }
+    resultado = await buscar_redbus_dinamico(origen, destino, fecha_redbus, CONFIG_CACHE["gracia_segundos"], max_edad,
+                                             plazo_de("buscar", plazo))
+    snapshot = resultado["snapshot"]
+    estado = estado_resultado(snapshot)
+    
+    def construir():
+        indices = snapshot.seleccionar("hora", empresa=empresa)
+        empresas_disponibles = {snapshot.buses[i]["empresa"] for i in indices}
+        return CuerpoPrecalculado({
+            "exito": True,
+            "origen": {"ciudad": origen.title(), "id": resultado["origen"]["id"], "nombre_completo": resultado["origen"]["name"]},
+            "destino": {"ciudad": destino.title(), "id": resultado["destino"]["id"], "nombre_completo": resultado["destino"]["name"]},
+            "fecha": fecha,
+            **estado,
+            "total_buses": len(indices),
+            "empresas_disponibles": sorted(empresas_disponibles),
+            **paginar_filas(snapshot, indices, lista_campos, limite, cursor)
+        })
+    
+    variante = ("buscar", origen.title(), destino.title(), fecha, empresa, estado["desactualizado"], lista_campos, limite, cursor)
+    cuerpo = snapshot.cuerpo(variante, construir)
+    if snapshot.parcial:
+        return cuerpo.responder(if_none_match, "no-store", header_age(snapshot))
+    vigencia = max(0, int(cache_busquedas.ttl - (time.time() - snapshot.creado_en)))
+    return cuerpo.responder(if_none_match, f"public, max-age={vigencia}", header_age(snapshot))
+
+@app.get("/buscar-stream")
+async def endpoint_buscar_stream(origen: str, destino: str, fecha: str, empresa: Optional[str] = None, formato: str = "ndjson",
+                                 campos: Optional[str] = None):
+    """Como /buscar, pero envía cada bus apenas llega su página de RedBus.
+
+    `formato=ndjson` (una línea JSON por registro) o `formato=sse`. El primer
+    registro describe la ruta, luego un registro por bus y al final un resumen.
+    """
+    if formato not in ("ndjson", "sse"):
+        raise HTTPException(400, "formato debe ser 'ndjson' o 'sse'")
+    lista_campos = leer_campos(campos)
+    fecha_redbus = convertir_fecha_a_redbus(fecha)
+    origen_data, destino_data = await resolver_ruta(origen, destino)
+    clave = (origen_data["id"], destino_data["id"], fecha_redbus)
+    
+    def registro(tipo: str, datos: Dict) -> str:
+        if formato == "sse":
+            return f"event: {tipo}\ndata: {json.dumps(datos, ensure_ascii=False)}\n\n"
+        return json.dumps({"tipo": tipo, **datos}, ensure_ascii=False) + "\n"
+    
+    paginas_faltantes: List[int] = []
+    fallo: Dict = {}
+    
+    async def paginas():
+        """Usa la cache o la búsqueda en curso si existen; si no, consulta RedBus página a página.
+
+        Con RedBus no disponible se entrega el último resultado guardado y, si
+        no hay ninguno, el error queda en `fallo` para el resumen.
+        """
+        snapshot = cache_busquedas.obtener_fresco(clave)
+        recibidas = {}
+        progreso = {"paginas": None}
+        try:
+            if snapshot is None and clave in cache_busquedas.en_vuelo:
+                snapshot = await asyncio.shield(cache_busquedas.en_vuelo[clave])
+            if snapshot is None:
+                async for pagina, buses_pagina in iterar_paginas_redbus(origen_data, destino_data, fecha_redbus, progreso):
+                    recibidas[pagina] = buses_pagina
+                    yield pagina, buses_pagina, False
+        except RedBusNoDisponible as e:
+            snapshot = cache_busquedas.obtener_vencido(clave)
+            if snapshot is None:
+                fallo.update({"error": str(e), "reintentar_en": e.reintentar_en})
+        if snapshot is not None:
+            paginas_faltantes.extend(snapshot.paginas_faltantes)
+            yield 0, snapshot.buses, True
+            return
+        faltantes = [pagina + 1 for pagina in range(progreso["paginas"] or 1) if pagina not in recibidas]
+        completos = combinar_paginas([recibidas[pagina] for pagina in sorted(recibidas)])
+        if completos and not faltantes:
+            cache_busquedas.guardar(clave, SnapshotResultados(completos))
+        paginas_faltantes.extend(faltantes)
+    
+    async def registros():
+        yield registro("ruta", {
+            "origen": {"ciudad": origen.title(), "id": origen_data["id"], "nombre_completo": origen_data["name"]},
+            "destino": {"ciudad": destino.title(), "id": destino_data["id"], "nombre_completo": destino_data["name"]},
+            "fecha": fecha
+        })
+        vistos = set()
+        empresas = set()
+        total_buses = 0
+        total_paginas = 0
+        desde_cache = False
+        async for pagina, buses_pagina, desde_cache in paginas():
+            total_paginas += 1
+            for bus in buses_pagina:
+                clave_unica = clave_bus(bus)
+                if clave_unica in vistos:
+                    continue
+                vistos.add(clave_unica)
+                if empresa and empresa.lower() not in bus["empresa"].lower():
+                    continue
+                empresas.add(bus["empresa"])
+                total_buses += 1
+                if lista_campos is not None:
+                    bus = {campo: bus[campo] for campo in lista_campos}
+                yield registro("bus", {"pagina": pagina + 1, **bus})
+        yield registro("resumen", {
+            # Sin ningún bus y con páginas faltantes no hubo resultado que mostrar
+            "exito": bool(vistos) or not paginas_faltantes,
+            **fallo,
+            "total_buses": total_buses,
+            "empresas_disponibles": sorted(empresas),
+            "paginas": total_paginas,
+            "paginas_faltantes": paginas_faltantes,
+            "desde_cache": desde_cache
+        })
+    
+    media_type = "text/event-stream" if formato == "sse" else "application/x-ndjson"
+    return StreamingResponse(registros(), media_type=media_type, headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.get("/buscar-rapido-ochoa")
-async def buscar_solo_rapido_ochoa(origen: str, destino: str, fecha: str):
+async def buscar_solo_rapido_ochoa(origen: str, destino: str, fecha: str, max_edad: Optional[int] = None,
+                                   plazo: Optional[float] = None, campos: Optional[str] = None,
+                                   limite: Optional[int] = None, cursor: Optional[str] = None):
+    lista_campos = leer_campos(campos, limite)
     fecha_redbus = convertir_fecha_a_redbus(fecha)
-    resultado = await buscar_redbus_dinamico(origen, destino, fecha_redbus)
-    buses_ochoa = [bus for bus in resultado["resultados"] if "ochoa" in bus["empresa"].lower()]
-    buses_ochoa.sort(key=lambda x: x["hora_salida"])
-    return {
+    resultado = await buscar_redbus_dinamico(origen, destino, fecha_redbus, CONFIG_CACHE["gracia_segundos"], max_edad,
+                                             plazo_de("buscar-rapido-ochoa", plazo))
+    snapshot = resultado["snapshot"]
+    indices = snapshot.seleccionar("hora", empresa="ochoa")
+    return responder({
         "exito": True,
         "origen": {"ciudad": origen.title(), "id": resultado["origen"]["id"], "nombre_completo": resultado["origen"]["name"]},
         "destino": {"ciudad": destino.title(), "id": resultado["destino"]["id"], "nombre_completo": resultado["destino"]["name"]},
         "fecha": fecha,
+        **estado_resultado(snapshot),
         "empresa": "Rápido Ochoa",
-        "total_buses": len(buses_ochoa),
-        "horarios": buses_ochoa
+        "total_buses": len(indices),
+        **paginar_filas(snapshot, indices, lista_campos, limite, cursor)
+    }, header_age(snapshot))
+
+@app.get("/buscar-rango")
+async def endpoint_buscar_rango(origen: str, destino: str, fecha_inicio: str, dias: int = 30, plazo: Optional[float] = None):
+    """Calendario de tarifas: resumen por día (precio mínimo, asientos, salidas, Ochoa más barato).
+
+    Las fechas se consultan en paralelo (hasta `fechas_concurrentes` a la vez)
+    y reutilizan la cache de búsquedas cuando existe.
+    """
+    if not 1 <= dias <= CONFIG_REDBUS["max_dias_rango"]:
+        raise HTTPException(400, f"dias debe estar entre 1 y {CONFIG_REDBUS['max_dias_rango']}")
+    try:
+        inicio = parsear_fecha(fecha_inicio)
+    except ValueError:
+        raise HTTPException(400, "Formato de fecha inválido")
+    
+    plazo = plazo_de("buscar-rango", plazo)
+    origen_data, destino_data = await resolver_ruta(origen, destino)
+    semaforo = asyncio.Semaphore(CONFIG_REDBUS["fechas_concurrentes"])
+    
+    async def resumir(fecha: datetime) -> Dict:
+        dia = {"fecha": fecha.strftime("%Y-%m-%d")}
+        try:
+            async with semaforo:
+                # Las fechas del calendario no son búsquedas del usuario: no cuentan para el prefetch
+                snapshot = await buscar_ruta_resuelta(origen_data, destino_data, convertir_fecha_a_redbus(dia["fecha"]),
+                                                      plazo=plazo, contar_popularidad=False)
+            dia.update(snapshot.resumen_dia())
+            if snapshot.parcial:
+                dia["paginas_faltantes"] = snapshot.paginas_faltantes
+        except Exception as e:
+            dia["error"] = str(e)
+        return dia
+    
+    resumen = await asyncio.gather(*[resumir(inicio + timedelta(days=n)) for n in range(dias)])
+    con_precio = [dia for dia in resumen if dia.get("precio_minimo") is not None]
+    con_asientos = [dia for dia in resumen if dia.get("asientos_disponibles")]
+    
+    return {
+        "exito": True,
+        "origen": {"ciudad": origen.title(), "id": origen_data["id"], "nombre_completo": origen_data["name"]},
+        "destino": {"ciudad": destino.title(), "id": destino_data["id"], "nombre_completo": destino_data["name"]},
+        "fecha_inicio": resumen[0]["fecha"],
+        "dias": dias,
+        "dia_mas_barato": min(con_precio, key=lambda dia: dia["precio_minimo"])["fecha"] if con_precio else None,
+        "dia_con_mas_asientos": max(con_asientos, key=lambda dia: dia["asientos_disponibles"])["fecha"] if con_asientos else None,
+        "calendario": resumen
     }
 
+class ConsultaLote(BaseModel):
+    origen: str
+    destino: str
+    fecha: str
+    
+    def como_dict(self) -> Dict:
+        return {"origen": self.origen, "destino": self.destino, "fecha": self.fecha}
+
+class SolicitudLote(BaseModel):
+    consultas: List[ConsultaLote]
+    empresa: Optional[str] = None
+    plazo: Optional[float] = None  # Segundos por consulta
+    campos: Optional[List[str]] = None  # Campos de cada bus; todos si no viene
+
+semaforo_lotes: Optional[asyncio.Semaphore] = None
+
+@app.post("/buscar-lote")
+async def endpoint_buscar_lote(solicitud: SolicitudLote):
+    """Muchas búsquedas (origen, destino, fecha) en una sola petición, respondidas en NDJSON.
+
+    Las ciudades se resuelven una vez, las consultas repetidas se hacen una
+    sola vez (el registro trae todos sus `indices`) y cada resultado se envía
+    apenas termina. Un límite global comparte el ritmo entre todos los lotes.
+    """
+    global semaforo_lotes
+    if len(solicitud.consultas) > CONFIG_REDBUS["max_consultas_lote"]:
+        raise HTTPException(400, f"Máximo {CONFIG_REDBUS['max_consultas_lote']} consultas por lote")
+    plazo = plazo_de("buscar-lote", solicitud.plazo)
+    lista_campos = leer_campos(",".join(solicitud.campos)) if solicitud.campos else None
+    if semaforo_lotes is None:
+        semaforo_lotes = asyncio.Semaphore(CONFIG_REDBUS["lote_concurrencia_global"])
+    
+    async def resolver(nombre: str):
+        # Sin RedBus solo fallan las consultas con esa ciudad, no todo el lote
+        try:
+            return await buscar_ciudad_redbus(nombre)
+        except RedBusNoDisponible as e:
+            return e
+    
+    nombres = {c.origen for c in solicitud.consultas} | {c.destino for c in solicitud.consultas}
+    nombres = list(nombres)
+    ciudades = dict(zip(nombres, await asyncio.gather(*[resolver(nombre) for nombre in nombres])))
+    
+    errores = []
+    unicas: Dict[tuple, Dict] = {}
+    for indice, consulta in enumerate(solicitud.consultas):
+        origen_data, destino_data = ciudades[consulta.origen], ciudades[consulta.destino]
+        try:
+            for data in (origen_data, destino_data):
+                if isinstance(data, RedBusNoDisponible):
+                    raise data
+            if not origen_data:
+                raise ValueError(f"No se encontró la ciudad origen: {consulta.origen}")
+            if not destino_data:
+                raise ValueError(f"No se encontró la ciudad destino: {consulta.destino}")
+            fecha_redbus = convertir_fecha_a_redbus(consulta.fecha)
+        except (ValueError, HTTPException, RedBusNoDisponible) as e:
+            errores.append({"indices": [indice], **consulta.como_dict(), "exito": False, "error": getattr(e, "detail", str(e))})
+            continue
+        clave = (origen_data["id"], destino_data["id"], fecha_redbus)
+        if clave not in unicas:
+            unicas[clave] = {"consulta": consulta, "origen_data": origen_data, "destino_data": destino_data,
+                             "fecha_redbus": fecha_redbus, "indices": []}
+        unicas[clave]["indices"].append(indice)
+    
+    async def buscar(item: Dict) -> Dict:
+        consulta = item["consulta"]
+        registro = {"indices": item["indices"], **consulta.como_dict()}
+        try:
+            async with semaforo_lotes:
+                snapshot = await buscar_ruta_resuelta(item["origen_data"], item["destino_data"], item["fecha_redbus"],
+                                                      plazo=plazo)
+            horarios = snapshot.filas(snapshot.seleccionar("hora", empresa=solicitud.empresa), lista_campos)
+            registro.update({"exito": True, "parcial": snapshot.parcial, "paginas_faltantes": snapshot.paginas_faltantes,
+                             "total_buses": len(horarios), "horarios": horarios})
+        except Exception as e:
+            registro.update({"exito": False, "error": getattr(e, "detail", str(e))})
+        return registro
+    
+    async def registros():
+        for error in errores:
+            yield json.dumps(error, ensure_ascii=False) + "\n"
+        exitosas = 0
+        tareas = [asyncio.ensure_future(buscar(item)) for item in unicas.values()]
+        try:
+            for siguiente in asyncio.as_completed(tareas):
+                registro = await siguiente
+                exitosas += registro["exito"]
+                yield json.dumps(registro, ensure_ascii=False) + "\n"
+        finally:
+            for tarea in tareas:
+                tarea.cancel()
+        yield json.dumps({
+            "resumen": True,
+            "consultas": len(solicitud.consultas),
+            "consultas_unicas": len(unicas),
+            "exitosas": exitosas,
+            "con_error": len(errores) + len(unicas) - exitosas
+        }) + "\n"
+    
+    return StreamingResponse(registros(), media_type="application/x-ndjson")
+
 @app.get("/verificar-disponibilidad")
-async def verificar_disponibilidad(origen: str, destino: str, fecha: str, hora_salida: str):
+async def verificar_disponibilidad(origen: str, destino: str, fecha: str, hora_salida: str, plazo: Optional[float] = None):
     fecha_redbus = convertir_fecha_a_redbus(fecha)
-    resultado = await buscar_redbus_dinamico(origen, destino, fecha_redbus)
+    resultado = await buscar_redbus_dinamico(origen, destino, fecha_redbus, plazo=plazo_de("verificar-disponibilidad", plazo))
     if len(hora_salida.split(":")) == 2:
         hora_salida += ":00"
     bus_encontrado = None
@@ -510,6 +1437,10 @@ async def verificar_disponibilidad(origen: str, destino: str, fecha: str, hora_s
             "estado": "DISPONIBLE" if bus_encontrado["asientos_disponibles"] > 10 else "POCOS ASIENTOS" if bus_encontrado["asientos_disponibles"] > 0 else "AGOTADO",
             "bus": bus_encontrado
         }
+    if resultado["snapshot"].parcial:
+        # Puede estar en una página que no llegó
+        return {"disponible": False, "mensaje": "Bus no encontrado en las páginas recibidas", "parcial": True,
+                "paginas_faltantes": resultado["snapshot"].paginas_faltantes}
     return {"disponible": False, "mensaje": "Bus no encontrado"}
 
 @app.get("/buscar-avanzado")
@@ -526,45 +1457,41 @@ async def endpoint_buscar_avanzado(
     solo_ac: Optional[bool] = None,
     solo_cama: Optional[bool] = None,
     rating_min: Optional[float] = None,
-    ordenar_por: Optional[str] = "hora"
+    ordenar_por: Optional[str] = "hora",
+    max_edad: Optional[int] = None,
+    plazo: Optional[float] = None,
+    campos: Optional[str] = None,
+    limite: Optional[int] = None,
+    cursor: Optional[str] = None
 ):
+    lista_campos = leer_campos(campos, limite)
     fecha_redbus = convertir_fecha_a_redbus(fecha)
-    resultado = await buscar_redbus_dinamico(origen, destino, fecha_redbus)
-    resultados = resultado["resultados"]
-    
-    if empresa:
-        resultados = [r for r in resultados if empresa.lower() in r["empresa"].lower()]
-    if precio_min is not None:
-        resultados = [r for r in resultados if r["precio_total"] >= precio_min]
-    if precio_max is not None:
-        resultados = [r for r in resultados if r["precio_total"] <= precio_max]
-    if hora_min:
-        resultados = [r for r in resultados if r["hora_salida"] >= hora_min]
-    if hora_max:
-        resultados = [r for r in resultados if r["hora_salida"] <= hora_max]
-    if asientos_min is not None:
-        resultados = [r for r in resultados if r["asientos_disponibles"] >= asientos_min]
-    if solo_ac:
-        resultados = [r for r in resultados if r["es_ac"]]
-    if solo_cama:
-        resultados = [r for r in resultados if r["es_cama"]]
-    if rating_min is not None:
-        resultados = [r for r in resultados if r["rating"] >= rating_min]
-    
-    if ordenar_por == "precio":
-        resultados.sort(key=lambda x: x["precio_total"])
-    elif ordenar_por == "duracion":
-        resultados.sort(key=lambda x: x["duracion_minutos"])
-    elif ordenar_por == "rating":
-        resultados.sort(key=lambda x: x["rating"], reverse=True)
-    else:
-        resultados.sort(key=lambda x: x["hora_salida"])
+    resultado = await buscar_redbus_dinamico(origen, destino, fecha_redbus, CONFIG_CACHE["gracia_segundos"], max_edad,
+                                             plazo_de("buscar-avanzado", plazo))
+    snapshot = resultado["snapshot"]
     
-    return {
+    try:
+        indices = snapshot.seleccionar(
+            ordenar_por,
+            empresa=empresa,
+            precio_min=precio_min,
+            precio_max=precio_max,
+            hora_min=hora_min,
+            hora_max=hora_max,
+            asientos_min=asientos_min,
+            solo_ac=solo_ac,
+            solo_cama=solo_cama,
+            rating_min=rating_min
+        )
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    
+    return responder({
         "exito": True,
         "origen": {"ciudad": origen.title(), "id": resultado["origen"]["id"], "nombre_completo": resultado["origen"]["name"]},
         "destino": {"ciudad": destino.title(), "id": resultado["destino"]["id"], "nombre_completo": resultado["destino"]["name"]},
         "fecha": fecha,
+        **estado_resultado(snapshot),
         "filtros_aplicados": {
             "empresa": empresa,
             "precio_min": precio_min,
@@ -577,9 +1504,9 @@ async def endpoint_buscar_avanzado(
             "rating_min": rating_min,
             "ordenar_por": ordenar_por
         },
-        "total_buses": len(resultados),
-        "horarios": resultados
-    }
+        "total_buses": len(indices),
+        **paginar_filas(snapshot, indices, lista_campos, limite, cursor)
+    }, header_age(snapshot))
 
 @app.post("/monitorear")
 async def crear_monitor(
@@ -592,6 +1519,9 @@ async def crear_monitor(
 ):
     monitor = MonitorRuta(origen, destino, fecha, horario_especifico, empresa_especifica)
     rutas_monitoreadas[monitor.id] = monitor
+    # Primera revisión inmediata; después el planificador decide la frecuencia
+    planificador.programar(monitor.id, datetime.now().timestamp())
+    persistencia.guardar_monitor(monitor)
     
     return {
         "exito": True,
@@ -610,8 +1540,7 @@ async def crear_monitor(
 @app.delete("/monitorear/{monitor_id}")
 async def detener_monitor(monitor_id: str):
     if monitor_id in rutas_monitoreadas:
-        rutas_monitoreadas[monitor_id].activo = False
-        del rutas_monitoreadas[monitor_id]
+        retirar_monitor(monitor_id)
         return {"exito": True, "mensaje": f"Monitor {monitor_id} detenido"}
     raise HTTPException(404, "Monitor no encontrado")
 
@@ -627,18 +1556,183 @@ async def listar_monitores():
             "horario_especifico": monitor.horario_especifico,
             "empresa_especifica": monitor.empresa_especifica,
             "activo": monitor.activo,
-            "ultima_revision": monitor.ultima_revision.isoformat() if monitor.ultima_revision else None
+            "ultima_revision": monitor.ultima_revision.isoformat() if monitor.ultima_revision else None,
+            "proxima_revision": datetime.fromtimestamp(monitor.proxima_revision).isoformat() if monitor.proxima_revision else None,
+            "ultimos_asientos": monitor.ultimos_asientos,
+            "velocidad_venta": round(monitor.velocidad_venta, 2)
         })
     return {"total": len(monitores), "monitores": monitores}
 
+@app.get("/series")
+async def obtener_series(
+    origen: str,
+    destino: str,
+    fecha: str,
+    hora: Optional[str] = None,
+    empresa: Optional[str] = None,
+    incluir_puntos: bool = True,
+    ventana_horas: Optional[float] = None
+):
+    """Historial de asientos y precio por viaje de una ruta monitoreada, velocidad de venta y agotamiento estimado.
+
+    Solo hay datos para rutas con monitores activos (POST /monitorear). `hora`
+    y `empresa` filtran como en el monitoreo (prefijo de hora, parte del nombre).
+    """
+    ventana = (ventana_horas or CONFIG_SERIES["ventana_velocidad_horas"]) * 3600
+    viajes = []
+    for (hora_salida, nombre_empresa, servicio), serie in series_viajes.viajes(clave_ruta_series(origen, destino, convertir_fecha_a_redbus(fecha))).items():
+        if hora and not hora_salida.startswith(hora):
+            continue
+        if empresa and empresa.lower() not in nombre_empresa.lower():
+            continue
+        velocidad = serie.velocidad(ventana)
+        agotamiento = serie.agotamiento_estimado(velocidad)
+        viaje = {
+            "empresa": nombre_empresa,
+            "hora_salida": hora_salida,
+            "servicio": servicio,
+            "salida": datetime.fromtimestamp(serie.salida).isoformat() if serie.salida else None,
+            "asientos_disponibles": serie.asientos[-1],
+            "precio_total": serie.precios[-1],
+            "velocidad_venta": round(velocidad, 2),
+            "agotamiento_estimado": datetime.fromtimestamp(agotamiento).isoformat() if agotamiento else None,
+            "total_puntos": len(serie)
+        }
+        if incluir_puntos:
+            viaje["puntos"] = [
+                {"timestamp": datetime.fromtimestamp(ts).isoformat(), "asientos": asientos, "precio_total": precio}
+                for ts, asientos, precio in serie.puntos()
+            ]
+        viajes.append(viaje)
+    viajes.sort(key=lambda viaje: viaje["hora_salida"])
+    return responder({"origen": origen, "destino": destino, "fecha": fecha, "total_viajes": len(viajes), "viajes": viajes})
+
 @app.get("/alertas")
-async def obtener_alertas(limite: int = 50):
+async def obtener_alertas(
+    limite: int = 50,
+    nivel: Optional[str] = None,
+    tipo: Optional[str] = None,
+    origen: Optional[str] = None,
+    destino: Optional[str] = None,
+    fecha: Optional[str] = None,
+    empresa: Optional[str] = None,
+    cursor: Optional[int] = None
+):
+    """Últimas alertas (filtradas); `cursor` = `siguiente_cursor` de la respuesta anterior para ver más viejas"""
+    filtros = {"nivel": nivel, "tipo": tipo, "origen": origen, "destino": destino, "fecha": fecha, "empresa": empresa}
+    alertas, siguiente_cursor = alertas_generadas.consultar(filtros, max(1, min(limite, 500)), antes_de=cursor)
     return {
         "total": len(alertas_generadas),
-        "alertas": alertas_generadas[-limite:]
+        "alertas": alertas,
+        "siguiente_cursor": siguiente_cursor
     }
 
+@app.get("/alertas/stream")
+async def stream_alertas(
+    nivel: Optional[str] = None,
+    origen: Optional[str] = None,
+    destino: Optional[str] = None,
+    empresa: Optional[str] = None,
+    desde_id: Optional[int] = None,
+    last_event_id: Optional[str] = Header(None)
+):
+    """Server-Sent Events con cada alerta nueva apenas se genera.
+
+    Para retomar después de una desconexión se envía `desde_id` (o el header
+    Last-Event-ID que los navegadores mandan solos) con el último id recibido.
+    Un id mayor a todos los generados se trata como reinicio y se reenvía todo el historial.
+    """
+    if desde_id is None and last_event_id and last_event_id.isdigit():
+        desde_id = int(last_event_id)
+    if desde_id is not None and desde_id >= alertas_generadas.siguiente_id:
+        # Id que todavía no existe: se reinició sin alertas guardadas y los ids volvieron a empezar
+        desde_id = 0
+    
+    filtros = {"nivel": nivel, "origen": origen, "destino": destino, "empresa": empresa}
+    # Suscribirse antes de reenviar el historial para no perder alertas intermedias
+    suscriptor = difusor_alertas.suscribir(filtros)
+    
+    def evento_sse(alerta: Dict) -> str:
+        return f"id: {alerta['id']}\nevent: alerta\ndata: {json.dumps(alerta, ensure_ascii=False)}\n\n"
+    
+    async def eventos():
+        ultimo_id = desde_id
+        try:
+            if desde_id is not None:
+                for alerta in alertas_generadas.desde(desde_id):
+                    if suscriptor.acepta(alerta):
+                        yield evento_sse(alerta)
+                    ultimo_id = alerta["id"]
+            
+            while True:
+                try:
+                    alerta = await asyncio.wait_for(suscriptor.cola.get(), timeout=CONFIG_ALERTAS["heartbeat_segundos"])
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if ultimo_id is None or alerta["id"] > ultimo_id:
+                    ultimo_id = alerta["id"]
+                    yield evento_sse(alerta)
+                if suscriptor.descartado and suscriptor.cola.empty():
+                    yield f"event: desconectado\ndata: {json.dumps({'motivo': 'cliente lento', 'ultimo_id': ultimo_id})}\n\n"
+                    return
+        finally:
+            difusor_alertas.desuscribir(suscriptor)
+    
+    return StreamingResponse(
+        eventos(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.delete("/alertas")
 async def limpiar_alertas():
-    alertas_generadas.clear()
+    alertas_generadas.limpiar()
+    persistencia.limpiar_alertas()
     return {"exito": True, "mensaje": "Alertas limpiadas"}
+
+class RegistroWebhook(BaseModel):
+    url: str
+    nivel: Optional[str] = None
+    tipo: Optional[str] = None
+    origen: Optional[str] = None
+    destino: Optional[str] = None
+    empresa: Optional[str] = None
+    secreto: Optional[str] = None  # Si viene, cada envío lleva X-Firma: sha256=<HMAC del cuerpo>
+
+@app.post("/webhooks")
+async def registrar_webhook(registro: RegistroWebhook):
+    """Envía por POST, agrupadas en lotes, las alertas nuevas que cumplan los filtros"""
+    try:
+        await validar_url_webhook(registro.url, entrega_webhooks.config["permitir_redes_privadas"])
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    filtros = {"nivel": registro.nivel, "tipo": registro.tipo, "origen": registro.origen,
+               "destino": registro.destino, "empresa": registro.empresa}
+    webhook = entrega_webhooks.registrar(Webhook(registro.url, filtros, registro.secreto))
+    persistencia.guardar_webhook(webhook.datos_guardables())
+    return {"exito": True, "webhook": webhook.como_dict()}
+
+@app.get("/webhooks")
+async def listar_webhooks():
+    return {
+        **entrega_webhooks.estadisticas(),
+        "lista": [webhook.como_dict() for webhook in entrega_webhooks.webhooks.values()]
+    }
+
+@app.delete("/webhooks/{webhook_id}")
+async def quitar_webhook(webhook_id: str):
+    if entrega_webhooks.quitar(webhook_id) is None:
+        raise HTTPException(404, "Webhook no encontrado")
+    persistencia.quitar_webhook(webhook_id)
+    return {"exito": True, "mensaje": f"Webhook {webhook_id} eliminado"}
+
+@app.get("/webhooks/fallidos")
+async def listar_webhooks_fallidos(webhook_id: Optional[str] = None):
+    """Lotes que agotaron los reintentos (los más nuevos al final)"""
+    fallidos = [lote for lote in entrega_webhooks.fallidos if webhook_id is None or lote["webhook_id"] == webhook_id]
+    return {"total": len(fallidos), "fallidos": fallidos}
+
+@app.post("/webhooks/fallidos/reenviar")
+async def reenviar_webhooks_fallidos(webhook_id: Optional[str] = None):
+    return {"exito": True, "reenviados": entrega_webhooks.reenviar_fallidos(webhook_id)}
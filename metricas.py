@@ -0,0 +1,136 @@
+"""
+Métricas en formato de texto de Prometheus
+
+Todo corre en el hilo del event loop, así que registrar una métrica es solo
+sumar a un dict, sin locks. Con varios workers de uvicorn cada proceso
+expone sus propias métricas y Prometheus las agrega al recolectar.
+"""
+
+import asyncio
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Tuple
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _etiquetas(nombres: Tuple[str, ...], valores: Tuple) -> str:
+    if not nombres:
+        return ""
+    pares = ",".join(f'{nombre}="{str(valor).replace(chr(34), chr(39))}"' for nombre, valor in zip(nombres, valores))
+    return "{" + pares + "}"
+
+
+class Contador:
+    """Total que solo crece; con `funcion` se lee al recolectar de un contador que ya lleva otro objeto"""
+    tipo = "counter"
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Tuple[str, ...] = (), funcion: Optional[Callable] = None):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = etiquetas
+        self.funcion = funcion
+        self.valores: Dict[Tuple, float] = {}
+
+    def inc(self, *valores_etiquetas, valor: float = 1):
+        self.valores[valores_etiquetas] = self.valores.get(valores_etiquetas, 0) + valor
+
+    def lineas(self) -> List[str]:
+        if self.funcion:
+            return [f"{self.nombre} {self.funcion()}"]
+        return [f"{self.nombre}{_etiquetas(self.etiquetas, clave)} {valor}" for clave, valor in self.valores.items()]
+
+
+class Medidor:
+    """Valor actual; con `funcion` se calcula recién al recolectar.
+
+    Con `etiquetas`, `funcion` devuelve un dict {tupla de valores de etiquetas: valor}.
+    """
+    tipo = "gauge"
+
+    def __init__(self, nombre: str, ayuda: str, funcion: Optional[Callable] = None, etiquetas: Tuple[str, ...] = ()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.funcion = funcion
+        self.etiquetas = etiquetas
+        self.valor = 0.0
+
+    def set(self, valor: float):
+        self.valor = valor
+
+    def lineas(self) -> List[str]:
+        if self.etiquetas:
+            return [f"{self.nombre}{_etiquetas(self.etiquetas, clave)} {valor}" for clave, valor in self.funcion().items()]
+        return [f"{self.nombre} {self.funcion() if self.funcion else self.valor}"]
+
+
+class Histograma:
+    tipo = "histogram"
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Tuple[str, ...] = (), buckets: Tuple[float, ...] = BUCKETS_SEGUNDOS):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = etiquetas
+        self.buckets = buckets
+        # Por combinación de etiquetas: [conteo por bucket..., +Inf], suma
+        self.series: Dict[Tuple, list] = {}
+
+    def observar(self, valor: float, *valores_etiquetas):
+        serie = self.series.get(valores_etiquetas)
+        if serie is None:
+            serie = self.series[valores_etiquetas] = [[0] * (len(self.buckets) + 1), 0.0]
+        serie[0][bisect_left(self.buckets, valor)] += 1
+        serie[1] += valor
+
+    def lineas(self) -> List[str]:
+        lineas = []
+        for clave, (conteos, suma) in self.series.items():
+            acumulado = 0
+            for limite, conteo in zip(self.buckets + (float("inf"),), conteos):
+                acumulado += conteo
+                le = "+Inf" if limite == float("inf") else repr(limite)
+                etiquetas = _etiquetas(self.etiquetas + ("le",), clave + (le,))
+                lineas.append(f"{self.nombre}_bucket{etiquetas} {acumulado}")
+            lineas.append(f"{self.nombre}_sum{_etiquetas(self.etiquetas, clave)} {suma}")
+            lineas.append(f"{self.nombre}_count{_etiquetas(self.etiquetas, clave)} {acumulado}")
+        return lineas
+
+
+class RegistroMetricas:
+    def __init__(self):
+        self.metricas = []
+
+    def contador(self, nombre: str, ayuda: str, etiquetas: Tuple[str, ...] = (), funcion: Optional[Callable] = None) -> Contador:
+        return self._registrar(Contador(nombre, ayuda, etiquetas, funcion))
+
+    def medidor(self, nombre: str, ayuda: str, funcion: Optional[Callable] = None, etiquetas: Tuple[str, ...] = ()) -> Medidor:
+        return self._registrar(Medidor(nombre, ayuda, funcion, etiquetas))
+
+    def histograma(self, nombre: str, ayuda: str, etiquetas: Tuple[str, ...] = (),
+                   buckets: Tuple[float, ...] = BUCKETS_SEGUNDOS) -> Histograma:
+        return self._registrar(Histograma(nombre, ayuda, etiquetas, buckets))
+
+    def _registrar(self, metrica):
+        self.metricas.append(metrica)
+        return metrica
+
+    def exponer(self) -> str:
+        lineas = []
+        for metrica in self.metricas:
+            lineas.append(f"# HELP {metrica.nombre} {metrica.ayuda}")
+            lineas.append(f"# TYPE {metrica.nombre} {metrica.tipo}")
+            lineas.extend(metrica.lineas())
+        return "\n".join(lineas) + "\n"
+
+
+async def medir_retraso_event_loop(medidor: Medidor, histograma: Histograma, intervalo: float = 0.5):
+    """Cuánto tarda el loop en despertar respecto a lo pedido (mide bloqueos del event loop)"""
+    while True:
+        inicio = time.perf_counter()
+        await asyncio.sleep(intervalo)
+        retraso = max(0.0, time.perf_counter() - inicio - intervalo)
+        medidor.set(retraso)
+        histograma.observar(retraso)
+
+
+registro = RegistroMetricas()
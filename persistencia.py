@@ -0,0 +1,221 @@
+"""
+Persistencia en SQLite (modo WAL) de monitores, último estado de asientos, alertas y webhooks
+"""
+
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS monitores (
+    id TEXT PRIMARY KEY,
+    origen TEXT NOT NULL,
+    destino TEXT NOT NULL,
+    fecha TEXT NOT NULL,
+    horario_especifico TEXT,
+    empresa_especifica TEXT,
+    ultima_revision TEXT,
+    ultimos_asientos INTEGER,
+    velocidad_venta REAL
+);
+CREATE TABLE IF NOT EXISTS estado_asientos (
+    clave TEXT PRIMARY KEY,
+    asientos INTEGER NOT NULL,
+    timestamp TEXT NOT NULL,
+    salida TEXT
+);
+CREATE TABLE IF NOT EXISTS alertas (
+    id INTEGER PRIMARY KEY,
+    datos TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS webhooks (
+    id TEXT PRIMARY KEY,
+    datos TEXT NOT NULL
+);
+"""
+
+
+def fecha_a_texto(valor: Optional[datetime]) -> Optional[str]:
+    return valor.isoformat() if valor else None
+
+
+def texto_a_fecha(valor: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(valor) if valor else None
+
+
+class PersistenciaSQLite:
+    """Acumula cambios en memoria y los escribe juntos en una sola transacción.
+
+    Los métodos `guardar_*`/`quitar_*` solo anotan el cambio (sin I/O); cada
+    `intervalo_volcado_segundos` se toman los pendientes y se escriben en un hilo
+    aparte para no bloquear el event loop. Si `ruta` es None la persistencia
+    queda desactivada.
+    """
+
+    def __init__(self, ruta: Optional[str], max_alertas: int):
+        self.ruta = ruta
+        self.habilitada = ruta is not None
+        self.max_alertas = max_alertas
+        self.conexion: Optional[sqlite3.Connection] = None
+        self.bloqueo = threading.Lock()
+        self._reiniciar_pendientes()
+
+    def _reiniciar_pendientes(self):
+        self.monitores_pendientes: Dict[str, Optional[Dict]] = {}
+        self.estados_pendientes: Dict[str, Optional[Dict]] = {}
+        self.alertas_pendientes: List[Dict] = []
+        self.borrar_alertas = False
+        self.webhooks_pendientes: Dict[str, Optional[Dict]] = {}
+
+    def abrir(self):
+        if not self.habilitada:
+            return
+        self.conexion = sqlite3.connect(self.ruta, check_same_thread=False)
+        self.conexion.execute("PRAGMA journal_mode=WAL")
+        self.conexion.execute("PRAGMA synchronous=NORMAL")
+        self.conexion.executescript(ESQUEMA)
+        self.conexion.commit()
+
+    def cerrar(self):
+        if self.conexion is not None:
+            with self.bloqueo:
+                self.conexion.close()
+            self.conexion = None
+
+    def cargar(self) -> Dict[str, List[Dict]]:
+        """Estado guardado para restaurar al iniciar: monitores, estados, alertas y webhooks"""
+        if self.conexion is None:
+            return {"monitores": [], "estados": [], "alertas": [], "webhooks": []}
+        self.conexion.row_factory = sqlite3.Row
+        try:
+            monitores = [dict(fila) for fila in self.conexion.execute("SELECT * FROM monitores")]
+            estados = [dict(fila) for fila in self.conexion.execute("SELECT * FROM estado_asientos")]
+            alertas = [json.loads(fila["datos"]) for fila in self.conexion.execute(
+                "SELECT datos FROM alertas ORDER BY id DESC LIMIT ?", (self.max_alertas,)
+            )]
+            webhooks = [json.loads(fila["datos"]) for fila in self.conexion.execute("SELECT datos FROM webhooks")]
+        finally:
+            self.conexion.row_factory = None
+        alertas.reverse()
+        for monitor in monitores:
+            monitor["ultima_revision"] = texto_a_fecha(monitor["ultima_revision"])
+        for estado in estados:
+            estado["timestamp"] = texto_a_fecha(estado["timestamp"])
+            estado["salida"] = texto_a_fecha(estado["salida"])
+        return {"monitores": monitores, "estados": estados, "alertas": alertas, "webhooks": webhooks}
+
+    def guardar_monitor(self, monitor):
+        if self.habilitada:
+            self.monitores_pendientes[monitor.id] = {
+                "id": monitor.id,
+                "origen": monitor.origen,
+                "destino": monitor.destino,
+                "fecha": monitor.fecha,
+                "horario_especifico": monitor.horario_especifico,
+                "empresa_especifica": monitor.empresa_especifica,
+                "ultima_revision": fecha_a_texto(monitor.ultima_revision),
+                "ultimos_asientos": monitor.ultimos_asientos,
+                "velocidad_venta": monitor.velocidad_venta,
+            }
+
+    def quitar_monitor(self, monitor_id: str):
+        if self.habilitada:
+            self.monitores_pendientes[monitor_id] = None
+
+    def guardar_estado(self, clave: str, estado: Dict):
+        if self.habilitada:
+            self.estados_pendientes[clave] = estado
+
+    def quitar_estado(self, clave: str):
+        if self.habilitada:
+            self.estados_pendientes[clave] = None
+
+    def guardar_alerta(self, alerta: Dict):
+        if self.habilitada:
+            self.alertas_pendientes.append(alerta)
+
+    def limpiar_alertas(self):
+        if self.habilitada:
+            self.alertas_pendientes = []
+            self.borrar_alertas = True
+
+    def guardar_webhook(self, datos: Dict):
+        if self.habilitada:
+            self.webhooks_pendientes[datos["id"]] = datos
+
+    def quitar_webhook(self, webhook_id: str):
+        if self.habilitada:
+            self.webhooks_pendientes[webhook_id] = None
+
+    def hay_pendientes(self) -> bool:
+        return bool(self.monitores_pendientes or self.estados_pendientes or self.alertas_pendientes or self.borrar_alertas
+                    or self.webhooks_pendientes)
+
+    def tomar_pendientes(self) -> Dict:
+        """Saca los cambios acumulados (en el hilo del event loop) para escribirlos aparte"""
+        pendientes = {
+            "monitores": self.monitores_pendientes,
+            "estados": self.estados_pendientes,
+            "alertas": self.alertas_pendientes,
+            "borrar_alertas": self.borrar_alertas,
+            "webhooks": self.webhooks_pendientes,
+        }
+        self._reiniciar_pendientes()
+        return pendientes
+
+    def devolver_pendientes(self, pendientes: Dict):
+        """Vuelve a encolar un lote que no se pudo escribir; los cambios anotados después mandan"""
+        pendientes["monitores"].update(self.monitores_pendientes)
+        self.monitores_pendientes = pendientes["monitores"]
+        pendientes["estados"].update(self.estados_pendientes)
+        self.estados_pendientes = pendientes["estados"]
+        pendientes["webhooks"].update(self.webhooks_pendientes)
+        self.webhooks_pendientes = pendientes["webhooks"]
+        if not self.borrar_alertas:
+            # Las más viejas que max_alertas se borrarían al escribir de todos modos
+            self.alertas_pendientes = (pendientes["alertas"] + self.alertas_pendientes)[-self.max_alertas:]
+            self.borrar_alertas = pendientes["borrar_alertas"]
+
+    def escribir(self, pendientes: Dict):
+        if self.conexion is None:
+            return
+        with self.bloqueo, self.conexion:
+            conexion = self.conexion
+            if pendientes["borrar_alertas"]:
+                conexion.execute("DELETE FROM alertas")
+
+            monitores = pendientes["monitores"]
+            conexion.executemany("DELETE FROM monitores WHERE id = ?",
+                                 [(monitor_id,) for monitor_id, datos in monitores.items() if datos is None])
+            conexion.executemany(
+                "INSERT OR REPLACE INTO monitores VALUES (:id, :origen, :destino, :fecha, :horario_especifico, "
+                ":empresa_especifica, :ultima_revision, :ultimos_asientos, :velocidad_venta)",
+                [datos for datos in monitores.values() if datos is not None]
+            )
+
+            estados = pendientes["estados"]
+            conexion.executemany("DELETE FROM estado_asientos WHERE clave = ?",
+                                 [(clave,) for clave, estado in estados.items() if estado is None])
+            conexion.executemany(
+                "INSERT OR REPLACE INTO estado_asientos VALUES (?, ?, ?, ?)",
+                [(clave, estado["asientos"], fecha_a_texto(estado["timestamp"]), fecha_a_texto(estado.get("salida")))
+                 for clave, estado in estados.items() if estado is not None]
+            )
+
+            alertas = pendientes["alertas"]
+            if alertas:
+                conexion.executemany(
+                    "INSERT OR REPLACE INTO alertas VALUES (?, ?)",
+                    [(alerta["id"], json.dumps(alerta, ensure_ascii=False)) for alerta in alertas]
+                )
+                conexion.execute("DELETE FROM alertas WHERE id <= ?", (alertas[-1]["id"] - self.max_alertas,))
+
+            webhooks = pendientes["webhooks"]
+            conexion.executemany("DELETE FROM webhooks WHERE id = ?",
+                                 [(webhook_id,) for webhook_id, datos in webhooks.items() if datos is None])
+            conexion.executemany(
+                "INSERT OR REPLACE INTO webhooks VALUES (?, ?)",
+                [(webhook_id, json.dumps(datos, ensure_ascii=False)) for webhook_id, datos in webhooks.items() if datos is not None]
+            )
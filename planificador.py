@@ -0,0 +1,103 @@
+"""
+Planificador de revisiones de monitores (cola de prioridad por próxima revisión)
+"""
+
+import asyncio
+import heapq
+import itertools
+from typing import Dict, List, Optional
+
+
+class PlanificadorMonitores:
+    """Cola de prioridad monitor_id -> momento (time.time()) de su próxima revisión.
+
+    Reprogramar o quitar un monitor no toca el heap: las entradas viejas se
+    descartan cuando llegan al frente.
+    """
+
+    def __init__(self):
+        self.heap: List[tuple] = []
+        self.programados: Dict[str, float] = {}
+        self.contador = itertools.count()
+        self.despertar: Optional[asyncio.Event] = None
+
+    def __len__(self):
+        return len(self.programados)
+
+    def programar(self, monitor_id: str, cuando: float):
+        self.programados[monitor_id] = cuando
+        heapq.heappush(self.heap, (cuando, next(self.contador), monitor_id))
+        if self.despertar is not None:
+            self.despertar.set()
+
+    def quitar(self, monitor_id: str):
+        self.programados.pop(monitor_id, None)
+
+    def _limpiar_frente(self):
+        while self.heap:
+            cuando, _, monitor_id = self.heap[0]
+            if self.programados.get(monitor_id) == cuando:
+                return
+            heapq.heappop(self.heap)
+
+    def extraer_vencidos(self, ahora: float) -> List[str]:
+        vencidos = []
+        self._limpiar_frente()
+        while self.heap and self.heap[0][0] <= ahora:
+            _, _, monitor_id = heapq.heappop(self.heap)
+            del self.programados[monitor_id]
+            vencidos.append(monitor_id)
+            self._limpiar_frente()
+        return vencidos
+
+    def segundos_hasta_proxima(self, ahora: float, maximo: float) -> float:
+        self._limpiar_frente()
+        if not self.heap:
+            return maximo
+        return min(maximo, max(0.0, self.heap[0][0] - ahora))
+
+    async def esperar(self, segundos: float):
+        """Duerme hasta `segundos` o hasta que se programe un monitor nuevo"""
+        if self.despertar is None:
+            self.despertar = asyncio.Event()
+        self.despertar.clear()
+        try:
+            await asyncio.wait_for(self.despertar.wait(), timeout=segundos)
+        except asyncio.TimeoutError:
+            pass
+
+
+def calcular_intervalo_revision(horas_para_salida: Optional[float], asientos: Optional[int],
+                                velocidad_venta: float, config: Dict) -> float:
+    """Segundos hasta la próxima revisión según cercanía de la salida y escasez de asientos.
+
+    `velocidad_venta` es en asientos por hora. Se revisa al menos 4 veces antes
+    del agotamiento proyectado.
+    """
+    intervalo = float(config["intervalo_revision"])
+
+    if horas_para_salida is not None:
+        if horas_para_salida <= 1:
+            intervalo *= 0.2
+        elif horas_para_salida <= 6:
+            intervalo *= 0.4
+        elif horas_para_salida <= 24:
+            intervalo *= 0.7
+        elif horas_para_salida > 24 * 7:
+            intervalo *= 3
+        elif horas_para_salida > 72:
+            intervalo *= 2
+
+    if asientos is not None:
+        if asientos <= config["umbral_critico"]:
+            intervalo *= 0.3
+        elif asientos <= config["umbral_advertencia"]:
+            intervalo *= 0.6
+        elif asientos > config["umbral_advertencia"] * 3:
+            intervalo *= 1.5
+
+    if velocidad_venta > 0 and asientos:
+        horas_para_agotar = asientos / velocidad_venta
+        intervalo = min(intervalo, horas_para_agotar * 3600 / 4)
+
+    return max(config["intervalo_minimo"], min(config["intervalo_maximo"], intervalo))
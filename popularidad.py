@@ -0,0 +1,101 @@
+"""
+Popularidad de rutas (count-min sketch + top-k) y presupuesto de la precarga
+"""
+
+import time
+from array import array
+from collections import deque
+from typing import Any, Deque, Dict, Hashable, List, Tuple
+
+
+class CountMinSketch:
+    """Conteo aproximado en memoria fija: nunca subestima, sobreestima poco con `ancho` grande"""
+
+    def __init__(self, ancho: int, profundidad: int):
+        self.ancho = ancho
+        self.profundidad = profundidad
+        self.filas = [array("l", [0]) * ancho for _ in range(profundidad)]
+
+    def _posiciones(self, clave: Hashable):
+        # Doble hashing: las filas usan h1 + fila * h2, con las dos mitades de un solo hash
+        valor = hash(clave) & 0xFFFFFFFFFFFFFFFF
+        h1, h2 = valor & 0xFFFFFFFF, (valor >> 32) | 1
+        for fila in range(self.profundidad):
+            yield fila, (h1 + fila * h2) % self.ancho
+
+    def agregar(self, clave: Hashable, cantidad: int = 1) -> int:
+        """Suma `cantidad` y devuelve la nueva estimación"""
+        estimado = None
+        for fila, posicion in self._posiciones(clave):
+            self.filas[fila][posicion] += cantidad
+            valor = self.filas[fila][posicion]
+            estimado = valor if estimado is None else min(estimado, valor)
+        return estimado
+
+    def estimar(self, clave: Hashable) -> int:
+        return min(self.filas[fila][posicion] for fila, posicion in self._posiciones(clave))
+
+    def decaer(self):
+        """Divide todos los contadores por 2 para que pese más lo reciente"""
+        for contadores in self.filas:
+            for i in range(self.ancho):
+                contadores[i] >>= 1
+
+
+class RankingPopularidad:
+    """Las `k` claves más pedidas según el sketch, con un dato asociado a cada una"""
+
+    def __init__(self, k: int, ancho: int, profundidad: int):
+        self.k = k
+        self.sketch = CountMinSketch(ancho, profundidad)
+        self.candidatos: Dict[Hashable, Tuple[int, Any]] = {}
+
+    def __len__(self):
+        return len(self.candidatos)
+
+    def registrar(self, clave: Hashable, dato: Any = None):
+        estimado = self.sketch.agregar(clave)
+        if clave not in self.candidatos and len(self.candidatos) >= self.k:
+            if estimado <= min(conteo for conteo, _ in self.candidatos.values()):
+                return
+        self.candidatos[clave] = (estimado, dato)
+        # Se recorta de a tandas para no ordenar en cada registro
+        if len(self.candidatos) >= 2 * self.k:
+            self._recortar()
+
+    def _recortar(self):
+        mejores = sorted(self.candidatos.items(), key=lambda item: item[1][0], reverse=True)[:self.k]
+        self.candidatos = dict(mejores)
+
+    def mas_populares(self, n: int) -> List[Tuple[Hashable, int, Any]]:
+        ordenados = sorted(self.candidatos.items(), key=lambda item: item[1][0], reverse=True)[:n]
+        return [(clave, conteo, dato) for clave, (conteo, dato) in ordenados]
+
+    def decaer(self):
+        self.sketch.decaer()
+        self.candidatos = {clave: (conteo >> 1, dato) for clave, (conteo, dato) in self.candidatos.items() if conteo >> 1}
+
+
+class PresupuestoVentana:
+    """Como máximo `maximo` usos en cualquier ventana de `ventana_segundos`"""
+
+    def __init__(self, maximo: int, ventana_segundos: float):
+        self.maximo = maximo
+        self.ventana = ventana_segundos
+        self.usos: Deque[float] = deque()
+
+    def _limpiar(self, ahora: float):
+        while self.usos and self.usos[0] <= ahora - self.ventana:
+            self.usos.popleft()
+
+    def restante(self) -> int:
+        self._limpiar(time.monotonic())
+        return max(0, self.maximo - len(self.usos))
+
+    def gastar(self) -> bool:
+        ahora = time.monotonic()
+        self._limpiar(ahora)
+        if len(self.usos) >= self.maximo:
+            return False
+        self.usos.append(ahora)
+        return True
@@ -0,0 +1,23 @@
+"""
+Esperas entre reintentos de peticiones HTTP, compartidas por el cliente de
+RedBus y el envío a webhooks
+"""
+
+import random
+from typing import Dict
+
+import httpx
+
+
+def espera_backoff(intento: int, config: Dict) -> float:
+    """Backoff exponencial con jitter completo (`intento` desde 0) según `backoff_base` y `backoff_maximo`"""
+    tope = min(config["backoff_maximo"], config["backoff_base"] * 2 ** intento)
+    return random.uniform(0, tope)
+
+
+def espera_retry_after(response: httpx.Response, config: Dict) -> float:
+    """Segundos pedidos en el header Retry-After (0 si no viene o no es un número), hasta `backoff_maximo`"""
+    try:
+        return min(float(response.headers.get("retry-after", 0)), config["backoff_maximo"])
+    except ValueError:
+        return 0.0
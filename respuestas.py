@@ -0,0 +1,147 @@
+"""
+Serialización JSON rápida, compresión de respuestas grandes y ETags
+
+orjson y brotli vienen en requirements.txt; si no están instalados se usa
+el módulo json de la librería estándar y solo se comprime con gzip.
+"""
+
+import gzip
+import hashlib
+import json
+from typing import Any, Dict, Optional
+
+from fastapi import Response
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Respuestas que se envían de a pedazos: comprimirlas retiene los eventos en el buffer
+TIPOS_SIN_COMPRIMIR = ("text/event-stream", "application/x-ndjson")
+
+
+def cargar_json(contenido: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(contenido)
+    return json.loads(contenido)
+
+
+def serializar_json(datos: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(datos, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(datos, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def etag_coincide(if_none_match: Optional[str], etag: str) -> bool:
+    """Comparación débil de If-None-Match (ignora W/, que agrega la compresión)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    base = etag[2:] if etag.startswith("W/") else etag
+    for candidato in if_none_match.split(","):
+        candidato = candidato.strip()
+        if (candidato[2:] if candidato.startswith("W/") else candidato) == base:
+            return True
+    return False
+
+
+class CuerpoPrecalculado:
+    """JSON ya serializado con su ETag, para responder sin volver a armar ni serializar"""
+
+    def __init__(self, datos: Any):
+        self.cuerpo = serializar_json(datos)
+        self.etag = '"' + hashlib.blake2b(self.cuerpo, digest_size=12).hexdigest() + '"'
+
+    def responder(self, if_none_match: Optional[str], cache_control: str, extra: Optional[Dict] = None) -> Response:
+        headers = {"ETag": self.etag, "Cache-Control": cache_control, **(extra or {})}
+        if etag_coincide(if_none_match, self.etag):
+            return Response(status_code=304, headers=headers)
+        return Response(self.cuerpo, media_type="application/json", headers=headers)
+
+
+class RespuestaJSON(JSONResponse):
+    """JSONResponse con orjson si está instalado.
+
+    Devolverla directamente desde el endpoint evita además el
+    jsonable_encoder de FastAPI; el contenido debe ser ya JSON puro
+    (dicts, listas, str, números, bool, None).
+    """
+
+    def render(self, content: Any) -> bytes:
+        return serializar_json(content)
+
+
+class MiddlewareCompresion:
+    """Comprime con brotli o gzip (según Accept-Encoding) las respuestas de un solo cuerpo de al menos `minimo_bytes`"""
+
+    def __init__(self, app: ASGIApp, minimo_bytes: int = 1024, nivel_gzip: int = 5, nivel_brotli: int = 4):
+        self.app = app
+        self.minimo_bytes = minimo_bytes
+        self.nivel_gzip = nivel_gzip
+        self.nivel_brotli = nivel_brotli
+
+    def elegir_codificacion(self, aceptadas: str):
+        codificaciones = {parte.split(";")[0].strip().lower() for parte in aceptadas.split(",")}
+        if brotli is not None and "br" in codificaciones:
+            return "br"
+        if "gzip" in codificaciones:
+            return "gzip"
+        return None
+
+    def comprimir(self, cuerpo: bytes, codificacion: str) -> bytes:
+        if codificacion == "br":
+            return brotli.compress(cuerpo, quality=self.nivel_brotli)
+        return gzip.compress(cuerpo, compresslevel=self.nivel_gzip)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        codificacion = self.elegir_codificacion(Headers(scope=scope).get("accept-encoding", ""))
+        if codificacion is None:
+            await self.app(scope, receive, send)
+            return
+
+        inicio: Dict = {}
+        directo = False
+
+        async def enviar(mensaje: Message):
+            nonlocal inicio, directo
+            if mensaje["type"] == "http.response.start":
+                inicio = mensaje
+                return
+            if mensaje["type"] != "http.response.body" or directo:
+                await send(mensaje)
+                return
+
+            # Primer pedazo del cuerpo: decidir si se comprime
+            directo = True
+            headers = MutableHeaders(raw=inicio["headers"])
+            cuerpo = mensaje.get("body", b"")
+            if (mensaje.get("more_body") or len(cuerpo) < self.minimo_bytes or "content-encoding" in headers
+                    or headers.get("content-type", "").startswith(TIPOS_SIN_COMPRIMIR)):
+                await send(inicio)
+                await send(mensaje)
+                return
+
+            comprimido = self.comprimir(cuerpo, codificacion)
+            headers["Content-Encoding"] = codificacion
+            headers["Content-Length"] = str(len(comprimido))
+            if "etag" in headers and not headers["etag"].startswith("W/"):
+                # El ETag fuerte es del cuerpo sin comprimir
+                headers["ETag"] = "W/" + headers["etag"]
+            headers.add_vary_header("Accept-Encoding")
+            await send(inicio)
+            await send({"type": "http.response.body", "body": comprimido})
+
+        await self.app(scope, receive, enviar)
@@ -0,0 +1,150 @@
+"""
+Historial de asientos y precio por viaje, a partir de las revisiones del monitoreo
+"""
+
+import time
+from array import array
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from snapshot import numero
+
+
+class SerieViaje:
+    """Puntos (timestamp, asientos, precio) de un viaje en columnas `array`.
+
+    Si un punto repite los valores de los dos anteriores solo se corre la
+    hora del último, así una salida sin ventas ocupa dos puntos. Los puntos
+    con más de `detalle_segundos` se reducen a uno por cada `resolucion_segundos`.
+    """
+
+    def __init__(self, salida: Optional[float]):
+        self.salida = salida
+        self.tiempos = array("d")
+        self.asientos = array("l")
+        self.precios = array("d")
+
+    def __len__(self):
+        return len(self.tiempos)
+
+    def agregar(self, ts: float, asientos: int, precio: float):
+        n = len(self.tiempos)
+        if (n >= 2 and self.asientos[-1] == self.asientos[-2] == asientos
+                and self.precios[-1] == self.precios[-2] == precio):
+            self.tiempos[-1] = ts
+            return
+        self.tiempos.append(ts)
+        self.asientos.append(asientos)
+        self.precios.append(precio)
+
+    def reducir(self, ahora: float, detalle_segundos: float, resolucion_segundos: float):
+        """Deja el último punto de cada intervalo de `resolucion_segundos` entre los puntos viejos"""
+        limite = ahora - detalle_segundos
+        viejos = 0
+        while viejos < len(self.tiempos) and self.tiempos[viejos] < limite:
+            viejos += 1
+        if viejos < 2:
+            return
+        conservar = []
+        for i in range(viejos):
+            if i + 1 == viejos or self.tiempos[i] // resolucion_segundos != self.tiempos[i + 1] // resolucion_segundos:
+                conservar.append(i)
+        if len(conservar) == viejos:
+            return
+        conservar.extend(range(viejos, len(self.tiempos)))
+        self.tiempos = array("d", (self.tiempos[i] for i in conservar))
+        self.asientos = array("l", (self.asientos[i] for i in conservar))
+        self.precios = array("d", (self.precios[i] for i in conservar))
+
+    def recortar(self, max_puntos: int):
+        """Descarta los puntos más viejos si quedan más de `max_puntos`"""
+        if len(self.tiempos) > max_puntos:
+            del self.tiempos[:-max_puntos]
+            del self.asientos[:-max_puntos]
+            del self.precios[:-max_puntos]
+
+    def velocidad(self, ventana_segundos: float) -> float:
+        """Asientos vendidos por hora: pendiente (mínimos cuadrados) de los puntos de la ventana"""
+        if len(self.tiempos) < 2:
+            return 0.0
+        desde = self.tiempos[-1] - ventana_segundos
+        inicio = len(self.tiempos) - 1
+        while inicio > 0 and self.tiempos[inicio - 1] >= desde:
+            inicio -= 1
+        n = len(self.tiempos) - inicio
+        if n < 2:
+            return 0.0
+        tiempos = self.tiempos[inicio:]
+        asientos = self.asientos[inicio:]
+        media_t = sum(tiempos) / n
+        media_a = sum(asientos) / n
+        varianza = sum((t - media_t) ** 2 for t in tiempos)
+        if varianza == 0:
+            return 0.0
+        pendiente = sum((t - media_t) * (a - media_a) for t, a in zip(tiempos, asientos)) / varianza
+        return max(0.0, -pendiente * 3600)
+
+    def agotamiento_estimado(self, velocidad: float) -> Optional[float]:
+        """Timestamp en que se acabarían los asientos a `velocidad`; None si no se venden o ya salió"""
+        if not self.tiempos or velocidad <= 0 or self.asientos[-1] <= 0:
+            return None
+        estimado = self.tiempos[-1] + self.asientos[-1] / velocidad * 3600
+        if self.salida is not None and estimado > self.salida:
+            return None
+        return estimado
+
+    def puntos(self) -> List[Tuple[float, int, float]]:
+        return list(zip(self.tiempos, self.asientos, self.precios))
+
+
+class AlmacenSeries:
+    """Series por ruta/fecha y, dentro de cada una, por (hora de salida, empresa, servicio)"""
+
+    def __init__(self, max_puntos: int, detalle_segundos: float, resolucion_segundos: float):
+        self.max_puntos = max_puntos
+        self.detalle_segundos = detalle_segundos
+        self.resolucion_segundos = resolucion_segundos
+        self.rutas: Dict[tuple, Dict[tuple, SerieViaje]] = {}
+
+    def __len__(self):
+        return sum(len(viajes) for viajes in self.rutas.values())
+
+    def registrar(self, ruta: tuple, buses: Iterable[Dict], salida_de: Callable[[Dict], Optional[float]],
+                  ts: Optional[float] = None):
+        """Agrega una observación por bus; `salida_de(bus)` da el timestamp de salida de los viajes nuevos"""
+        ts = ts or time.time()
+        viajes = self.rutas.setdefault(ruta, {})
+        for bus in buses:
+            clave = clave_viaje(bus)
+            serie = viajes.get(clave)
+            if serie is None:
+                serie = viajes[clave] = SerieViaje(salida_de(bus))
+            elif len(serie) and serie.tiempos[-1] >= ts:
+                continue  # Resultado ya registrado (la misma búsqueda servida desde la cache)
+            serie.agregar(ts, int(numero(bus["asientos_disponibles"])), numero(bus["precio_total"]))
+            if len(serie) >= self.max_puntos:
+                serie.reducir(ts, self.detalle_segundos, self.resolucion_segundos)
+                if len(serie) >= self.max_puntos:
+                    serie.recortar(self.max_puntos * 3 // 4)
+
+    def viajes(self, ruta: tuple) -> Dict[tuple, SerieViaje]:
+        return self.rutas.get(ruta, {})
+
+    def purgar(self, ahora: float, retencion_segundos: float) -> int:
+        """Borra las series de viajes que ya salieron o que no se observan hace más de la retención"""
+        borradas = 0
+        for ruta in list(self.rutas):
+            viajes = self.rutas[ruta]
+            vencidas = [
+                clave for clave, serie in viajes.items()
+                if (serie.salida is not None and serie.salida < ahora) or serie.tiempos[-1] < ahora - retencion_segundos
+            ]
+            for clave in vencidas:
+                del viajes[clave]
+                borradas += 1
+            if not viajes:
+                del self.rutas[ruta]
+        return borradas
+
+
+def clave_viaje(bus: Dict) -> tuple:
+    return (bus["hora_salida"], bus["empresa"], bus["servicio"])
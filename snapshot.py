@@ -0,0 +1,236 @@
+"""
+Snapshot columnar de los resultados de una búsqueda para filtrar y ordenar sin copiar dicts
+"""
+
+import base64
+import time
+from array import array
+from operator import itemgetter
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+# Campos de cada bus normalizado (normalizar_resultados_redbus), en el orden en que se arman
+CAMPOS_BUS = (
+    "empresa", "tipo_bus", "servicio", "hora_salida", "hora_llegada", "fecha_salida", "fecha_llegada",
+    "duracion_minutos", "duracion_horas", "precio", "tarifa_servicio", "precio_total", "moneda",
+    "asientos_disponibles", "asientos_totales", "asientos_ventana", "punto_embarque", "punto_desembarque",
+    "rating", "num_reviews", "es_ac", "es_cama", "tiene_tracking", "agotado",
+)
+
+
+def hora_a_segundos(hora: str) -> int:
+    """'19:05' o '19:05:30' -> segundos desde medianoche; -1 si no es una hora válida"""
+    try:
+        partes = [int(parte) for parte in hora.split(":")]
+    except (AttributeError, ValueError):
+        return -1
+    if not 2 <= len(partes) <= 3:
+        return -1
+    partes += [0] * (3 - len(partes))
+    return partes[0] * 3600 + partes[1] * 60 + partes[2]
+
+
+def parsear_campos(texto: Optional[str]) -> Optional[Tuple[str, ...]]:
+    """'empresa, hora_salida' -> ("empresa", "hora_salida"); None (todos los campos) si no viene"""
+    if not texto:
+        return None
+    campos = tuple(dict.fromkeys(campo.strip() for campo in texto.split(",") if campo.strip()))
+    desconocidos = [campo for campo in campos if campo not in CAMPOS_BUS]
+    if desconocidos:
+        raise ValueError(f"Campos desconocidos: {', '.join(desconocidos)}. Válidos: {', '.join(CAMPOS_BUS)}")
+    return campos or None
+
+
+def numero(valor, defecto: float = 0.0) -> float:
+    try:
+        return float(valor)
+    except (TypeError, ValueError):
+        return defecto
+
+
+class SnapshotResultados:
+    """Resultados normalizados de una ruta/fecha más columnas numéricas por campo.
+
+    Las columnas se construyen una vez por búsqueda (queda en cache junto con
+    los buses). Los filtros se evalúan en una sola pasada sobre los índices y
+    cada orden se calcula la primera vez que se pide; solo las filas
+    seleccionadas se devuelven como dicts, sin copiarlos.
+    """
+
+    ORDENES = {
+        "hora": ("salida_orden", False),
+        "precio": ("precio_total", False),
+        "duracion": ("duracion", False),
+        "rating": ("rating", True),
+    }
+
+    def __init__(self, buses: List[Dict], paginas_faltantes: Optional[List[int]] = None):
+        self.buses = buses
+        # Páginas de RedBus (desde 1) que no llegaron, por error o por plazo vencido
+        self.paginas_faltantes = paginas_faltantes or []
+        self.precio_total = array("d", (numero(bus["precio_total"]) for bus in buses))
+        self.salida = array("l", (hora_a_segundos(bus["hora_salida"]) for bus in buses))
+        # "N/A" queda al final al ordenar por hora, como con el orden de texto
+        self.salida_orden = array("l", (segundos if segundos >= 0 else 10 ** 6 for segundos in self.salida))
+        self.asientos = array("l", (int(numero(bus["asientos_disponibles"])) for bus in buses))
+        self.rating = array("d", (numero(bus["rating"]) for bus in buses))
+        self.duracion = array("d", (numero(bus["duracion_minutos"]) for bus in buses))
+        self.es_ac = bytearray(bool(bus["es_ac"]) for bus in buses)
+        self.es_cama = bytearray(bool(bus["es_cama"]) for bus in buses)
+        self.empresa = [str(bus["empresa"]).lower() for bus in buses]
+        self.ordenes: Dict[str, List[int]] = {}
+        self.creado_en = time.time()
+        # Respuestas ya serializadas por variante (parámetros que cambian el cuerpo)
+        self.cuerpos: Dict[Hashable, Any] = {}
+
+    @property
+    def parcial(self) -> bool:
+        return bool(self.paginas_faltantes)
+
+    def __len__(self):
+        return len(self.buses)
+
+    def orden(self, ordenar_por: Optional[str]) -> List[int]:
+        if ordenar_por not in self.ORDENES:
+            ordenar_por = "hora"
+        if ordenar_por not in self.ordenes:
+            columna, descendente = self.ORDENES[ordenar_por]
+            valores = getattr(self, columna)
+            self.ordenes[ordenar_por] = sorted(range(len(self.buses)), key=valores.__getitem__, reverse=descendente)
+        return self.ordenes[ordenar_por]
+
+    def seleccionar(
+        self,
+        ordenar_por: Optional[str] = "hora",
+        empresa: Optional[str] = None,
+        precio_min: Optional[float] = None,
+        precio_max: Optional[float] = None,
+        hora_min: Optional[str] = None,
+        hora_max: Optional[str] = None,
+        asientos_min: Optional[int] = None,
+        solo_ac: Optional[bool] = None,
+        solo_cama: Optional[bool] = None,
+        rating_min: Optional[float] = None,
+    ) -> List[int]:
+        """Índices de los buses que cumplen todos los filtros, en el orden pedido.
+
+        Cada filtro recorre una sola columna y deja una máscara de 0/1 por bus;
+        las máscaras se combinan con un AND y se aplican una vez sobre el orden.
+        """
+        mascaras = []
+        if empresa:
+            texto = empresa.lower()
+            mascaras.append(bytearray([texto in nombre for nombre in self.empresa]))
+        if precio_min is not None:
+            mascaras.append(bytearray([precio >= precio_min for precio in self.precio_total]))
+        if precio_max is not None:
+            mascaras.append(bytearray([precio <= precio_max for precio in self.precio_total]))
+        if hora_min:
+            desde = hora_a_segundos(hora_min)
+            if desde < 0:
+                raise ValueError(f"Formato de hora inválido: {hora_min}")
+            mascaras.append(bytearray([salida >= desde for salida in self.salida]))
+        if hora_max:
+            hasta = hora_a_segundos(hora_max)
+            if hasta < 0:
+                raise ValueError(f"Formato de hora inválido: {hora_max}")
+            mascaras.append(bytearray([0 <= salida <= hasta for salida in self.salida]))
+        if asientos_min is not None:
+            mascaras.append(bytearray([asientos >= asientos_min for asientos in self.asientos]))
+        if solo_ac:
+            mascaras.append(self.es_ac)
+        if solo_cama:
+            mascaras.append(self.es_cama)
+        if rating_min is not None:
+            mascaras.append(bytearray([rating >= rating_min for rating in self.rating]))
+
+        orden = self.orden(ordenar_por)
+        if not mascaras:
+            return list(orden)
+        mascara = combinar_mascaras(mascaras)
+        return [i for i in orden if mascara[i]]
+
+    def cuerpo(self, variante: Hashable, construir: Callable[[], Any], max_variantes: int = 16):
+        """Devuelve el cuerpo de `variante`, construyéndolo la primera vez"""
+        if variante not in self.cuerpos:
+            if len(self.cuerpos) >= max_variantes:
+                self.cuerpos.clear()
+            self.cuerpos[variante] = construir()
+        return self.cuerpos[variante]
+
+    def filas(self, indices: List[int], campos: Optional[Tuple[str, ...]] = None) -> List[Dict]:
+        """Sin `campos` devuelve los dicts del snapshot sin copiarlos; con `campos`, dicts nuevos solo con esos campos"""
+        buses = self.buses
+        if campos is None:
+            return [buses[i] for i in indices]
+        if len(campos) == 1:
+            campo = campos[0]
+            return [{campo: buses[i][campo]} for i in indices]
+        obtener = itemgetter(*campos)
+        return [dict(zip(campos, obtener(buses[i]))) for i in indices]
+
+    def pagina(self, indices: List[int], limite: Optional[int], cursor: Optional[str]) -> Tuple[List[int], Optional[str], bool]:
+        """Tramo de `indices` desde `cursor` con hasta `limite` elementos.
+
+        Devuelve el tramo, el cursor del siguiente (None si no hay más) y si
+        el cursor venía de un resultado anterior de RedBus: en ese caso se
+        sigue por posición y puede haber buses repetidos u omitidos.
+        """
+        desde, de_otro_snapshot = 0, False
+        if cursor:
+            desde, version = decodificar_cursor(cursor)
+            de_otro_snapshot = version != self.version
+        if limite is None:
+            return indices[desde:], None, de_otro_snapshot
+        hasta = desde + limite
+        siguiente = codificar_cursor(hasta, self.version) if hasta < len(indices) else None
+        return indices[desde:hasta], siguiente, de_otro_snapshot
+
+    @property
+    def version(self) -> int:
+        return int(self.creado_en * 1000)
+
+    def resumen_dia(self) -> Dict:
+        """Agregado para el calendario de tarifas; el precio mínimo considera solo buses con asientos"""
+        disponibles = [i for i in range(len(self.buses)) if self.asientos[i] > 0 and self.precio_total[i] > 0]
+        ochoa = [i for i in disponibles if "ochoa" in self.empresa[i]]
+        resumen = {
+            "total_salidas": len(self.buses),
+            "salidas_con_asientos": len(disponibles),
+            "asientos_disponibles": sum(max(asientos, 0) for asientos in self.asientos),
+            "precio_minimo": self.buses[min(disponibles, key=self.precio_total.__getitem__)]["precio_total"] if disponibles else None,
+            "ochoa_mas_barato": None,
+        }
+        if ochoa:
+            bus = self.buses[min(ochoa, key=self.precio_total.__getitem__)]
+            resumen["ochoa_mas_barato"] = {
+                "hora_salida": bus["hora_salida"],
+                "tipo_bus": bus["tipo_bus"],
+                "precio_total": bus["precio_total"],
+                "asientos_disponibles": bus["asientos_disponibles"],
+            }
+        return resumen
+
+
+def combinar_mascaras(mascaras: List[bytearray]) -> bytes:
+    """AND byte a byte de máscaras de 0/1 del mismo largo, hecho como un AND de enteros"""
+    if len(mascaras) == 1:
+        return mascaras[0]
+    combinada = int.from_bytes(mascaras[0], "little")
+    for mascara in mascaras[1:]:
+        combinada &= int.from_bytes(mascara, "little")
+    return combinada.to_bytes(len(mascaras[0]), "little")
+
+
+def codificar_cursor(posicion: int, version: int) -> str:
+    return base64.urlsafe_b64encode(f"{posicion}:{version}".encode()).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor: str) -> Tuple[int, int]:
+    try:
+        posicion, version = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode().split(":")
+        posicion, version = int(posicion), int(version)
+    except ValueError:
+        raise ValueError("cursor inválido")
+    if posicion < 0:
+        raise ValueError("cursor inválido")
+    return posicion, version
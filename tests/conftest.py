@@ -0,0 +1,91 @@
+"""
+La API corre contra fake_redbus en el mismo proceso (httpx.ASGITransport),
+con el estado global de main reemplazado por instancias nuevas en cada prueba
+"""
+
+from datetime import date, timedelta
+
+import httpx
+import pytest
+
+import main
+from alertas import AlmacenAlertas, DifusorAlertas
+from cache import CacheBusquedas
+from ciudades import CacheCiudadesPersistente
+from config import CONFIG_ALERTAS, CONFIG_CACHE, CONFIG_CIUDADES, CONFIG_SERIES, CONFIG_UPSTREAM, CONFIG_WEBHOOKS
+from fake_redbus import ConfigFalsa, crear_app_falsa
+from persistencia import PersistenciaSQLite
+from planificador import PlanificadorMonitores
+from series import AlmacenSeries
+from upstream import ClienteRedBus
+from webhooks import EntregaWebhooks
+
+# Más de una página de RedBus (limite_pagina = 100)
+BUSES_POR_RUTA = 150
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def fecha():
+    return (date.today() + timedelta(days=30)).isoformat()
+
+
+@pytest.fixture
+def redbus():
+    """Config del RedBus falso: `tasa_error` se puede cambiar y `peticiones` cuenta las llamadas"""
+    return ConfigFalsa(BUSES_POR_RUTA, latencia_ms=0, jitter_ms=0)
+
+
+@pytest.fixture
+def transporte_redbus(redbus):
+    return httpx.ASGITransport(app=crear_app_falsa(redbus))
+
+
+@pytest.fixture
+def config_webhooks():
+    # Los receptores de prueba están en el RedBus falso ("http://redbus/..."), que no es un host público
+    return dict(CONFIG_WEBHOOKS, urls=[], ventana_segundos=0.05, backoff_base=0.01, backoff_maximo=0.05,
+                reintentos=3, espera_al_detener=2, permitir_redes_privadas=True)
+
+
+@pytest.fixture
+async def api(monkeypatch, tmp_path, transporte_redbus, config_webhooks):
+    """Cliente HTTP de main.app con estado vacío, persistencia en tmp_path y RedBus falso"""
+    upstream = ClienteRedBus(dict(CONFIG_UPSTREAM, backoff_base=0.001, backoff_maximo=0.01, peticiones_por_segundo=0),
+                             transport=transporte_redbus)
+    persistencia = PersistenciaSQLite(str(tmp_path / "buscador.db"), CONFIG_ALERTAS["max_alertas"])
+    persistencia.abrir()
+    entrega = EntregaWebhooks(config_webhooks, transport=transporte_redbus)
+    reemplazos = {
+        "upstream": upstream,
+        "persistencia": persistencia,
+        "entrega_webhooks": entrega,
+        "cache_busquedas": CacheBusquedas(CONFIG_CACHE["ttl_segundos"], CONFIG_CACHE["max_entradas"]),
+        "cache_ciudades": CacheCiudadesPersistente(str(tmp_path / "ciudades.json"), 3600, 600, CONFIG_CIUDADES["max_entradas"]),
+        "alertas_generadas": AlmacenAlertas(CONFIG_ALERTAS["max_alertas"]),
+        "difusor_alertas": DifusorAlertas(CONFIG_ALERTAS["cola_suscriptor"]),
+        "rutas_monitoreadas": {},
+        "estado_anterior": {},
+        "planificador": PlanificadorMonitores(),
+        "series_viajes": AlmacenSeries(CONFIG_SERIES["max_puntos_por_viaje"], CONFIG_SERIES["detalle_horas"] * 3600,
+                                       CONFIG_SERIES["resolucion_minutos"] * 60),
+        "escritura_ciudades": None,
+        "semaforo_lotes": None,
+        "bloqueo_volcado": None,
+    }
+    for nombre, valor in reemplazos.items():
+        monkeypatch.setattr(main, nombre, valor)
+    entrega.iniciar()
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://api") as cliente:
+        yield cliente
+
+    await entrega.detener()
+    if main.escritura_ciudades is not None:
+        main.escritura_ciudades.cancel()
+    persistencia.cerrar()
+    await upstream.cerrar()
@@ -0,0 +1,56 @@
+import pytest
+
+import main
+from alertas import AlmacenAlertas
+
+pytestmark = pytest.mark.anyio
+
+
+def nueva_alerta(empresa: str = "Rápido Ochoa", nivel: str = "ALTO", origen: str = "Medellín") -> dict:
+    return {"tipo": "CRITICO", "nivel": nivel, "mensaje": f"Quedan pocos puestos: {empresa}", "origen": origen,
+            "destino": "cartagena", "fecha": "2030-11-23", "empresa": empresa, "hora_salida": "08:00:00"}
+
+
+def publicar(alerta: dict):
+    """Como generar_alerta_si_necesario: guarda y avisa a los suscriptores"""
+    main.alertas_generadas.agregar(alerta)
+    main.difusor_alertas.publicar(alerta)
+
+
+def test_buffer_conserva_las_ultimas_alertas():
+    almacen = AlmacenAlertas(5)
+    for _ in range(8):
+        almacen.agregar(nueva_alerta())
+    alertas, cursor = almacen.consultar(limite=10)
+    assert [alerta["id"] for alerta in alertas] == [4, 5, 6, 7, 8]
+    assert cursor is None
+    assert [alerta["id"] for alerta in almacen.desde(6)] == [7, 8]
+
+
+def test_consultar_pagina_hacia_atras_con_filtros():
+    almacen = AlmacenAlertas(100)
+    for numero in range(10):
+        almacen.agregar(nueva_alerta(nivel="CRITICO" if numero % 2 else "ALTO"))
+    pagina, cursor = almacen.consultar({"nivel": "critico"}, limite=3)
+    assert [alerta["id"] for alerta in pagina] == [6, 8, 10]
+    pagina, cursor = almacen.consultar({"nivel": "critico"}, limite=3, antes_de=cursor)
+    assert [alerta["id"] for alerta in pagina] == [2, 4]
+    assert cursor is None
+
+
+def test_limpiar_no_reusa_ids():
+    almacen = AlmacenAlertas(10)
+    almacen.agregar(nueva_alerta())
+    almacen.limpiar()
+    assert almacen.agregar(nueva_alerta())["id"] == 2
+    assert len(almacen) == 1
+
+
+async def test_alertas_filtra_empresa_por_contenido(api):
+    publicar(nueva_alerta("Rápido Ochoa"))
+    publicar(nueva_alerta("Brasilia"))
+    publicar(nueva_alerta("Expreso Ochoa Sur", nivel="CRITICO"))
+    respuesta = (await api.get("/alertas", params={"empresa": "ochoa"})).json()
+    assert [alerta["empresa"] for alerta in respuesta["alertas"]] == ["Rápido Ochoa", "Expreso Ochoa Sur"]
+    respuesta = (await api.get("/alertas", params={"empresa": "OCHOA", "nivel": "critico", "origen": "medellin"})).json()
+    assert [alerta["id"] for alerta in respuesta["alertas"]] == [3]
@@ -0,0 +1,68 @@
+import asyncio
+import json
+
+import pytest
+
+import main
+from alertas import DifusorAlertas
+
+pytestmark = pytest.mark.anyio
+
+
+def nueva_alerta(empresa: str = "Rápido Ochoa", nivel: str = "ALTO", origen: str = "Medellín") -> dict:
+    return {"tipo": "CRITICO", "nivel": nivel, "mensaje": f"Quedan pocos puestos: {empresa}", "origen": origen,
+            "destino": "cartagena", "fecha": "2030-11-23", "empresa": empresa, "hora_salida": "08:00:00"}
+
+
+def publicar(alerta: dict):
+    """Como generar_alerta_si_necesario: guarda y avisa a los suscriptores"""
+    main.alertas_generadas.agregar(alerta)
+    main.difusor_alertas.publicar(alerta)
+
+
+async def eventos_stream(desde_id=None, cantidad=1, **filtros):
+    """Primeros eventos de /alertas/stream. Se llama al endpoint directamente:
+    ASGITransport no entrega el cuerpo de una respuesta que no termina."""
+    respuesta = await main.stream_alertas(desde_id=desde_id, last_event_id=None, **filtros)
+    eventos = []
+    try:
+        while len(eventos) < cantidad:
+            evento = await asyncio.wait_for(respuesta.body_iterator.__anext__(), 1)
+            if evento.startswith("id:"):
+                eventos.append(json.loads(evento.split("data: ", 1)[1]))
+    finally:
+        await respuesta.body_iterator.aclose()
+    return eventos
+
+
+def test_suscriptor_lento_se_descarta():
+    difusor = DifusorAlertas(tamano_cola=2)
+    lento = difusor.suscribir({})
+    for _ in range(3):
+        difusor.publicar(nueva_alerta())
+    assert lento.descartado and len(difusor) == 0
+    assert difusor.descartados == 1
+
+
+async def test_stream_retoma_desde_el_ultimo_id(api):
+    for empresa in ("Rápido Ochoa", "Brasilia", "Copetran"):
+        publicar(nueva_alerta(empresa))
+    eventos = await eventos_stream(desde_id=1, cantidad=2)
+    assert [evento["id"] for evento in eventos] == [2, 3]
+
+
+async def test_stream_recibe_alertas_nuevas_sin_repetir(api):
+    publicar(nueva_alerta())
+    respuesta = asyncio.ensure_future(eventos_stream(desde_id=0, cantidad=2, empresa="ochoa"))
+    await asyncio.sleep(0.05)
+    publicar(nueva_alerta("Brasilia"))
+    publicar(nueva_alerta("Expreso Ochoa Sur"))
+    assert [evento["id"] for evento in await respuesta] == [1, 3]
+
+
+async def test_stream_con_id_de_antes_de_un_reinicio_reenvia_todo(api):
+    # Sin alertas guardadas los ids vuelven a empezar en 1 tras reiniciar
+    publicar(nueva_alerta("Rápido Ochoa"))
+    publicar(nueva_alerta("Brasilia"))
+    eventos = await eventos_stream(desde_id=57, cantidad=2)
+    assert [evento["id"] for evento in eventos] == [1, 2]
@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+
+from cache import CacheBusquedas
+
+pytestmark = pytest.mark.anyio
+
+
+def cargador(valores):
+    """Carga que devuelve 1, 2, 3... y cuenta sus llamadas en `valores`"""
+    async def cargar():
+        valores.append(len(valores) + 1)
+        await asyncio.sleep(0.01)
+        return valores[-1]
+    return cargar
+
+
+async def test_reusa_el_valor_hasta_el_ttl():
+    cache = CacheBusquedas(ttl=0.05, max_entradas=10)
+    cargas = []
+    assert await cache.obtener("ruta", cargador(cargas)) == 1
+    assert await cache.obtener("ruta", cargador(cargas)) == 1
+    await asyncio.sleep(0.06)
+    assert await cache.obtener("ruta", cargador(cargas)) == 2
+    assert (cache.aciertos, cache.fallos) == (1, 2)
+
+
+async def test_cargas_simultaneas_de_la_misma_clave_se_hacen_una_vez():
+    cache = CacheBusquedas(ttl=60, max_entradas=10)
+    cargas = []
+    resultados = await asyncio.gather(*[cache.obtener("ruta", cargador(cargas)) for _ in range(10)])
+    assert resultados == [1] * 10
+    assert cargas == [1]
+    assert cache.coalescidas == 9
+    assert not cache.en_vuelo
+
+
+async def test_error_al_cargar_no_queda_en_cache():
+    cache = CacheBusquedas(ttl=60, max_entradas=10)
+
+    async def fallar():
+        raise RuntimeError("RedBus caído")
+
+    with pytest.raises(RuntimeError):
+        await cache.obtener("ruta", fallar)
+    assert len(cache) == 0 and not cache.en_vuelo
+    assert await cache.obtener("ruta", cargador([])) == 1
+
+
+async def test_guardar_si_descarta_resultados_incompletos():
+    cache = CacheBusquedas(ttl=60, max_entradas=10)
+    cargas = []
+    await cache.obtener("ruta", cargador(cargas), guardar_si=lambda valor: False)
+    assert len(cache) == 0
+
+
+async def test_busquedas_simultaneas_consultan_redbus_una_vez(api, redbus, fecha):
+    params = {"origen": "medellin", "destino": "cartagena", "fecha": fecha}
+    respuestas = await asyncio.gather(*[api.get("/buscar", params=params) for _ in range(8)])
+    assert {respuesta.status_code for respuesta in respuestas} == {200}
+    assert {respuesta.json()["total_buses"] for respuesta in respuestas} == {150}
+    # Dos páginas de 100, una sola vez
+    assert redbus.peticiones["search"] == 2
+
+
+async def test_refrescar_no_cuenta_en_las_estadisticas():
+    cache = CacheBusquedas(ttl=60, max_entradas=10)
+    cargas = []
+    await cache.refrescar("ruta", cargador(cargas))
+    await cache.refrescar("ruta", cargador(cargas))
+    assert cargas == [1, 2]
+    assert (cache.aciertos, cache.fallos, cache.coalescidas) == (0, 0, 0)
+    assert await cache.obtener("ruta", cargador(cargas)) == 2
+    assert (cache.aciertos, cache.fallos) == (1, 0)
@@ -0,0 +1,65 @@
+import asyncio
+import json
+
+import pytest
+
+import main
+from ciudades import CacheCiudadesPersistente, indice_ciudades
+from config import CONFIG_CIUDADES
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.mark.parametrize("nombre, slug", [
+    ("Medellín", "medellin"),
+    ("  STA. MARTA ", "santa marta"),
+    ("santamarta", "santa marta"),
+    ("Pto Berrío", "puerto berrio"),
+])
+def test_resolver_nombres_exactos_y_abreviaturas(nombre, slug):
+    assert indice_ciudades.resolver(nombre) == indice_ciudades.ciudades[slug]
+
+
+@pytest.mark.parametrize("nombre", ["Girardot", "Sincé", "Santa Rosa", "Puerto", "cartajena"])
+def test_resolver_no_adivina_otra_ciudad(nombre):
+    assert indice_ciudades.resolver(nombre) is None
+
+
+def test_autocompletar_usa_prefijos_y_errores_leves():
+    assert indice_ciudades.autocompletar("sta mar", 5)[0]["slug"] == "santa marta"
+    assert indice_ciudades.autocompletar("cartajena", 5)[0]["slug"] == "cartagena"
+
+
+async def test_ciudad_fuera_del_indice_se_busca_en_redbus(api, redbus, fecha):
+    respuesta = await api.get("/buscar", params={"origen": "Girardot", "destino": "cartagena", "fecha": fecha})
+    assert respuesta.status_code == 200
+    assert respuesta.json()["origen"]["nombre_completo"] == "Girardot (Todos)"
+    assert redbus.peticiones["solar"] == 1
+
+
+async def test_ciudades_nuevas_se_escriben_juntas_despues_de_la_espera(api, redbus, tmp_path, monkeypatch):
+    monkeypatch.setitem(CONFIG_CIUDADES, "espera_escritura_segundos", 0.05)
+    nombres = [f"vereda {numero}" for numero in range(20)]
+    ciudades = await asyncio.gather(*[main.buscar_ciudad_redbus(nombre) for nombre in nombres])
+    assert all(ciudades)
+    archivo = tmp_path / "ciudades.json"
+    assert not archivo.exists()
+
+    await asyncio.sleep(0.1)
+    assert len(json.loads(archivo.read_text(encoding="utf-8"))) == 20
+    assert await main.buscar_ciudad_redbus("vereda 3") == ciudades[3]
+    assert redbus.peticiones["solar"] == 20
+
+
+def test_contenido_de_la_cache_de_ciudades_no_cambia_al_seguir_guardando(tmp_path):
+    archivo = tmp_path / "ciudades.json"
+    cache = CacheCiudadesPersistente(str(archivo), 3600, 600, 100)
+    cache.guardar("vereda", {"id": "1", "name": "Vereda"})
+    contenido = cache.tomar_contenido()
+    cache.guardar("otra", None)
+    cache.escribir(contenido)
+    assert list(json.loads(archivo.read_text(encoding="utf-8"))) == ["vereda"]
+    assert cache.tomar_contenido() is not None and cache.tomar_contenido() is None
+
+    recargada = CacheCiudadesPersistente(str(archivo), 3600, 600, 100)
+    assert recargada.obtener("Vereda") == (True, {"id": "1", "name": "Vereda"})
@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+
+from upstream import PRIORIDADES, LimitadorTokens, LimiteSaturado
+
+pytestmark = pytest.mark.anyio
+
+
+def nuevo_limitador(tasa: float = 50, rafaga: int = 1, max_en_cola: int = 10) -> LimitadorTokens:
+    return LimitadorTokens(tasa, rafaga, {prioridad: max_en_cola for prioridad in PRIORIDADES})
+
+
+async def test_sin_tokens_atiende_primero_la_prioridad_mas_alta():
+    limitador = nuevo_limitador()
+    await limitador.adquirir("interactivo")
+    orden = []
+
+    async def pedir(prioridad):
+        await limitador.adquirir(prioridad)
+        orden.append(prioridad)
+
+    tareas = [asyncio.ensure_future(pedir(prioridad)) for prioridad in ("prefetch", "monitor", "interactivo")]
+    await asyncio.gather(*tareas)
+    assert orden == ["interactivo", "monitor", "prefetch"]
+
+
+async def test_cola_llena_responde_al_instante():
+    limitador = nuevo_limitador(tasa=1, max_en_cola=1)
+    await limitador.adquirir("monitor")
+    tarea = asyncio.ensure_future(limitador.adquirir("monitor"))
+    await asyncio.sleep(0)
+    with pytest.raises(LimiteSaturado):
+        await limitador.adquirir("monitor")
+    tarea.cancel()
+    limitador.despachador.cancel()
+
+
+async def test_token_entregado_a_quien_se_cancela_vuelve_al_balde():
+    limitador = nuevo_limitador(tasa=1)
+    await limitador.adquirir("interactivo")
+    tarea = asyncio.ensure_future(limitador.adquirir("interactivo"))
+    await asyncio.sleep(0)
+
+    # Como el despachador: le da el token y, antes de que la tarea siga, se cancela
+    antes = limitador.disponibles()
+    futuro = limitador._siguiente()
+    limitador.tokens -= 1
+    futuro.set_result(None)
+    tarea.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await tarea
+    assert limitador.disponibles() == pytest.approx(antes, abs=0.05)
+    limitador.despachador.cancel()
@@ -0,0 +1,46 @@
+import json
+import logging
+import queue
+
+from logs import ColaSinBloqueo, FormatoJSON, FormatoTexto
+
+
+def registrar_error(cola: queue.Queue) -> logging.LogRecord:
+    logger = logging.getLogger("buscador.pruebas.logs")
+    logger.propagate = False
+    manejador = ColaSinBloqueo(cola)
+    logger.addHandler(manejador)
+    try:
+        try:
+            {}["origen"]
+        except KeyError:
+            logger.exception("Error buscando %s", "medellin")
+    finally:
+        logger.removeHandler(manejador)
+    return cola.get_nowait()
+
+
+def test_traceback_va_en_el_campo_error_del_json():
+    datos = json.loads(FormatoJSON().format(registrar_error(queue.Queue())))
+    assert datos["mensaje"] == "Error buscando medellin"
+    assert "Traceback" in datos["error"] and "KeyError" in datos["error"]
+
+
+def test_formato_texto_sigue_mostrando_el_traceback():
+    texto = FormatoTexto().format(registrar_error(queue.Queue()))
+    assert "Error buscando medellin" in texto and "KeyError: 'origen'" in texto
+
+
+def test_cola_llena_descarta_sin_bloquear():
+    cola = queue.Queue(1)
+    cola.put_nowait(None)
+    descartados = ColaSinBloqueo.descartados
+    logger = logging.getLogger("buscador.pruebas.cola")
+    logger.propagate = False
+    manejador = ColaSinBloqueo(cola)
+    logger.addHandler(manejador)
+    try:
+        logger.warning("sin lugar")
+    finally:
+        logger.removeHandler(manejador)
+    assert ColaSinBloqueo.descartados == descartados + 1
@@ -0,0 +1,38 @@
+import json
+import time
+
+import pytest
+
+import main
+
+pytestmark = pytest.mark.anyio
+
+
+async def buscar_lote(api, consultas, **extra):
+    respuesta = await api.post("/buscar-lote", json={"consultas": consultas, **extra})
+    assert respuesta.status_code == 200
+    lineas = [json.loads(linea) for linea in respuesta.text.splitlines()]
+    registros = {indice: linea for linea in lineas[:-1] for indice in linea["indices"]}
+    return registros, lineas[-1]
+
+
+async def test_consultas_repetidas_se_buscan_una_vez(api, redbus, fecha):
+    consulta = {"origen": "medellin", "destino": "cartagena", "fecha": fecha}
+    registros, resumen = await buscar_lote(api, [consulta, consulta, {**consulta, "fecha": "ayer"}],
+                                           empresa="ochoa", campos=["empresa"])
+    assert resumen == {"resumen": True, "consultas": 3, "consultas_unicas": 1, "exitosas": 1, "con_error": 1}
+    assert registros[0] is registros[1] and registros[0]["exito"]
+    assert all("ochoa" in horario["empresa"].lower() for horario in registros[0]["horarios"])
+    assert registros[2]["error"] == "Formato de fecha inválido"
+    assert redbus.peticiones["search"] == 2
+
+
+async def test_redbus_caido_solo_falla_las_consultas_con_ciudades_sin_resolver(api, fecha):
+    conocida = {"origen": "medellin", "destino": "cartagena", "fecha": fecha}
+    await api.get("/buscar", params=conocida)
+    main.upstream.circuito.abierto_desde = time.monotonic()
+
+    registros, resumen = await buscar_lote(api, [{"origen": "medellin", "destino": "vereda nueva", "fecha": fecha}, conocida])
+    assert registros[0]["exito"] is False and "RedBus no disponible" in registros[0]["error"]
+    assert registros[1]["exito"] is True and registros[1]["total_buses"] == 150
+    assert (resumen["exitosas"], resumen["con_error"]) == (1, 1)
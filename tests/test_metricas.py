@@ -0,0 +1,14 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_metricas_acumuladas_se_exponen_como_contadores(api, fecha):
+    params = {"origen": "medellin", "destino": "cartagena", "fecha": fecha}
+    await api.get("/buscar", params=params)
+    await api.get("/buscar", params=params)
+    texto = (await api.get("/metrics")).text
+    assert "# TYPE cache_busquedas_aciertos_total counter" in texto
+    assert "cache_busquedas_aciertos_total 1" in texto
+    assert "cache_busquedas_fallos_total 1" in texto
+    assert "# TYPE alertas_suscriptores_descartados_total counter" in texto
@@ -0,0 +1,47 @@
+import pytest
+
+import main
+
+pytestmark = pytest.mark.anyio
+
+
+def envejecer_cache(segundos: float):
+    for clave, (guardado_en, valor) in list(main.cache_busquedas.entradas.items()):
+        main.cache_busquedas.entradas[clave] = (guardado_en - segundos, valor)
+
+
+async def test_revision_no_reusa_resultados_de_la_revision_anterior(api, redbus, fecha):
+    monitor = main.MonitorRuta("medellin", "cartagena", fecha)
+    monitor.intervalo = 30
+    main.rutas_monitoreadas[monitor.id] = monitor
+    await api.get("/buscar", params={"origen": "medellin", "destino": "cartagena", "fecha": fecha})
+    await main.ejecutar_ciclo_monitores([monitor])
+    assert redbus.peticiones["search"] == 2
+
+    # Dentro del TTL de la cache, pero más viejo que medio intervalo del monitor
+    envejecer_cache(20)
+    await main.ejecutar_ciclo_monitores([monitor])
+    assert redbus.peticiones["search"] == 4
+
+
+async def test_series_usan_la_hora_de_la_consulta_a_redbus(api, fecha):
+    monitor = main.MonitorRuta("medellin", "cartagena", fecha)
+    main.rutas_monitoreadas[monitor.id] = monitor
+    await main.ejecutar_ciclo_monitores([monitor])
+    snapshot = next(iter(main.cache_busquedas.entradas.values()))[1]
+    ruta = main.clave_ruta_series("medellin", "cartagena", main.convertir_fecha_a_redbus(fecha))
+    series = main.series_viajes.viajes(ruta).values()
+    assert {serie.tiempos[-1] for serie in series} == {snapshot.creado_en}
+
+    # El mismo resultado servido otra vez desde la cache no agrega puntos
+    await main.ejecutar_ciclo_monitores([monitor])
+    assert {len(serie) for serie in series} == {1}
+
+
+async def test_monitores_de_la_misma_ruta_y_fecha_comparten_una_busqueda(api, redbus, fecha):
+    monitores = [main.MonitorRuta("medellin", "cartagena", fecha),
+                 main.MonitorRuta("Medellín", "Cartagena", fecha, empresa_especifica="ochoa"),
+                 main.MonitorRuta("medellin", "cartagena", fecha, horario_especifico="08:00")]
+    assert await main.ejecutar_ciclo_monitores(monitores) == 1
+    assert redbus.peticiones["search"] == 2
+    assert all(monitor.ultima_revision is not None for monitor in monitores)
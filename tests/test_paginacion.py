@@ -0,0 +1,42 @@
+import pytest
+
+import main
+from fake_redbus import generar_inventario
+from snapshot import SnapshotResultados, codificar_cursor
+
+pytestmark = pytest.mark.anyio
+
+
+def test_filas_solo_con_los_campos_pedidos():
+    snapshot = SnapshotResultados(main.normalizar_resultados_redbus({"inventories": generar_inventario("195160", "195176", "23-Nov-2030", 5)}))
+    filas = snapshot.filas([1, 2], ("empresa", "precio_total"))
+    assert filas == [{"empresa": snapshot.buses[i]["empresa"], "precio_total": snapshot.buses[i]["precio_total"]} for i in (1, 2)]
+    assert snapshot.filas([3], ("rating",)) == [{"rating": snapshot.buses[3]["rating"]}]
+
+
+async def test_paginas_con_cursor_recorren_todos_los_horarios(api, fecha):
+    params = {"origen": "medellin", "destino": "cartagena", "fecha": fecha, "limite": 40, "campos": "servicio,hora_salida"}
+    servicios = []
+    cursor = None
+    while True:
+        respuesta = (await api.get("/buscar", params={**params, **({"cursor": cursor} if cursor else {})})).json()
+        assert respuesta["total_buses"] == 150
+        assert all(set(horario) == {"servicio", "hora_salida"} for horario in respuesta["horarios"])
+        servicios += [horario["servicio"] for horario in respuesta["horarios"]]
+        cursor = respuesta["siguiente_cursor"]
+        if cursor is None:
+            break
+    assert len(servicios) == len(set(servicios)) == 150
+
+
+async def test_cursor_de_otro_resultado_se_marca(api, fecha):
+    respuesta = await api.get("/buscar-avanzado", params={"origen": "medellin", "destino": "cartagena", "fecha": fecha,
+                                                          "limite": 10, "cursor": codificar_cursor(10, 1)})
+    assert respuesta.json()["cursor_de_resultado_anterior"] is True
+    assert len(respuesta.json()["horarios"]) == 10
+
+
+@pytest.mark.parametrize("params", [{"cursor": "no-es-un-cursor"}, {"limite": 0}, {"campos": "no_existe"}])
+async def test_parametros_de_pagina_invalidos(api, fecha, params):
+    respuesta = await api.get("/buscar", params={"origen": "medellin", "destino": "cartagena", "fecha": fecha, **params})
+    assert respuesta.status_code == 400
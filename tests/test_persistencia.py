@@ -0,0 +1,110 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+import main
+from config import CONFIG_ALERTAS, CONFIG_PERSISTENCIA
+from persistencia import PersistenciaSQLite
+
+pytestmark = pytest.mark.anyio
+
+
+def reabrir(tmp_path) -> PersistenciaSQLite:
+    persistencia = PersistenciaSQLite(str(tmp_path / "buscador.db"), CONFIG_ALERTAS["max_alertas"])
+    persistencia.abrir()
+    return persistencia
+
+
+def cargar_guardado(tmp_path) -> dict:
+    persistencia = reabrir(tmp_path)
+    try:
+        return persistencia.cargar()
+    finally:
+        persistencia.cerrar()
+
+
+async def test_monitores_estados_alertas_y_webhooks_sobreviven_un_reinicio(api, tmp_path, fecha):
+    respuesta = await api.post("/monitorear", params={"origen": "medellin", "destino": "cartagena", "fecha": fecha})
+    monitor_id = respuesta.json()["monitor_id"]
+    await main.ejecutar_ciclo_monitores()
+    await api.post("/webhooks", json={"url": "http://redbus/webhook/ops", "empresa": "ochoa"})
+    await main.volcar_persistencia()
+    assert not main.persistencia.hay_pendientes()
+    alertas = len(main.alertas_generadas)
+
+    guardado = cargar_guardado(tmp_path)
+    assert [monitor["id"] for monitor in guardado["monitores"]] == [monitor_id]
+    assert guardado["monitores"][0]["ultima_revision"] is not None
+    assert len(guardado["estados"]) == len(main.estado_anterior) > 0
+    assert len(guardado["alertas"]) == alertas > 0
+    assert [webhook["filtros"] for webhook in guardado["webhooks"]] == [{"empresa": "ochoa"}]
+
+
+async def test_restaurar_estado_continua_los_ids_de_alertas(api, tmp_path, monkeypatch, fecha):
+    monitor = main.MonitorRuta("medellin", "cartagena", fecha)
+    main.rutas_monitoreadas[monitor.id] = monitor
+    await main.ejecutar_ciclo_monitores([monitor])
+    await main.volcar_persistencia()
+    ultimo_id = main.alertas_generadas.siguiente_id - 1
+
+    main.rutas_monitoreadas.clear()
+    monkeypatch.setattr(main, "alertas_generadas", type(main.alertas_generadas)(CONFIG_ALERTAS["max_alertas"]))
+    monkeypatch.setattr(main, "persistencia", reabrir(tmp_path))
+    main.restaurar_estado()
+    assert list(main.rutas_monitoreadas) == [monitor.id]
+    assert main.alertas_generadas.agregar({"nivel": "ALTO", "tipo": "CRITICO"})["id"] == ultimo_id + 1
+    main.persistencia.cerrar()
+
+
+async def test_retirar_monitor_y_limpiar_alertas_se_guardan(api, tmp_path, fecha):
+    respuesta = await api.post("/monitorear", params={"origen": "medellin", "destino": "cartagena", "fecha": fecha})
+    await main.ejecutar_ciclo_monitores()
+    await main.volcar_persistencia()
+
+    await api.delete(f"/monitorear/{respuesta.json()['monitor_id']}")
+    await api.delete("/alertas")
+    await main.volcar_persistencia()
+    guardado = cargar_guardado(tmp_path)
+    assert guardado["monitores"] == [] and guardado["estados"] == [] and guardado["alertas"] == []
+
+
+async def test_lote_que_falla_vuelve_a_los_pendientes(api, monkeypatch, fecha):
+    monitor = main.MonitorRuta("medellin", "cartagena", fecha)
+    main.persistencia.guardar_monitor(monitor)
+    main.persistencia.guardar_alerta({"id": 1, "nivel": "ALTO"})
+    escribir = main.persistencia.escribir
+
+    def fallar(pendientes):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(main.persistencia, "escribir", fallar)
+    await main.volcar_persistencia()
+    main.persistencia.quitar_monitor(monitor.id)
+    main.persistencia.guardar_alerta({"id": 2, "nivel": "ALTO"})
+    assert main.persistencia.monitores_pendientes == {monitor.id: None}
+    assert [alerta["id"] for alerta in main.persistencia.alertas_pendientes] == [1, 2]
+
+    monkeypatch.setattr(main.persistencia, "escribir", escribir)
+    await main.volcar_persistencia()
+    assert not main.persistencia.hay_pendientes()
+
+
+def test_limpiar_despues_de_un_fallo_descarta_las_alertas_del_lote(tmp_path):
+    persistencia = PersistenciaSQLite(str(tmp_path / "buscador.db"), 10)
+    persistencia.guardar_alerta({"id": 1})
+    pendientes = persistencia.tomar_pendientes()
+    persistencia.limpiar_alertas()
+    persistencia.devolver_pendientes(pendientes)
+    assert persistencia.alertas_pendientes == [] and persistencia.borrar_alertas
+
+
+async def test_los_cambios_se_vuelcan_sin_esperar_al_monitoreo(api, tmp_path, monkeypatch):
+    monkeypatch.setitem(CONFIG_PERSISTENCIA, "intervalo_volcado_segundos", 0.01)
+    tarea = asyncio.ensure_future(main.persistencia_loop())
+    try:
+        await api.post("/webhooks", json={"url": "http://redbus/webhook/ops"})
+        await asyncio.sleep(0.1)
+    finally:
+        tarea.cancel()
+    assert len(cargar_guardado(tmp_path)["webhooks"]) == 1
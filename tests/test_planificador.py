@@ -0,0 +1,66 @@
+from datetime import date, datetime
+
+import pytest
+
+import main
+from config import CONFIG_ALERTAS
+from planificador import PlanificadorMonitores, calcular_intervalo_revision
+
+pytestmark = pytest.mark.anyio
+
+
+def test_planificador_entrega_los_vencidos_en_orden():
+    planificador = PlanificadorMonitores()
+    planificador.programar("b", 20)
+    planificador.programar("a", 10)
+    planificador.programar("c", 30)
+    assert planificador.extraer_vencidos(25) == ["a", "b"]
+    assert planificador.segundos_hasta_proxima(25, 1800) == 5
+    assert len(planificador) == 1
+
+
+def test_planificador_reprogramar_y_quitar_descartan_la_entrada_anterior():
+    planificador = PlanificadorMonitores()
+    planificador.programar("a", 10)
+    planificador.programar("a", 50)
+    planificador.programar("b", 10)
+    planificador.quitar("b")
+    assert planificador.extraer_vencidos(20) == []
+    assert planificador.extraer_vencidos(50) == ["a"]
+    assert planificador.segundos_hasta_proxima(50, 1800) == 1800
+
+
+def test_intervalo_queda_entre_minimo_y_maximo():
+    cercano = calcular_intervalo_revision(0.5, 2, 10.0, CONFIG_ALERTAS)
+    config = dict(CONFIG_ALERTAS, intervalo_maximo=1000)
+    lejano = calcular_intervalo_revision(24 * 30, 40, 0.0, config)
+    assert cercano == CONFIG_ALERTAS["intervalo_minimo"]
+    assert lejano == 1000
+    assert cercano < calcular_intervalo_revision(48, 20, 0.0, CONFIG_ALERTAS) < lejano
+
+
+async def test_monitorear_programa_una_revision_inmediata(api, fecha):
+    respuesta = await api.post("/monitorear", params={"origen": "medellin", "destino": "cartagena", "fecha": fecha})
+    monitor_id = respuesta.json()["monitor_id"]
+    assert main.planificador.extraer_vencidos(datetime.now().timestamp()) == [monitor_id]
+
+    await api.delete(f"/monitorear/{monitor_id}")
+    assert monitor_id not in main.rutas_monitoreadas
+
+
+async def test_revision_completa_cuenta_las_salidas_pendientes(api, fecha):
+    monitor = main.MonitorRuta("medellin", "cartagena", fecha)
+    main.rutas_monitoreadas[monitor.id] = monitor
+    await main.ejecutar_ciclo_monitores([monitor])
+    assert monitor.salidas_pendientes == 150
+    assert monitor.proxima_salida is not None
+    assert not main.monitor_vencido(monitor, datetime.now())
+
+
+async def test_paginas_fallidas_no_retiran_el_monitor(api, redbus):
+    redbus.tasa_error = 1.0
+    monitor = main.MonitorRuta("medellin", "cartagena", date.today().isoformat())
+    main.rutas_monitoreadas[monitor.id] = monitor
+    await main.ejecutar_ciclo_monitores([monitor])
+    assert monitor.salidas_pendientes is None
+    assert not main.monitor_vencido(monitor, datetime.now())
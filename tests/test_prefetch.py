@@ -0,0 +1,22 @@
+import pytest
+
+import main
+from upstream import prioridad_redbus
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_precarga_no_cambia_la_tasa_de_aciertos(api, redbus, fecha):
+    origen_data, destino_data = await main.resolver_ruta("medellin", "cartagena")
+    # Como en prefetch_loop
+    token = prioridad_redbus.set("prefetch")
+    try:
+        await main.precargar("ruta", origen_data, destino_data, main.convertir_fecha_a_redbus(fecha))
+    finally:
+        prioridad_redbus.reset(token)
+    assert redbus.peticiones["search"] == 2
+    assert (main.cache_busquedas.aciertos, main.cache_busquedas.fallos) == (0, 0)
+
+    await api.get("/buscar", params={"origen": "medellin", "destino": "cartagena", "fecha": fecha})
+    assert (main.cache_busquedas.aciertos, main.cache_busquedas.fallos) == (1, 0)
+    assert redbus.peticiones["search"] == 2
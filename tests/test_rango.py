@@ -0,0 +1,35 @@
+import pytest
+
+import main
+from config import CONFIG_PREFETCH
+from popularidad import RankingPopularidad
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_calendario_resume_cada_dia(api, redbus, fecha):
+    respuesta = await api.get("/buscar-rango", params={"origen": "medellin", "destino": "cartagena",
+                                                       "fecha_inicio": fecha, "dias": 3})
+    datos = respuesta.json()
+    assert [dia["total_salidas"] for dia in datos["calendario"]] == [150] * 3
+    assert datos["dia_mas_barato"] in [dia["fecha"] for dia in datos["calendario"]]
+    assert datos["dia_con_mas_asientos"] == max(datos["calendario"], key=lambda dia: dia["asientos_disponibles"])["fecha"]
+    assert redbus.peticiones["search"] == 3 * 2
+
+
+async def test_dias_con_error_no_se_eligen(api, redbus, fecha):
+    redbus.tasa_error = 1.0
+    respuesta = await api.get("/buscar-rango", params={"origen": "medellin", "destino": "cartagena",
+                                                       "fecha_inicio": fecha, "dias": 3})
+    datos = respuesta.json()
+    assert all(dia.get("paginas_faltantes") or "error" in dia for dia in datos["calendario"])
+    assert datos["dia_mas_barato"] is None and datos["dia_con_mas_asientos"] is None
+
+
+async def test_fechas_del_calendario_no_cuentan_para_el_prefetch(api, monkeypatch, fecha):
+    monkeypatch.setattr(main, "rutas_populares", RankingPopularidad(10, CONFIG_PREFETCH["ancho_sketch"],
+                                                                    CONFIG_PREFETCH["profundidad_sketch"]))
+    await api.get("/buscar-rango", params={"origen": "medellin", "destino": "cartagena", "fecha_inicio": fecha, "dias": 5})
+    assert main.rutas_populares.mas_populares(10) == []
+    await api.get("/buscar", params={"origen": "medellin", "destino": "cartagena", "fecha": fecha})
+    assert len(main.rutas_populares.mas_populares(10)) == 1
@@ -0,0 +1,47 @@
+import asyncio
+
+import pytest
+
+import main
+from cache import CacheBusquedas
+
+pytestmark = pytest.mark.anyio
+
+
+def cargador(valores):
+    """Carga que devuelve 1, 2, 3... y cuenta sus llamadas en `valores`"""
+    async def cargar():
+        valores.append(len(valores) + 1)
+        await asyncio.sleep(0.01)
+        return valores[-1]
+    return cargar
+
+
+async def test_vencido_en_gracia_se_sirve_y_se_refresca_en_segundo_plano():
+    cache = CacheBusquedas(ttl=0.02, max_entradas=10)
+    cargas = []
+    await cache.obtener("ruta", cargador(cargas))
+    await asyncio.sleep(0.03)
+    assert await cache.obtener("ruta", cargador(cargas), gracia=60) == 1
+    assert cache.desactualizadas == 1
+    await asyncio.sleep(0.03)
+    assert cargas == [1, 2]
+    assert cache.obtener_vencido("ruta") == 2
+
+
+async def test_max_edad_no_acepta_entradas_viejas_aunque_esten_vigentes():
+    cache = CacheBusquedas(ttl=60, max_entradas=10)
+    cargas = []
+    await cache.obtener("ruta", cargador(cargas))
+    await asyncio.sleep(0.02)
+    assert await cache.obtener("ruta", cargador(cargas), max_edad=0.01) == 2
+
+
+async def test_busqueda_vencida_responde_desactualizada_y_refresca(api, redbus, fecha):
+    params = {"origen": "medellin", "destino": "cartagena", "fecha": fecha}
+    await api.get("/buscar", params=params)
+    main.cache_busquedas.ttl = 0
+    respuesta = await api.get("/buscar", params=params)
+    assert respuesta.json()["desactualizado"] is True
+    await asyncio.sleep(0.1)
+    assert redbus.peticiones["search"] == 4
@@ -0,0 +1,46 @@
+import pytest
+
+import main
+from fake_redbus import generar_inventario
+from snapshot import SnapshotResultados, hora_a_segundos
+
+
+@pytest.fixture(scope="module")
+def snapshot():
+    buses = main.normalizar_resultados_redbus({"inventories": generar_inventario("195160", "195176", "23-Nov-2030", 300)})
+    buses[0]["hora_salida"] = "N/A"
+    return SnapshotResultados(buses)
+
+
+def filtrar_bus_por_bus(snapshot, ordenar_por, **filtros):
+    def cumple(bus):
+        salida = hora_a_segundos(bus["hora_salida"])
+        return all((
+            filtros.get("empresa") is None or filtros["empresa"].lower() in bus["empresa"].lower(),
+            filtros.get("precio_max") is None or bus["precio_total"] <= filtros["precio_max"],
+            filtros.get("hora_min") is None or salida >= hora_a_segundos(filtros["hora_min"]),
+            filtros.get("hora_max") is None or 0 <= salida <= hora_a_segundos(filtros["hora_max"]),
+            not filtros.get("solo_cama") or bus["es_cama"],
+            filtros.get("rating_min") is None or bus["rating"] >= filtros["rating_min"],
+        ))
+    return [i for i in snapshot.orden(ordenar_por) if cumple(snapshot.buses[i])]
+
+
+@pytest.mark.parametrize("ordenar_por, filtros", [
+    ("hora", {}),
+    ("precio", {"empresa": "OCHOA"}),
+    ("hora", {"hora_max": "12:00"}),
+    ("rating", {"precio_max": 150000, "hora_min": "06:00", "solo_cama": True}),
+    ("duracion", {"empresa": "a", "rating_min": 4.0, "hora_max": "23:00"}),
+])
+def test_seleccionar_cumple_todos_los_filtros_en_orden(snapshot, ordenar_por, filtros):
+    assert snapshot.seleccionar(ordenar_por, **filtros) == filtrar_bus_por_bus(snapshot, ordenar_por, **filtros)
+
+
+def test_seleccionar_sin_buses():
+    assert SnapshotResultados([]).seleccionar("precio", solo_ac=True, precio_min=1) == []
+
+
+def test_hora_invalida():
+    with pytest.raises(ValueError):
+        SnapshotResultados([]).seleccionar(hora_min="tarde")
@@ -0,0 +1,62 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+import main
+from upstream import RedBusNoDisponible
+
+pytestmark = pytest.mark.anyio
+
+
+async def buscar_stream(api, fecha):
+    respuesta = await api.get("/buscar-stream", params={"origen": "medellin", "destino": "cartagena", "fecha": fecha})
+    assert respuesta.status_code == 200
+    lineas = [json.loads(linea) for linea in respuesta.text.splitlines()]
+    assert lineas[0]["tipo"] == "ruta" and lineas[-1]["tipo"] == "resumen"
+    return [linea for linea in lineas if linea["tipo"] == "bus"], lineas[-1]
+
+
+def clave_ruta(fecha):
+    return (main.indice_ciudades.resolver("medellin")["id"], main.indice_ciudades.resolver("cartagena")["id"],
+            main.convertir_fecha_a_redbus(fecha))
+
+
+async def test_stream_envia_todos_los_buses_y_guarda_la_cache(api, redbus, fecha):
+    buses, resumen = await buscar_stream(api, fecha)
+    assert len(buses) == resumen["total_buses"] == 150
+    assert resumen["exito"] is True and resumen["paginas_faltantes"] == []
+    _, resumen = await buscar_stream(api, fecha)
+    assert resumen["desde_cache"] is True
+    assert redbus.peticiones["search"] == 2
+
+
+async def test_redbus_caido_sin_cache_no_es_exito(api, fecha):
+    main.upstream.circuito.abierto_desde = time.monotonic()
+    buses, resumen = await buscar_stream(api, fecha)
+    assert buses == []
+    assert resumen["exito"] is False and resumen["paginas_faltantes"] == [1]
+    assert "RedBus no disponible" in resumen["error"]
+
+
+async def test_redbus_caido_usa_el_resultado_vencido(api, fecha):
+    await buscar_stream(api, fecha)
+    guardado_en, snapshot = main.cache_busquedas.entradas[clave_ruta(fecha)]
+    main.cache_busquedas.entradas[clave_ruta(fecha)] = (guardado_en - main.cache_busquedas.ttl - 1, snapshot)
+    main.upstream.circuito.abierto_desde = time.monotonic()
+    buses, resumen = await buscar_stream(api, fecha)
+    assert len(buses) == 150
+    assert resumen["exito"] is True and resumen["desde_cache"] is True
+
+
+async def test_busqueda_en_curso_que_falla_no_corta_el_stream(api, fecha):
+    async def fallar():
+        await asyncio.sleep(0.01)
+        raise RedBusNoDisponible("RedBus no disponible: prueba", 5)
+
+    tarea = asyncio.ensure_future(fallar())
+    main.cache_busquedas.en_vuelo[clave_ruta(fecha)] = tarea
+    buses, resumen = await buscar_stream(api, fecha)
+    assert buses == []
+    assert resumen["exito"] is False and resumen["reintentar_en"] == 5
@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+
+import main
+from webhooks import validar_url_webhook
+
+pytestmark = pytest.mark.anyio
+
+
+def nueva_alerta(empresa: str = "Rápido Ochoa") -> dict:
+    return {"id": 1, "tipo": "CRITICO", "nivel": "ALTO", "mensaje": f"Quedan pocos puestos: {empresa}",
+            "origen": "medellin", "destino": "cartagena", "empresa": empresa}
+
+
+async def esperar(condicion, segundos: float = 2):
+    fin = asyncio.get_running_loop().time() + segundos
+    while not condicion():
+        assert asyncio.get_running_loop().time() < fin, "no se cumplió a tiempo"
+        await asyncio.sleep(0.01)
+
+
+async def registrar(api, nombre: str, **filtros) -> str:
+    respuesta = await api.post("/webhooks", json={"url": f"http://redbus/webhook/{nombre}", **filtros})
+    return respuesta.json()["webhook"]["id"]
+
+
+async def test_alertas_llegan_agrupadas_y_filtradas(api, redbus):
+    await registrar(api, "ops")
+    await registrar(api, "ochoa", empresa="ochoa")
+    for empresa in ("Rápido Ochoa", "Brasilia", "Expreso Ochoa Sur", "Copetran"):
+        main.entrega_webhooks.publicar(nueva_alerta(empresa))
+
+    await esperar(lambda: "ops" in redbus.webhooks and "ochoa" in redbus.webhooks)
+    assert (redbus.webhooks["ops"]["lotes"], redbus.webhooks["ops"]["alertas"]) == (1, 4)
+    assert [alerta["empresa"] for alerta in redbus.webhooks["ochoa"]["ultimas"]] == ["Rápido Ochoa", "Expreso Ochoa Sur"]
+
+
+async def test_lote_se_reintenta_hasta_que_el_receptor_responde(api, redbus):
+    webhook_id = await registrar(api, "ops")
+    redbus.tasa_error = 1.0
+    main.entrega_webhooks.publicar(nueva_alerta())
+    await esperar(lambda: redbus.peticiones["errores"] >= 2)
+    redbus.tasa_error = 0.0
+
+    await esperar(lambda: "ops" in redbus.webhooks)
+    webhook = main.entrega_webhooks.webhooks[webhook_id]
+    assert webhook.entregadas == 1 and webhook.ultimo_error == "HTTP 503"
+    assert not main.entrega_webhooks.fallidos
+
+
+async def test_lote_sin_respuesta_queda_entre_los_fallidos_y_se_reenvia(api, redbus, config_webhooks):
+    webhook_id = await registrar(api, "ops")
+    redbus.tasa_error = 1.0
+    main.entrega_webhooks.publicar(nueva_alerta())
+    await esperar(lambda: main.entrega_webhooks.fallidos)
+    assert redbus.peticiones["webhooks"] == config_webhooks["reintentos"] + 1
+
+    fallidos = (await api.get("/webhooks/fallidos", params={"webhook_id": webhook_id})).json()
+    assert fallidos["total"] == 1
+    redbus.tasa_error = 0.0
+    respuesta = await api.post("/webhooks/fallidos/reenviar", params={"webhook_id": webhook_id})
+    assert respuesta.json()["reenviados"] == 1
+    await esperar(lambda: "ops" in redbus.webhooks)
+    assert not main.entrega_webhooks.fallidos
+
+
+async def test_error_que_no_se_reintenta_falla_al_primer_intento(api, redbus):
+    await api.post("/webhooks", json={"url": "http://redbus/no-existe"})
+    main.entrega_webhooks.publicar(nueva_alerta())
+    await esperar(lambda: main.entrega_webhooks.fallidos)
+    assert main.entrega_webhooks.fallidos[0]["intentos"] == 1
+    assert main.entrega_webhooks.fallidos[0]["error"] == "HTTP 404"
+
+
+async def test_detener_espera_los_lotes_con_reintento_programado(api, redbus):
+    await registrar(api, "ops")
+    redbus.tasa_error = 1.0
+    main.entrega_webhooks.publicar(nueva_alerta())
+    await esperar(lambda: main.entrega_webhooks.reintentos_programados)
+    redbus.tasa_error = 0.0
+    await main.entrega_webhooks.detener()
+    assert redbus.webhooks["ops"]["alertas"] == 1
+
+
+@pytest.mark.parametrize("url", [
+    "http://localhost:9000/webhook", "http://127.0.0.1/webhook", "http://10.0.0.5/webhook",
+    "http://192.168.1.20:8080/webhook", "http://169.254.169.254/latest/meta-data", "http://[::1]/webhook",
+    "ftp://93.184.216.34/webhook", "http:///webhook",
+])
+async def test_url_local_o_privada_se_rechaza(api, monkeypatch, url):
+    monkeypatch.setitem(main.entrega_webhooks.config, "permitir_redes_privadas", False)
+    respuesta = await api.post("/webhooks", json={"url": url})
+    assert respuesta.status_code == 400
+    assert not main.entrega_webhooks.webhooks
+
+
+async def test_url_publica_se_acepta():
+    await validar_url_webhook("https://93.184.216.34/webhook")
+    with pytest.raises(ValueError):
+        await validar_url_webhook("http://100.64.0.1/webhook")
@@ -0,0 +1,275 @@
+"""
+Cliente HTTP hacia RedBus: pool de conexiones, timeouts, reintentos y circuit breaker
+
+Todas las llamadas a RedBus (SolarSearch y SearchV4Results) pasan por
+ClienteRedBus. Si RedBus falla seguido, el circuito se abre y las llamadas
+fallan al instante con CircuitoAbierto (quien llama puede responder desde la
+cache) hasta que pasa `segundos_abierto` y se deja pasar una petición de prueba.
+
+Cada intento además gasta un token de LimitadorTokens, compartido por todo el
+proceso. Si no hay tokens la petición espera en la cola de su prioridad
+(`prioridad_redbus`): primero las de usuarios, luego el monitoreo y al final
+la precarga. Con la cola llena falla al instante con LimiteSaturado.
+"""
+
+import asyncio
+import contextvars
+import importlib.util
+import logging
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+
+import httpx
+
+from metricas import registro as registro_metricas
+from reintentos import espera_backoff, espera_retry_after
+
+log = logging.getLogger("buscador.upstream")
+
+HTTP2_DISPONIBLE = importlib.util.find_spec("h2") is not None
+CODIGOS_REINTENTABLES = {429, 500, 502, 503, 504}
+PRIORIDADES = ("interactivo", "monitor", "prefetch")
+
+# Quién origina las llamadas a RedBus en la tarea actual; las tareas hijas lo heredan
+prioridad_redbus: contextvars.ContextVar = contextvars.ContextVar("prioridad_redbus", default="interactivo")
+
+metrica_reintentos = registro_metricas.contador(
+    "redbus_reintentos_total", "Reintentos de peticiones a RedBus", ("endpoint", "motivo"))
+metrica_circuito_rechazos = registro_metricas.contador(
+    "redbus_circuito_rechazos_total", "Peticiones a RedBus no enviadas por circuito abierto")
+metrica_limitador_espera = registro_metricas.histograma(
+    "redbus_limitador_espera_segundos", "Espera por un token antes de llamar a RedBus", ("prioridad",))
+metrica_limitador_rechazos = registro_metricas.contador(
+    "redbus_limitador_rechazos_total", "Peticiones rechazadas por cola del limitador llena", ("prioridad",))
+
+
+class RedBusNoDisponible(Exception):
+    """No se llamó a RedBus; `reintentar_en` son los segundos sugeridos antes de volver a intentar"""
+
+    def __init__(self, mensaje: str, reintentar_en: float):
+        super().__init__(mensaje)
+        self.reintentar_en = reintentar_en
+
+
+class CircuitoAbierto(RedBusNoDisponible):
+    def __init__(self, reintentar_en: float):
+        super().__init__(f"RedBus no disponible, reintentar en {reintentar_en:.0f} s", reintentar_en)
+
+
+class LimiteSaturado(RedBusNoDisponible):
+    def __init__(self, prioridad: str, reintentar_en: float):
+        super().__init__(f"Cola de peticiones a RedBus llena ({prioridad})", reintentar_en)
+        self.prioridad = prioridad
+
+
+class LimitadorTokens:
+    """Token bucket: `tasa` peticiones por segundo con ráfagas de hasta `rafaga`.
+
+    Sin tokens, cada petición espera en la cola de su prioridad y una sola
+    tarea despachadora reparte los tokens a medida que se recargan, siempre
+    a la cola de mayor prioridad primero. `tasa` 0 desactiva el límite.
+    """
+
+    def __init__(self, tasa: float, rafaga: int, max_en_cola: Dict[str, int]):
+        self.tasa = tasa
+        self.rafaga = rafaga
+        self.max_en_cola = max_en_cola
+        self.tokens = float(rafaga)
+        self.actualizado = time.monotonic()
+        self.colas: Dict[str, Deque[asyncio.Future]] = {prioridad: deque() for prioridad in PRIORIDADES}
+        self.despachador: Optional[asyncio.Task] = None
+
+    def en_cola(self, prioridad: Optional[str] = None) -> int:
+        if prioridad:
+            return len(self.colas[prioridad])
+        return sum(len(cola) for cola in self.colas.values())
+
+    def disponibles(self) -> float:
+        self._recargar()
+        return self.tokens
+
+    def _recargar(self):
+        ahora = time.monotonic()
+        self.tokens = min(self.rafaga, self.tokens + (ahora - self.actualizado) * self.tasa)
+        self.actualizado = ahora
+
+    def _estimar_espera(self, prioridad: str) -> float:
+        delante = sum(len(self.colas[p]) for p in PRIORIDADES[:PRIORIDADES.index(prioridad) + 1])
+        return max(0.0, delante + 1 - self.tokens) / self.tasa
+
+    async def adquirir(self, prioridad: str) -> float:
+        """Espera un token; devuelve los segundos que esperó"""
+        if self.tasa <= 0:
+            return 0.0
+        self._recargar()
+        if self.tokens >= 1 and not self.en_cola():
+            self.tokens -= 1
+            return 0.0
+
+        cola = self.colas[prioridad]
+        if len(cola) >= self.max_en_cola[prioridad]:
+            raise LimiteSaturado(prioridad, self._estimar_espera(prioridad))
+        futuro = asyncio.get_running_loop().create_future()
+        cola.append(futuro)
+        if self.despachador is None or self.despachador.done():
+            self.despachador = asyncio.ensure_future(self._despachar())
+
+        inicio = time.monotonic()
+        try:
+            await futuro
+        except asyncio.CancelledError:
+            if futuro in cola:
+                cola.remove(futuro)
+            elif futuro.done() and not futuro.cancelled():
+                # El despachador ya le había dado el token: vuelve al balde para el siguiente
+                self._recargar()
+                self.tokens = min(self.rafaga, self.tokens + 1)
+            raise
+        return time.monotonic() - inicio
+
+    async def _despachar(self):
+        while self.en_cola():
+            self._recargar()
+            while self.tokens >= 1:
+                futuro = self._siguiente()
+                if futuro is None:
+                    break
+                self.tokens -= 1
+                futuro.set_result(None)
+            if not self.en_cola():
+                return
+            await asyncio.sleep((1 - self.tokens) / self.tasa)
+
+    def _siguiente(self) -> Optional[asyncio.Future]:
+        for prioridad in PRIORIDADES:
+            cola = self.colas[prioridad]
+            while cola:
+                futuro = cola.popleft()
+                if not futuro.done():
+                    return futuro
+        return None
+
+
+class CircuitBreaker:
+    """cerrado -> (umbral_fallos seguidos) -> abierto -> (segundos_abierto) -> semiabierto -> una prueba"""
+
+    def __init__(self, umbral_fallos: int, segundos_abierto: float):
+        self.umbral_fallos = umbral_fallos
+        self.segundos_abierto = segundos_abierto
+        self.fallos_seguidos = 0
+        self.abierto_desde: Optional[float] = None
+        self.prueba_en_curso = False
+
+    @property
+    def estado(self) -> str:
+        if self.abierto_desde is None:
+            return "cerrado"
+        if time.monotonic() - self.abierto_desde < self.segundos_abierto:
+            return "abierto"
+        return "semiabierto"
+
+    def segundos_para_prueba(self) -> float:
+        if self.abierto_desde is None:
+            return 0.0
+        return max(0.0, self.segundos_abierto - (time.monotonic() - self.abierto_desde))
+
+    def permitir(self) -> bool:
+        estado = self.estado
+        if estado == "cerrado":
+            return True
+        if estado == "semiabierto" and not self.prueba_en_curso:
+            self.prueba_en_curso = True
+            return True
+        return False
+
+    def registrar_exito(self):
+        self.fallos_seguidos = 0
+        self.abierto_desde = None
+        self.prueba_en_curso = False
+
+    def registrar_fallo(self):
+        self.fallos_seguidos += 1
+        if self.prueba_en_curso or self.fallos_seguidos >= self.umbral_fallos:
+            if self.abierto_desde is None or self.prueba_en_curso:
+                log.warning("Circuito hacia RedBus abierto tras %d fallos seguidos", self.fallos_seguidos)
+            self.abierto_desde = time.monotonic()
+        self.prueba_en_curso = False
+
+
+class ClienteRedBus:
+    def __init__(self, config: Dict, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.config = config
+        self.circuito = CircuitBreaker(config["umbral_fallos"], config["segundos_abierto"])
+        self.limitador = LimitadorTokens(config["peticiones_por_segundo"], config["rafaga"], config["max_en_cola"])
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=config["max_conexiones"],
+                max_keepalive_connections=config["max_keepalive"],
+                keepalive_expiry=config["keepalive_segundos"],
+            ),
+            timeout=httpx.Timeout(
+                connect=config["timeout_conexion"],
+                read=config["timeout_lectura"],
+                write=config["timeout_lectura"],
+                pool=config["timeout_pool"],
+            ),
+            http2=config["http2"] and HTTP2_DISPONIBLE,
+            transport=transport,
+        )
+
+    async def get(self, url: str, endpoint: str, **kwargs) -> httpx.Response:
+        return await self.pedir("GET", url, endpoint, **kwargs)
+
+    async def post(self, url: str, endpoint: str, **kwargs) -> httpx.Response:
+        return await self.pedir("POST", url, endpoint, **kwargs)
+
+    async def pedir(self, metodo: str, url: str, endpoint: str, **kwargs) -> httpx.Response:
+        """Envía la petición con reintentos; solo se usa para consultas que se pueden repetir sin efectos.
+
+        Devuelve la última respuesta aunque su código no sea 200; lanza
+        CircuitoAbierto o LimiteSaturado sin enviar nada, o el error de red
+        del último intento.
+        """
+        if not self.circuito.permitir():
+            metrica_circuito_rechazos.inc()
+            raise CircuitoAbierto(self.circuito.segundos_para_prueba())
+
+        try:
+            return await self._pedir_con_reintentos(metodo, url, endpoint, **kwargs)
+        except (asyncio.CancelledError, LimiteSaturado):
+            # Una prueba que no llegó a RedBus (cliente desconectado, cola llena) no debe dejar el circuito trabado
+            self.circuito.prueba_en_curso = False
+            raise
+
+    async def _pedir_con_reintentos(self, metodo: str, url: str, endpoint: str, **kwargs) -> httpx.Response:
+        reintentos = self.config["reintentos"]
+        prioridad = prioridad_redbus.get()
+        for intento in range(reintentos + 1):
+            try:
+                espera = await self.limitador.adquirir(prioridad)
+            except LimiteSaturado:
+                metrica_limitador_rechazos.inc(prioridad)
+                raise
+            metrica_limitador_espera.observar(espera, prioridad)
+            try:
+                response = await self.client.request(metodo, url, **kwargs)
+            except httpx.TransportError as e:
+                if intento == reintentos:
+                    self.circuito.registrar_fallo()
+                    raise
+                motivo, espera_minima = type(e).__name__, 0.0
+            else:
+                if response.status_code not in CODIGOS_REINTENTABLES:
+                    self.circuito.registrar_exito()
+                    return response
+                if intento == reintentos:
+                    self.circuito.registrar_fallo()
+                    return response
+                motivo, espera_minima = str(response.status_code), espera_retry_after(response, self.config)
+
+            metrica_reintentos.inc(endpoint, motivo)
+            await asyncio.sleep(max(espera_minima, espera_backoff(intento, self.config)))
+
+    async def cerrar(self):
+        await self.client.aclose()
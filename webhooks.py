@@ -0,0 +1,314 @@
+"""
+Envío de alertas a webhooks (bots de chat, back-office de reservas)
+
+publicar() solo deja la alerta en una cola acotada y vuelve, así el ciclo de
+monitoreo nunca espera a un receptor. Una tarea agrupa las alertas por
+webhook durante `ventana_segundos` (o hasta juntar `max_lote`) y un grupo fijo
+de trabajadores envía cada lote por POST. Un lote que falla se reintenta con
+espera exponencial sin ocupar a un trabajador mientras espera; agotados los
+reintentos queda entre los fallidos, desde donde se puede reenviar.
+"""
+
+import asyncio
+import hashlib
+import hmac
+import ipaddress
+import logging
+import socket
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, List, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from alertas import cumple_filtros, normalizar_filtros
+from metricas import registro as registro_metricas
+from reintentos import espera_backoff, espera_retry_after
+from respuestas import serializar_json
+
+log = logging.getLogger("buscador.webhooks")
+
+metrica_lotes = registro_metricas.contador(
+    "webhook_lotes_total", "Lotes enviados a webhooks por resultado (ok, reintento, fallido)", ("webhook", "resultado"))
+metrica_alertas = registro_metricas.contador(
+    "webhook_alertas_entregadas_total", "Alertas entregadas a cada webhook", ("webhook",))
+metrica_envio = registro_metricas.histograma(
+    "webhook_envio_segundos", "Duración de cada POST a un webhook", ("webhook",))
+metrica_descartadas = registro_metricas.contador(
+    "webhook_alertas_descartadas_total", "Alertas que no entraron a la cola de webhooks por estar llena")
+
+
+async def validar_url_webhook(url: str, permitir_redes_privadas: bool = False):
+    """ValueError si `url` no es http(s) o si alguna dirección de su host no es pública.
+
+    POST /webhooks es público: sin esto cualquiera podría hacer que el servidor
+    envíe peticiones a localhost, a la red interna o a la metadata del proveedor.
+    """
+    partes = urlsplit(url)
+    if partes.scheme not in ("http", "https") or not partes.hostname:
+        raise ValueError("url debe empezar con http:// o https:// e incluir el host")
+    if permitir_redes_privadas:
+        return
+    try:
+        direcciones = [ipaddress.ip_address(partes.hostname)]
+    except ValueError:
+        try:
+            infos = await asyncio.get_running_loop().getaddrinfo(partes.hostname, None, type=socket.SOCK_STREAM)
+        except socket.gaierror:
+            raise ValueError(f"No se pudo resolver el host {partes.hostname}")
+        direcciones = [ipaddress.ip_address(info[4][0]) for info in infos]
+    for direccion in direcciones:
+        if not direccion.is_global:
+            raise ValueError(f"url apunta a una dirección no pública ({direccion})")
+
+
+class Webhook:
+    """URL que recibe las alertas que cumplen `filtros` (mismos campos que /alertas/stream)"""
+
+    def __init__(self, url: str, filtros: Optional[Dict[str, str]] = None, secreto: Optional[str] = None,
+                 webhook_id: Optional[str] = None):
+        self.id = webhook_id or uuid.uuid4().hex[:12]
+        self.url = url
+        self.filtros = {campo: valor for campo, valor in (filtros or {}).items() if valor is not None}
+        self.filtros_normalizados = normalizar_filtros(self.filtros)
+        self.secreto = secreto
+        self.lote: List[Dict] = []
+        self.lote_desde = 0.0
+        self.entregadas = 0
+        self.fallidas = 0
+        self.ultima_entrega: Optional[str] = None
+        self.ultimo_error: Optional[str] = None
+
+    def acepta(self, alerta: Dict) -> bool:
+        return cumple_filtros(self.filtros_normalizados, alerta)
+
+    def firmar(self, cuerpo: bytes) -> str:
+        return "sha256=" + hmac.new(self.secreto.encode(), cuerpo, hashlib.sha256).hexdigest()
+
+    def como_dict(self) -> Dict:
+        return {
+            "id": self.id,
+            "url": self.url,
+            "filtros": self.filtros,
+            "firmado": self.secreto is not None,
+            "en_lote": len(self.lote),
+            "alertas_entregadas": self.entregadas,
+            "alertas_fallidas": self.fallidas,
+            "ultima_entrega": self.ultima_entrega,
+            "ultimo_error": self.ultimo_error
+        }
+
+    def datos_guardables(self) -> Dict:
+        return {"id": self.id, "url": self.url, "filtros": self.filtros, "secreto": self.secreto}
+
+
+class LoteWebhook:
+    def __init__(self, webhook: Webhook, alertas: List[Dict]):
+        self.webhook = webhook
+        self.alertas = alertas
+        self.intentos = 0
+
+
+class EntregaWebhooks:
+    def __init__(self, config: Dict, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.config = config
+        self.webhooks: Dict[str, Webhook] = {}
+        self.cola: asyncio.Queue = asyncio.Queue(config["tamano_cola"])
+        self.envios: asyncio.Queue = asyncio.Queue()
+        self.fallidos: Deque[Dict] = deque(maxlen=config["max_fallidos"])
+        self.reintentos_programados = 0
+        self.descartadas = 0
+        self.tareas: List[asyncio.Task] = []
+        self.client = httpx.AsyncClient(timeout=config["timeout_segundos"], transport=transport)
+
+    def __len__(self):
+        return len(self.webhooks)
+
+    def registrar(self, webhook: Webhook) -> Webhook:
+        self.webhooks[webhook.id] = webhook
+        return webhook
+
+    def quitar(self, webhook_id: str) -> Optional[Webhook]:
+        """Los lotes en curso o esperando reintento de un webhook quitado no se envían"""
+        return self.webhooks.pop(webhook_id, None)
+
+    def publicar(self, alerta: Dict):
+        """Encola sin esperar; con la cola llena la alerta no va a los webhooks (sigue en /alertas)"""
+        if not self.webhooks:
+            return
+        try:
+            self.cola.put_nowait(alerta)
+        except asyncio.QueueFull:
+            self.descartadas += 1
+            metrica_descartadas.inc()
+
+    def iniciar(self):
+        if self.tareas:
+            return
+        self.tareas.append(asyncio.create_task(self._agrupar()))
+        for _ in range(self.config["trabajadores"]):
+            self.tareas.append(asyncio.create_task(self._trabajar()))
+
+    async def detener(self):
+        """Envía lo que ya está agrupado (hasta `espera_al_detener` segundos) y cierra"""
+        self._vaciar_cola()
+        for webhook in self.webhooks.values():
+            if webhook.lote:
+                self._cerrar_lote(webhook)
+        if self.tareas:
+            try:
+                await asyncio.wait_for(self._esperar_envios(), self.config["espera_al_detener"])
+            except asyncio.TimeoutError:
+                log.warning("Se apaga con %d lotes de webhooks sin enviar",
+                            self.envios.qsize() + self.reintentos_programados)
+        for tarea in self.tareas:
+            tarea.cancel()
+        self.tareas = []
+        await self.client.aclose()
+
+    async def _esperar_envios(self):
+        while True:
+            await self.envios.join()
+            if not self.reintentos_programados:
+                return
+            await asyncio.sleep(0.05)
+
+    def estadisticas(self) -> Dict:
+        return {
+            "webhooks": len(self.webhooks),
+            "alertas_en_cola": self.cola.qsize(),
+            "lotes_por_enviar": self.envios.qsize(),
+            "reintentos_programados": self.reintentos_programados,
+            "lotes_fallidos": len(self.fallidos),
+            "alertas_descartadas": self.descartadas
+        }
+
+    def reenviar_fallidos(self, webhook_id: Optional[str] = None) -> int:
+        """Vuelve a encolar los lotes fallidos (de un webhook o de todos) que siguen registrados"""
+        quedan: Deque[Dict] = deque(maxlen=self.fallidos.maxlen)
+        reenviados = 0
+        for fallido in self.fallidos:
+            webhook = self.webhooks.get(fallido["webhook_id"])
+            if webhook is None or (webhook_id is not None and webhook.id != webhook_id):
+                quedan.append(fallido)
+                continue
+            self.envios.put_nowait(LoteWebhook(webhook, fallido["alertas"]))
+            reenviados += 1
+        self.fallidos = quedan
+        return reenviados
+
+    def _agregar(self, alerta: Dict):
+        for webhook in self.webhooks.values():
+            if not webhook.acepta(alerta):
+                continue
+            if not webhook.lote:
+                webhook.lote_desde = time.monotonic()
+            webhook.lote.append(alerta)
+            if len(webhook.lote) >= self.config["max_lote"]:
+                self._cerrar_lote(webhook)
+
+    def _vaciar_cola(self):
+        while True:
+            try:
+                self._agregar(self.cola.get_nowait())
+            except asyncio.QueueEmpty:
+                return
+
+    def _cerrar_lote(self, webhook: Webhook):
+        self.envios.put_nowait(LoteWebhook(webhook, webhook.lote))
+        webhook.lote = []
+
+    def _proximo_cierre(self) -> Optional[float]:
+        inicios = [webhook.lote_desde for webhook in self.webhooks.values() if webhook.lote]
+        return min(inicios) + self.config["ventana_segundos"] if inicios else None
+
+    async def _agrupar(self):
+        while True:
+            cierre = self._proximo_cierre()
+            try:
+                if cierre is None:
+                    alerta = await self.cola.get()
+                else:
+                    alerta = await asyncio.wait_for(self.cola.get(), max(0.0, cierre - time.monotonic()))
+                self._agregar(alerta)
+                self._vaciar_cola()
+            except asyncio.TimeoutError:
+                pass
+            ahora = time.monotonic()
+            for webhook in list(self.webhooks.values()):
+                if webhook.lote and ahora - webhook.lote_desde >= self.config["ventana_segundos"]:
+                    self._cerrar_lote(webhook)
+
+    async def _trabajar(self):
+        while True:
+            lote = await self.envios.get()
+            try:
+                await self._entregar(lote)
+            except Exception:
+                log.exception("Error inesperado enviando a webhook %s", lote.webhook.id)
+            finally:
+                self.envios.task_done()
+
+    async def _entregar(self, lote: LoteWebhook):
+        webhook = lote.webhook
+        if self.webhooks.get(webhook.id) is not webhook:
+            return
+        lote.intentos += 1
+        cuerpo = serializar_json({
+            "webhook_id": webhook.id,
+            "enviado_en": datetime.now().isoformat(timespec="seconds"),
+            "cantidad": len(lote.alertas),
+            "alertas": lote.alertas,
+            # Campo que muestran directamente los webhooks de Slack y similares
+            "text": "\n".join(alerta["mensaje"] for alerta in lote.alertas)
+        })
+        headers = {"content-type": "application/json", "x-webhook-id": webhook.id}
+        if webhook.secreto:
+            headers["x-firma"] = webhook.firmar(cuerpo)
+
+        inicio = time.perf_counter()
+        espera_minima = 0.0
+        try:
+            response = await self.client.post(webhook.url, content=cuerpo, headers=headers)
+        except httpx.HTTPError as e:
+            error, reintentable = f"{type(e).__name__}: {e}", True
+        else:
+            if 200 <= response.status_code < 300:
+                metrica_envio.observar(time.perf_counter() - inicio, webhook.id)
+                metrica_lotes.inc(webhook.id, "ok")
+                metrica_alertas.inc(webhook.id, valor=len(lote.alertas))
+                webhook.entregadas += len(lote.alertas)
+                webhook.ultima_entrega = datetime.now().isoformat(timespec="seconds")
+                return
+            error = f"HTTP {response.status_code}"
+            reintentable = response.status_code in (408, 429) or response.status_code >= 500
+            espera_minima = espera_retry_after(response, self.config)
+        metrica_envio.observar(time.perf_counter() - inicio, webhook.id)
+        webhook.ultimo_error = error
+
+        if reintentable and lote.intentos <= self.config["reintentos"]:
+            metrica_lotes.inc(webhook.id, "reintento")
+            espera = max(espera_minima, espera_backoff(lote.intentos - 1, self.config))
+            self.reintentos_programados += 1
+            asyncio.get_running_loop().call_later(espera, self._reencolar, lote)
+            return
+
+        metrica_lotes.inc(webhook.id, "fallido")
+        webhook.fallidas += len(lote.alertas)
+        self.fallidos.append({
+            "webhook_id": webhook.id,
+            "url": webhook.url,
+            "intentos": lote.intentos,
+            "error": error,
+            "fallido_en": datetime.now().isoformat(timespec="seconds"),
+            "alertas": lote.alertas
+        })
+        log.warning("Lote de %d alertas a webhook %s descartado tras %d intentos: %s",
+                    len(lote.alertas), webhook.id, lote.intentos, error)
+
+    def _reencolar(self, lote: LoteWebhook):
+        self.reintentos_programados -= 1
+        self.envios.put_nowait(lote)